@@ -0,0 +1,146 @@
+"""Summarizes the structured query log written by query_log.py.
+
+Usage:
+    python analyze_query_log.py [logs/query_log.jsonl] [--top 20]
+
+Reports the most frequent normalized queries, how many requests a query or
+retrieval cache could have served, and latency percentiles per pipeline stage.
+"""
+import argparse
+import glob
+import json
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from query_log import DEFAULT_LOG_PATH
+
+STAGES = ["encode", "search", "first_token", "generate", "total"]
+
+
+def read_records(paths):
+    """Yields records from the given log files, oldest rotated backup first."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def default_paths(base_path):
+    """Returns the live log plus its rotated backups, oldest first."""
+    backups = [p for p in glob.glob(f"{base_path}.*") if p.rsplit(".", 1)[1].isdigit()]
+    backups.sort(key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    return backups + glob.glob(base_path)
+
+
+def analyze(records, top=20):
+    query_counts = Counter()
+    cache_tiers = Counter()
+    sources = Counter()
+    stage_latencies = defaultdict(list)
+    answer_lengths = []
+    seen_queries = set()
+    seen_retrievals = set()
+    repeat_queries = 0
+    repeat_retrievals = 0
+    errors = 0
+    gate_rejects = 0
+    llm_refusals = 0
+
+    for record in records:
+        query = record.get("query", "")
+        query_counts[query] += 1
+        cache_tiers[record.get("cache", "none")] += 1
+        sources[record.get("source", "unknown")] += 1
+        if record.get("error"):
+            errors += 1
+        if "out_of_scope" in record:
+            gate_rejects += 1
+        elif record.get("refused"):
+            llm_refusals += 1
+
+        # A repeat of an earlier query could have been served from an answer cache,
+        # a repeat of an earlier chunk set from a retrieval/context cache.
+        if query in seen_queries:
+            repeat_queries += 1
+        seen_queries.add(query)
+        retrieval_key = tuple(sorted(record.get("chunk_ids", [])))
+        if retrieval_key:
+            if retrieval_key in seen_retrievals:
+                repeat_retrievals += 1
+            seen_retrievals.add(retrieval_key)
+
+        for stage, value in record.get("latency_ms", {}).items():
+            stage_latencies[stage].append(value)
+        answer_lengths.append(record.get("answer_chars", 0))
+
+    total = sum(query_counts.values())
+    return {
+        "requests": total,
+        "errors": errors,
+        "unique_queries": len(query_counts),
+        "sources": dict(sources),
+        "top_queries": query_counts.most_common(top),
+        "cache_tiers": dict(cache_tiers),
+        # Off-topic queries refused by the scope gate vs. ones that still cost a Gemini call
+        "scope_gate_rejects": gate_rejects,
+        "llm_refusals": llm_refusals,
+        "query_cache_hit_potential": repeat_queries / total if total else 0.0,
+        "retrieval_cache_hit_potential": repeat_retrievals / total if total else 0.0,
+        "stage_latency_ms": {
+            stage: {
+                "count": len(values),
+                "p50": float(np.percentile(values, 50)),
+                "p90": float(np.percentile(values, 90)),
+                "p99": float(np.percentile(values, 99)),
+                "max": float(np.max(values)),
+            }
+            for stage, values in stage_latencies.items() if values
+        },
+        "answer_chars_mean": float(np.mean(answer_lengths)) if answer_lengths else 0.0,
+    }
+
+
+def print_report(report):
+    print(f"Requests: {report['requests']}  (unique queries: {report['unique_queries']}, errors: {report['errors']})")
+    print(f"Sources: {report['sources']}")
+    print(f"Cache tiers: {report['cache_tiers']}")
+    print(f"Out of scope: {report['scope_gate_rejects']} refused by the gate, {report['llm_refusals']} refused by Gemini")
+    print(f"Query cache hit potential:     {report['query_cache_hit_potential']:.1%}")
+    print(f"Retrieval cache hit potential: {report['retrieval_cache_hit_potential']:.1%}")
+    print(f"Mean answer length: {report['answer_chars_mean']:.0f} chars")
+
+    print("\nTop queries:")
+    for query, count in report["top_queries"]:
+        print(f"  {count:6d}  {query}")
+
+    print("\nStage latency (ms):")
+    print(f"  {'stage':<12} {'count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    ordered = sorted(report["stage_latency_ms"], key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+    for stage in ordered:
+        stats = report["stage_latency_ms"][stage]
+        print(f"  {stage:<12} {stats['count']:>7} {stats['p50']:>9.1f} {stats['p90']:>9.1f} {stats['p99']:>9.1f} {stats['max']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the structured query log.")
+    parser.add_argument("paths", nargs="*", help="Log files (default: the live log and its rotated backups)")
+    parser.add_argument("--top", type=int, default=20, help="Number of top queries to show")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    paths = args.paths or default_paths(DEFAULT_LOG_PATH)
+    if not paths:
+        parser.error(f"No log files found at '{DEFAULT_LOG_PATH}'")
+
+    report = analyze(read_records(paths), top=args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
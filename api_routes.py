@@ -0,0 +1,348 @@
+"""HTTP and WebSocket endpoints shared by app_hf.py and backend_api.py.
+
+Both servers create a ChatServer (the engine plus the stream, rate-limit and
+session registries), store it as app.state.chat_server and include `router`.
+They differ only in the source name written to the query log, and in whether
+SSE answers are paced out in short pieces (app_hf.py) or sent as Gemini
+produces them.
+"""
+import asyncio
+import json
+import math
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from chat_session import SessionRegistry
+from chunk_metadata import FilterError
+from ingestion import check_chunk_sizes, download_pdf
+from prefetch import PrefetchRejected
+from rate_limit import ChatLimits, RateLimited, client_identity, run_in_turn
+from source_fetcher import FetchError
+from stream_replay import ReplayExpired, StreamRegistry, parse_last_event_id, sse_events
+
+PDF_PATH = os.getenv("SRB_PDF_PATH", "SRB-2025.pdf")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+class ChatServer:
+    """Everything the endpoints share within one server process."""
+
+    def __init__(self, engine, source, paced=False, streams=None, limits=None, sessions=None):
+        self.engine = engine
+        self.bundles = engine.bundles
+        self.source = source  # query-log source prefix, e.g. "app_hf"
+        self.paced = paced
+        self.streams = streams if streams is not None else StreamRegistry()
+        # Token bucket per client plus round-robin scheduling of queued chats
+        self.limits = limits if limits is not None else ChatLimits()
+        # One session per WebSocket connection, remembering recent turns
+        self.sessions = sessions if sessions is not None else SessionRegistry()
+        self.assets_loaded = False
+
+    def health(self):
+        return {
+            "status": "healthy" if self.assets_loaded else "unhealthy",
+            "models_loaded": self.assets_loaded,
+            "index_version": self.bundles.current.version if self.bundles.current else None,
+            "streams": self.streams.metrics(),
+            "limits": self.limits.metrics(),
+            "sessions": self.sessions.metrics()
+        }
+
+
+def chat_server(connection) -> ChatServer:
+    return connection.app.state.chat_server
+
+
+router = APIRouter()
+
+# Request/Response models
+class ChatRequest(BaseModel):
+    message: str
+    # Optional chunk filter, e.g. "section:examination" or "page:40-62"
+    filter: Optional[str] = None
+
+class ChatResponse(BaseModel):
+    response: str
+    status: str = "success"
+
+class PrefetchRequest(BaseModel):
+    # Draft question as currently typed
+    message: str
+    filter: Optional[str] = None
+
+class ReindexRequest(BaseModel):
+    max_tokens: int = 256
+    min_tokens: int = 64
+    overlap_tokens: int = 32
+    respect_pages: bool = False
+    reduce_dim: Optional[int] = None
+    reduction: str = "pca"
+    dedupe: bool = True
+    dedupe_threshold: float = 0.85
+
+def require_assets(server: ChatServer, detail="Models not loaded."):
+    if not server.assets_loaded:
+        raise HTTPException(status_code=503, detail=detail)
+
+@router.get("/health")
+async def health_check(http_request: Request):
+    return chat_server(http_request).health()
+
+def check_admin_token(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@router.post("/admin/reindex", status_code=202)
+async def reindex_endpoint(http_request: Request, request: ReindexRequest = ReindexRequest(),
+                           x_admin_token: Optional[str] = Header(None)):
+    """Rebuilds the index bundle in the background and hot-swaps it in when valid"""
+    check_admin_token(x_admin_token)
+    server = chat_server(http_request)
+    require_assets(server)
+    try:
+        check_chunk_sizes(request.max_tokens, request.min_tokens, request.overlap_tokens)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(PDF_PATH):
+        try:
+            await asyncio.to_thread(download_pdf, PDF_PATH)
+        except FetchError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+    if not server.bundles.start_reindex(PDF_PATH, server.engine.embedding_model, **request.dict()):
+        raise HTTPException(status_code=409, detail="A reindex job is already running")
+    return server.bundles.job
+
+@router.get("/admin/reindex")
+async def reindex_status_endpoint(http_request: Request, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    bundles = chat_server(http_request).bundles
+    return {**bundles.job, "index_version": bundles.current.version if bundles.current else None}
+
+def too_many_requests(e):
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def admit_chat(server: ChatServer, request: Request):
+    """A place in the chat scheduler for this client, or 429 if it is over its rate or the queue is full"""
+    try:
+        return server.limits.admit(client_identity(request))
+    except RateLimited as e:
+        raise too_many_requests(e)
+
+@router.post("/prefetch", status_code=202)
+async def prefetch_endpoint(request: PrefetchRequest, http_request: Request, x_client_id: Optional[str] = Header(None)):
+    """Warms encode + search for a draft question so /chat/stream can start generating immediately"""
+    server = chat_server(http_request)
+    require_assets(server)
+    if not request.message.strip():
+        return {"status": "ignored"}
+    try:
+        # Limits apply per address; the tab id only picks which older draft this one replaces
+        status = server.engine.prefetch(request.message, client_identity(http_request), top_k=5,
+                                        filter_text=request.filter, tab_id=x_client_id)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PrefetchRejected as e:
+        raise too_many_requests(e)
+    return {"status": status}
+
+@router.delete("/prefetch")
+async def cancel_prefetch_endpoint(http_request: Request, x_client_id: Optional[str] = Header(None)):
+    """Drops this client's pending prefetch (e.g. the draft was cleared)"""
+    engine = chat_server(http_request).engine
+    return {"cancelled": engine.retrieval_cache.cancel(client_identity(http_request), x_client_id)}
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    server = chat_server(http_request)
+    require_assets(server, "Models not loaded. Please check if preprocessed files exist.")
+
+    turn = admit_chat(server, http_request)
+    try:
+        async with turn:
+            response = await server.engine.aanswer(request.message, top_k=5, filter_text=request.filter,
+                                                   source=f"{server.source}:/chat")
+        return ChatResponse(response=response, status="success")
+
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing your question: {str(e)}")
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    server = chat_server(http_request)
+    require_assets(server, "Models not loaded. Please check if preprocessed files exist.")
+
+    try:
+        stream = server.engine.astream(request.message, top_k=5, filter_text=request.filter,
+                                       source=f"{server.source}:/chat/stream")
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    turn = admit_chat(server, http_request)
+
+    # Generation runs in its own task and fills a replay buffer, so a dropped
+    # client can resume with Last-Event-ID instead of asking again. The turn
+    # covers generation only; pacing the output doesn't hold a chat slot
+    events = paced_events if server.paced else chat_events
+    buffer = server.streams.start(events(run_in_turn(turn, stream)))
+    return sse_response(buffer)
+
+@router.get("/chat/stream/{stream_id}")
+async def chat_stream_resume_endpoint(stream_id: str, http_request: Request,
+                                      last_event_id: Optional[str] = Header(None), after: Optional[str] = None):
+    """Resumes a stream after the given event id (Last-Event-ID header or ?after=), live if still generating"""
+    try:
+        buffer = chat_server(http_request).streams.get(stream_id)
+    except ReplayExpired as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    after_id = parse_last_event_id(last_event_id if last_event_id is not None else after)
+    if after_id + 1 < buffer.first_id:
+        raise HTTPException(status_code=410, detail="Those events are no longer buffered; ask again")
+    return sse_response(buffer, after_id)
+
+@router.websocket("/ws/chat")
+async def chat_ws_endpoint(websocket: WebSocket):
+    """Chat over one connection; the session remembers recent turns so follow-ups reuse their retrieval"""
+    server = chat_server(websocket)
+    sessions = server.sessions
+    await websocket.accept()
+    client_id = client_identity(websocket)
+    session = sessions.open(client_id) if server.assets_loaded else None
+    if session is None:
+        await websocket.close(code=1013, reason="Too many connections" if server.assets_loaded else "Models not loaded")
+        return
+
+    idle = False
+    try:
+        await websocket.send_json({"type": "session", "session_id": session.session_id})
+        while True:
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(), sessions.idle_timeout)
+            except asyncio.TimeoutError:
+                idle = True
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            try:
+                message = json.loads(text)
+            except json.JSONDecodeError:
+                await websocket.send_json({"error": "Messages must be JSON", "done": True})
+                continue
+            if message.get("type") == "reset":
+                session.reset()
+                await websocket.send_json({"type": "reset"})
+                continue
+            await answer_over_websocket(server, websocket, session, client_id, message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sessions.close(session, idle=idle)
+
+async def answer_over_websocket(server: ChatServer, websocket: WebSocket, session, client_id, message):
+    """Streams one answer as {chunk, done} messages, like the SSE payloads"""
+    query = str(message.get("message", "")).strip()
+    if not query:
+        await websocket.send_json({"error": "Empty message", "done": True})
+        return
+    try:
+        stream = server.engine.astream(query, top_k=5, filter_text=message.get("filter"),
+                                       source=f"{server.source}:/ws/chat", session=session)
+        turn = server.limits.admit(client_id)
+    except FilterError as e:
+        await websocket.send_json({"error": str(e), "done": True})
+        return
+    except RateLimited as e:
+        await websocket.send_json({"error": str(e), "retry_after": math.ceil(e.retry_after), "done": True})
+        return
+
+    try:
+        # Generation runs ahead in the turn, so a slow client doesn't keep the chat slot
+        async for chunk in drain_ahead(run_in_turn(turn, stream)):
+            await websocket.send_json({"chunk": chunk, "done": False})
+        await websocket.send_json({"chunk": "", "done": True})
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        print(f"Error in websocket chat: {e}")
+        await websocket.send_json({"error": str(e), "done": True})
+
+async def chat_events(stream):
+    """SSE payloads for one answer: Gemini chunks, then done"""
+    try:
+        async for chunk in stream:
+            yield {'chunk': chunk, 'done': False}
+
+        # Signal completion
+        yield {'chunk': '', 'done': True}
+
+    except Exception as e:
+        print(f"Error in streaming: {e}")
+        yield {'error': str(e), 'done': True}
+
+async def drain_ahead(stream):
+    """Re-yields a stream that is consumed in a background task as fast as it produces"""
+    chunks = asyncio.Queue()
+
+    async def drain():
+        try:
+            async for chunk in stream:
+                chunks.put_nowait(chunk)
+            chunks.put_nowait(None)
+        except Exception as e:
+            chunks.put_nowait(e)
+
+    task = asyncio.create_task(drain())
+    try:
+        while (item := await chunks.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+
+async def paced_events(stream):
+    """SSE payloads for one answer: Gemini chunks re-split into short pieces, then done.
+
+    The stream is drained ahead of the pacing, so generation (and the chat
+    turn wrapped around it) finishes as soon as Gemini does.
+    """
+    try:
+        async for chunk in drain_ahead(stream):
+            # Add small chunks for better streaming effect
+            if len(chunk) > 10:
+                # Split longer chunks into smaller pieces
+                words = chunk.split(' ')
+                for i in range(0, len(words), 2):  # 2 words at a time
+                    word_chunk = ' '.join(words[i:i+2])
+                    if word_chunk.strip():
+                        yield {'chunk': word_chunk + ' ', 'done': False}
+                        await asyncio.sleep(0.05)  # 50ms delay for smoother streaming
+            else:
+                yield {'chunk': chunk, 'done': False}
+                await asyncio.sleep(0.03)  # 30ms delay
+
+        # Signal completion
+        yield {'chunk': '', 'done': True}
+
+    except Exception as e:
+        print(f"Error in streaming: {e}")
+        yield {'error': str(e), 'done': True}
+
+def sse_response(buffer, after_id=-1):
+    return StreamingResponse(
+        sse_events(buffer, after_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # For nginx
+            "X-Stream-Id": buffer.stream_id,
+        }
+    )
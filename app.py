@@ -1,30 +1,11 @@
 # app.py
 import gradio as gr
-import faiss
-import pickle
-import os
-import time
-from sentence_transformers import SentenceTransformer
-from rag_pipeline import answer_query, client
+from rag_engine import get_engine, configure_gradio_queue
 
 # ------------------ 1. CONFIG ------------------
-INDEX_PATH = "faiss_index.bin"
-SENTENCES_PATH = "sentences.pkl"
-MODEL_NAME = "all-mpnet-base-v2"
-
-embedding_model, index, sentences = None, None, None
-assets_loaded = False
-
-if os.path.exists(INDEX_PATH) and os.path.exists(SENTENCES_PATH):
-    print("🚀 Loading models and data...")
-    embedding_model = SentenceTransformer(MODEL_NAME)
-    index = faiss.read_index(INDEX_PATH)
-    with open(SENTENCES_PATH, "rb") as f:
-        sentences = pickle.load(f)
-    assets_loaded = True
-    print("✅ Assets ready.")
-else:
-    print("⚠️ Preprocessed files not found. Run preprocess.py first.")
+print("🚀 Loading models and data...")
+engine = get_engine()
+assets_loaded = engine.load()
 
 # ------------------ 2. CLEAN, COMPACT STYLING ------------------
 custom_css = """
@@ -164,27 +145,22 @@ body, html {
 """
 
 # ------------------ 3. CHAT FUNCTION ------------------
-def respond(message, chat_history):
+async def respond(message, chat_history):
     if not assets_loaded:
         bot_message = "⚠️ Assets not loaded. Please run preprocess.py and restart."
         chat_history.append((message, bot_message))
-        return "", chat_history
+        yield "", chat_history
+        return
 
+    chat_history.append((message, ""))
+    answer = ""
     try:
-        answer = answer_query(
-            query=message,
-            embedding_model=embedding_model,
-            index=index,
-            sentences=sentences,
-            client=client
-        )
-        chat_history.append((message, ""))
-        for i in range(len(answer)):
-            time.sleep(0.01)
-            chat_history[-1] = (message, answer[: i+1])
+        async for chunk in engine.astream(message, source="gradio:app"):
+            answer += chunk
+            chat_history[-1] = (message, answer)
             yield "", chat_history
     except Exception as e:
-        chat_history.append((message, f"⚠️ Error: {str(e)}"))
+        chat_history[-1] = (message, f"⚠️ Error: {str(e)}")
         yield "", chat_history
 
 # ------------------ 4. GRADIO APP ------------------
@@ -228,6 +204,8 @@ with gr.Blocks(theme=gr.themes.Soft(), css=custom_css) as demo:
         submit_btn.click(respond, [txt_input, chatbot], [txt_input, chatbot])
         txt_input.submit(respond, [txt_input, chatbot], [txt_input, chatbot])
 
+configure_gradio_queue(demo)
+
 # ------------------ 5. LAUNCH ------------------
 if __name__ == "__main__":
     demo.launch()
@@ -1,48 +1,44 @@
 import gradio as gr
 import asyncio
-import json
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
-import uvicorn
-import os
-import sys
 
 # Import your existing RAG pipeline
 try:
-    from rag_pipeline import answer_query_streaming, answer_query
-    from app_hf import *  # Import all the setup from app_hf
+    from rag_engine import get_engine, configure_gradio_queue
     HAS_RAG = True
 except ImportError:
     HAS_RAG = False
     print("RAG pipeline not available, using mock responses")
 
+    def configure_gradio_queue(demo):
+        return demo.queue()
+
+if HAS_RAG:
+    # Load once at startup; every chat shares this engine
+    print("🚀 Loading models and data...")
+    engine = get_engine()
+    HAS_RAG = engine.load()
+
 async def chat_with_streaming(message, history):
     """Gradio-compatible chat function with streaming"""
+    history = (history or []) + [(message, "")]
     if not HAS_RAG:
         # Mock response for testing
         response = "I'm sorry, the RAG pipeline is not available. This is a test response."
         for i in range(0, len(response), 3):
-            yield response[:i+3]
+            history[-1] = (message, response[:i+3])
+            yield history
             await asyncio.sleep(0.1)
         return
     
     try:
-        # Use your existing streaming function
         full_response = ""
-        async for chunk in answer_query_streaming(
-            query=message,
-            embedding_model=embedding_model,
-            index=index,
-            sentences=sentences,
-            client=client,
-            top_k=5
-        ):
+        async for chunk in engine.astream(message, top_k=5, source="gradio:app_gradio_hf"):
             full_response += chunk
-            yield full_response
+            history[-1] = (message, full_response)
+            yield history
     except Exception as e:
-        yield f"Sorry, I encountered an error: {str(e)}"
+        history[-1] = (message, f"Sorry, I encountered an error: {str(e)}")
+        yield history
 
 # Create Gradio interface
 with gr.Blocks(
@@ -115,6 +111,8 @@ with gr.Blocks(
     
     clear.click(lambda: None, outputs=chatbot)
 
+configure_gradio_queue(demo)
+
 # Launch configuration
 if __name__ == "__main__":
     # For HF Spaces
@@ -1,188 +1,82 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-import faiss
-import pickle
 import os
-import json
-import asyncio
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: SentenceTransformers import failed: {e}")
-    SentenceTransformer = None
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
+from importlib.util import find_spec
 
-from rag_pipeline import answer_query, answer_query_streaming, client
+# Checked without importing: torch + transformers are loaded with the model, not at import
+SENTENCE_TRANSFORMERS_AVAILABLE = find_spec("sentence_transformers") is not None
+if not SENTENCE_TRANSFORMERS_AVAILABLE:
+    print("Warning: SentenceTransformers is not installed")
+
+from rag_engine import get_engine
+from api_routes import ChatServer, router
+from static_files import PrecompressedStaticFiles, SpaIndex
 import uvicorn
 
-# Global variables for models
-embedding_model = None
-index = None
-sentences = None
-assets_loaded = False
+# Shared engine: embedding model, index bundles and Gemini client, loaded once
+engine = get_engine()
+# Answers are paced out in short pieces for a smoother typing effect in the UI
+server = ChatServer(engine, source="app_hf", paced=True)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Load models
-    global embedding_model, index, sentences, assets_loaded
-    
-    INDEX_PATH = "faiss_index.bin"
-    SENTENCES_PATH = "sentences.pkl"
-    MODEL_NAME = "all-mpnet-base-v2"
-    
     if not SENTENCE_TRANSFORMERS_AVAILABLE:
         print("❌ SentenceTransformers not available. Cannot load models.")
-        assets_loaded = False
-    elif os.path.exists(INDEX_PATH) and os.path.exists(SENTENCES_PATH):
-        print("🚀 Loading models and data...")
-        try:
-            # Use CPU for Hugging Face Spaces (no GPU guaranteed)
-            embedding_model = SentenceTransformer(MODEL_NAME, device='cpu')
-            index = faiss.read_index(INDEX_PATH)
-            with open(SENTENCES_PATH, "rb") as f:
-                sentences = pickle.load(f)
-            assets_loaded = True
-            print("✅ Assets ready.")
-        except Exception as e:
-            print(f"❌ Error loading assets: {e}")
-            assets_loaded = False
+        server.assets_loaded = False
     else:
-        print("⚠️ Preprocessed files not found. Run preprocess.py first.")
-        assets_loaded = False
+        print("🚀 Loading models and data...")
+        server.assets_loaded = await engine.aload()
     
     yield
     
     # Shutdown: cleanup if needed
     print("🔄 Shutting down...")
+    engine.close()
 
 app = FastAPI(title="SRB RAG Chatbot API", lifespan=lifespan)
+app.state.chat_server = server
 
-# Enable CORS for all origins (for Hugging Face Spaces)
+# Enable CORS for all origins (for Hugging Face Spaces) unless CORS_ALLOW_ORIGINS narrows it;
+# the rate limits apply either way, since scripts don't need CORS
+CORS_ALLOW_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ALLOW_ORIGINS", "*").split(",") if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for HF Spaces
+    allow_origins=CORS_ALLOW_ORIGINS,  # Allow all origins for HF Spaces by default
     allow_credentials=False,  # Set to False for public deployment
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id"],
 )
 
-# Request/Response models
-class ChatRequest(BaseModel):
-    message: str
-
-class ChatResponse(BaseModel):
-    response: str
-    status: str = "success"
-
-@app.get("/health")
-async def health_check():
-    return {
-        "status": "healthy" if assets_loaded else "unhealthy",
-        "models_loaded": assets_loaded
-    }
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    if not assets_loaded:
-        raise HTTPException(
-            status_code=503, 
-            detail="Models not loaded. Please check if preprocessed files exist."
-        )
-    
-    try:
-        # Use the existing RAG pipeline
-        response = answer_query(
-            query=request.message,
-            embedding_model=embedding_model,
-            index=index,
-            sentences=sentences,
-            client=client,
-            top_k=5
-        )
-        
-        return ChatResponse(response=response, status="success")
-    
-    except Exception as e:
-        print(f"Error processing request: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing your question: {str(e)}")
-
-@app.post("/chat/stream")
-async def chat_stream_endpoint(request: ChatRequest):
-    if not assets_loaded:
-        raise HTTPException(
-            status_code=503, 
-            detail="Models not loaded. Please check if preprocessed files exist."
-        )
-    
-    async def generate_response():
-        try:
-            # Stream the response
-            async for chunk in answer_query_streaming(
-                query=request.message,
-                embedding_model=embedding_model,
-                index=index,
-                sentences=sentences,
-                client=client,
-                top_k=5
-            ):
-                # Add small chunks for better streaming effect
-                if len(chunk) > 10:
-                    # Split longer chunks into smaller pieces
-                    words = chunk.split(' ')
-                    for i in range(0, len(words), 2):  # 2 words at a time
-                        word_chunk = ' '.join(words[i:i+2])
-                        if word_chunk.strip():
-                            yield f"data: {json.dumps({'chunk': word_chunk + ' ', 'done': False})}\n\n"
-                            await asyncio.sleep(0.05)  # 50ms delay for smoother streaming
-                else:
-                    yield f"data: {json.dumps({'chunk': chunk, 'done': False})}\n\n"
-                    await asyncio.sleep(0.03)  # 30ms delay
-            
-            # Signal completion
-            yield f"data: {json.dumps({'chunk': '', 'done': True})}\n\n"
-            
-        except Exception as e:
-            print(f"Error in streaming: {e}")
-            yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
-    
-    return StreamingResponse(
-        generate_response(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-            "Access-Control-Allow-Headers": "*"
-        }
-    )
+# Chat, prefetch, stream resume, WebSocket and admin endpoints (shared with backend_api.py)
+app.include_router(router)
 
 # Serve static files FIRST (for assets like JS, CSS, images)
+# Hashed bundles are precompressed at build time and cached as immutable.
 if os.path.exists("static"):
-    app.mount("/assets", StaticFiles(directory="static/assets"), name="assets")
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+    if os.path.exists("static/assets"):
+        app.mount("/assets", PrecompressedStaticFiles(directory="static/assets"), name="assets")
+    app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
+
+spa_index = SpaIndex("static/index.html")
 
 # Serve React app for non-asset routes
 @app.get("/{full_path:path}")
-async def serve_react_app(full_path: str = ""):
+async def serve_react_app(request: Request, full_path: str = ""):
     """Serve React app for any path that doesn't match API routes or assets"""
     # Skip serving HTML for asset requests (they should be handled by StaticFiles above)
     if full_path.startswith("assets/") or full_path.startswith("static/"):
         raise HTTPException(status_code=404, detail="Asset not found")
     
     # Let API routes handle themselves
-    if full_path.startswith("chat") or full_path.startswith("health") or full_path.startswith("docs") or full_path.startswith("openapi"):
+    if full_path.startswith("chat") or full_path.startswith("prefetch") or full_path.startswith("ws") or full_path.startswith("health") or full_path.startswith("admin") or full_path.startswith("docs") or full_path.startswith("openapi"):
         raise HTTPException(status_code=404, detail="Not found")
     
-    # Serve React app's index.html for all other routes (including root)
-    if os.path.exists("static/index.html"):
-        return FileResponse("static/index.html")
+    # Serve React app's index.html for all other routes (including root), from memory with ETag/304
+    if spa_index.available():
+        return spa_index.response(request)
     else:
         return {"message": "SRB RAG Chatbot API is running!", "status": "healthy", "note": "Frontend not available - static/index.html not found"}
 
@@ -1,10 +1,27 @@
 import gradio as gr
 import asyncio
-import time
 
-def chat_with_streaming(message, history):
-    """Simple chat function with mock streaming for HF Spaces"""
-    
+# Use the shared RAG engine when its dependencies and index are available,
+# otherwise fall back to keyword-matched demo answers
+try:
+    from rag_engine import get_engine, configure_gradio_queue
+    engine = get_engine()
+    HAS_RAG = engine.load()
+except ImportError:
+    HAS_RAG = False
+
+    def configure_gradio_queue(demo):
+        return demo.queue()
+
+async def chat_with_streaming(message, history):
+    """Streams the RAG answer, or a mock answer when the pipeline is unavailable"""
+    if HAS_RAG:
+        full_response = ""
+        async for chunk in engine.astream(message, source="gradio:app_simple_gradio"):
+            full_response += chunk
+            yield full_response
+        return
+
     # Mock responses based on common questions
     responses = {
         "attendance": "According to the SRB, students must maintain a minimum of 75% attendance in each subject to be eligible for examinations. Medical leave may be considered for attendance calculations with proper documentation.",
@@ -29,7 +46,7 @@ def chat_with_streaming(message, history):
     
     for i, word in enumerate(words):
         full_response += word + " "
-        time.sleep(0.05)  # Small delay to simulate streaming
+        await asyncio.sleep(0.05)  # Small delay to simulate streaming
         yield full_response
 
 # Create Gradio interface with beautiful styling
@@ -123,26 +140,30 @@ with gr.Blocks(
             clear = gr.Button("🗑️ Clear Chat", variant="secondary", size="sm")
     
     # Event handlers
-    def respond(message, history):
+    async def respond(message, history):
         if not message.strip():
-            return history, ""
+            yield history, ""
+            return
             
         # Add user message to history
         history = history or []
         history.append([message, None])
         
         # Generate streaming response
-        bot_response = ""
-        for partial_response in chat_with_streaming(message, history):
-            history[-1][1] = partial_response
+        try:
+            async for partial_response in chat_with_streaming(message, history):
+                history[-1][1] = partial_response
+                yield history, ""
+        except Exception as e:
+            history[-1][1] = f"Sorry, I encountered an error: {str(e)}"
             yield history, ""
-        
-        return history, ""
     
     msg.submit(respond, inputs=[msg, chatbot], outputs=[chatbot, msg])
     submit_btn.click(respond, inputs=[msg, chatbot], outputs=[chatbot, msg])
     clear.click(lambda: ([], ""), outputs=[chatbot, msg])
 
+configure_gradio_queue(demo)
+
 # Launch for HF Spaces
 if __name__ == "__main__":
     demo.launch()
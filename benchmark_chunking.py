@@ -0,0 +1,99 @@
+"""Compares the token-aware chunker against the legacy 5-sentence groups.
+
+Usage:
+    python benchmark_chunking.py --pdf SRB-2025.pdf --probes 300 --k 5
+
+Retrieval quality is measured with sentence probes: sentences sampled from the
+PDF are used as queries, and a hit means a top-k chunk contains the sentence
+(hit@k, MRR) or covers the sentence's page (page hit@k). Index size, chunk
+size spread and encode time are reported alongside.
+"""
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from spacy.lang.en import English
+
+from ingestion import open_and_read_pdf, sentence_splitter, token_chunker, build_faiss_index, estimate_tokens
+
+
+def sample_probes(pages_and_texts, n_probes, min_words=10, seed=0):
+    """Samples (sentence, page_number) pairs to use as queries."""
+    nlp = English()
+    nlp.add_pipe("sentencizer")
+    candidates = []
+    for item, doc in zip(pages_and_texts, nlp.pipe(item["text"] for item in pages_and_texts)):
+        for sent in doc.sents:
+            text = sent.text.strip()
+            if len(text.split()) >= min_words:
+                candidates.append((text, item["page_number"]))
+    random.Random(seed).shuffle(candidates)
+    return candidates[:n_probes]
+
+
+def evaluate(name, chunks, probes, model, k):
+    start = time.perf_counter()
+    _, index, texts = build_faiss_index(chunks, embedding_model=model)
+    build_seconds = time.perf_counter() - start
+
+    page_spans = np.array([(c.get("page_start", c["page_number"]), c.get("page_end", c["page_number"])) for c in chunks])
+    query_embeddings = model.encode([p[0] for p in probes], convert_to_tensor=False)
+    start = time.perf_counter()
+    _, indices = index.search(np.array(query_embeddings), k)
+    search_ms = (time.perf_counter() - start) * 1000 / max(len(probes), 1)
+
+    hits, page_hits, reciprocal_ranks = 0, 0, []
+    for (sentence, page), row in zip(probes, indices):
+        ranks = [rank for rank, i in enumerate(row) if sentence in texts[i]]
+        hits += bool(ranks)
+        reciprocal_ranks.append(1.0 / (ranks[0] + 1) if ranks else 0.0)
+        page_hits += any(page_spans[i][0] <= page <= page_spans[i][1] for i in row)
+
+    tokens = np.array([estimate_tokens(t) for t in texts])
+    n = max(len(probes), 1)
+    return {
+        "scheme": name,
+        "chunks": index.ntotal,
+        "index_bytes": len(faiss.serialize_index(index)),
+        "tokens_mean": tokens.mean(),
+        "tokens_std": tokens.std(),
+        "tokens_p5": np.percentile(tokens, 5),
+        "tokens_p95": np.percentile(tokens, 95),
+        "tokens_max": tokens.max(),
+        "build_s": build_seconds,
+        "search_ms": search_ms,
+        f"hit@{k}": hits / n,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        f"page_hit@{k}": page_hits / n,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chunking schemes on the SRB PDF.")
+    parser.add_argument("--pdf", default="SRB-2025.pdf")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--probes", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--min-tokens", type=int, default=64)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    pages_and_texts = open_and_read_pdf(args.pdf)
+    probes = sample_probes(pages_and_texts, args.probes)
+    model = SentenceTransformer(args.model)
+
+    schemes = {
+        "sentences x5": sentence_splitter(pages_and_texts),
+        "tokens": token_chunker(pages_and_texts, args.max_tokens, args.min_tokens, args.overlap_tokens),
+        "tokens/page": token_chunker(pages_and_texts, args.max_tokens, args.min_tokens, args.overlap_tokens, respect_pages=True),
+    }
+    results = [evaluate(name, chunks, probes, model, args.k) for name, chunks in schemes.items()]
+
+    columns = list(results[0].keys())
+    print("\n" + " | ".join(f"{c:>12}" for c in columns))
+    for row in results:
+        print(" | ".join(f"{v:>12.3f}" if isinstance(v, float) else f"{v:>12}" for v in row.values()))
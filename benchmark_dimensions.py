@@ -0,0 +1,114 @@
+"""Recall and latency trade-off of reduced-dimension indexes.
+
+Usage:
+    python benchmark_dimensions.py --dims 512 256 128 64 --k 5
+    python benchmark_dimensions.py --queries-from-log logs/query_log.jsonl
+
+Corpus vectors come from the active bundle's full-dimension index (or are
+re-encoded if that index is already reduced). Queries are the logged user
+queries when a query log is given, otherwise a sample of the chunks themselves
+(self-matches excluded). For every target dimension and reduction method the
+report shows recall@k against the exact full-dimension top-k, search latency
+per query, vector memory and serialized index size.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from index_bundle import load_current_bundle
+from ingestion import make_reduced_index
+
+
+def corpus_vectors(bundle, model_name):
+    index = bundle.index
+    if isinstance(index, faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+    from sentence_transformers import SentenceTransformer
+    print("Active index is reduced; re-encoding chunks at full dimension...")
+    model = SentenceTransformer(model_name)
+    return np.array(model.encode(bundle.sentences, show_progress_bar=True), dtype=np.float32)
+
+
+def logged_queries(path, limit):
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                queries.append(json.loads(line)["query"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return list(dict.fromkeys(queries))[:limit]
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, indices = index.search(queries, k)
+    return indices, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_at_k(truth, found, k):
+    """Share of the exact top-k neighbours found; -1 marks dropped self-matches."""
+    hits = 0
+    for true_row, found_row in zip(truth, found):
+        true_ids = [i for i in true_row if i >= 0][:k]
+        found_ids = [i for i in found_row if i >= 0][:k]
+        hits += len(set(true_ids) & set(found_ids)) / max(len(true_ids), 1)
+    return hits / len(truth)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reduced-dimension FAISS indexes.")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 256, 128, 64])
+    parser.add_argument("--methods", nargs="+", default=["pca", "truncate"], choices=["pca", "truncate"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500, help="Number of query vectors")
+    parser.add_argument("--queries-from-log", default=None, help="Use normalized queries from a query log")
+    args = parser.parse_args()
+
+    bundle = load_current_bundle()
+    corpus = corpus_vectors(bundle, args.model)
+    dim = corpus.shape[1]
+
+    if args.queries_from_log:
+        from sentence_transformers import SentenceTransformer
+        texts = logged_queries(args.queries_from_log, args.queries)
+        queries = np.array(SentenceTransformer(args.model).encode(texts), dtype=np.float32)
+        exclude_self = False
+    else:
+        # Chunk vectors as queries; ask for k+1 neighbours and ignore the self-match
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+        queries = corpus[sample]
+        exclude_self = True
+
+    k = args.k + 1 if exclude_self else args.k
+    full_index = faiss.IndexFlatL2(dim)
+    full_index.add(corpus)
+    truth, full_ms = timed_search(full_index, queries, k)
+    if exclude_self:
+        truth = np.where(truth == sample[:, None], -1, truth)
+
+    rows = [("full", dim, 1.0, full_ms, len(faiss.serialize_index(full_index)))]
+    for method in args.methods:
+        for target in args.dims:
+            if target >= dim:
+                continue
+            index = make_reduced_index(dim, target, method)
+            index.train(corpus)
+            index.add(corpus)
+            found, ms = timed_search(index, queries, k)
+            if exclude_self:
+                found = np.where(found == sample[:, None], -1, found)
+            rows.append((method, target, recall_at_k(truth, found, args.k), ms, len(faiss.serialize_index(index))))
+
+    print(f"\n{len(corpus)} chunks, {len(queries)} queries, k={args.k}")
+    # The file size includes the stored transform (the PCA matrix is dim x dim),
+    # vector KB is what search scans and what grows with the corpus.
+    print(f"{'method':<9} {'dim':>5} {'recall@k':>9} {'ms/query':>9} {'vector KB':>10} {'file KB':>9}")
+    for method, target, recall, ms, size in rows:
+        vector_kb = len(corpus) * target * 4 / 1024
+        print(f"{method:<9} {target:>5} {recall:>9.3f} {ms:>9.4f} {vector_kb:>10.1f} {size / 1024:>9.1f}")
@@ -0,0 +1,114 @@
+"""Calibrates SESSION_FOLLOWUP_SIMILARITY on labelled question pairs.
+
+Usage:
+    python benchmark_followup.py
+    python benchmark_followup.py --labels labelled_pairs.jsonl --thresholds 0.3 0.4 0.5 0.6
+    python benchmark_followup.py --labels labelled_pairs.jsonl --max-false-carry 0.05
+
+Labelled files hold {"previous": ..., "question": ..., "followup": true|false}
+per line; without one a small built-in set is used. For each cosine threshold
+the report shows the share of follow-ups that would carry the previous turn's
+chunks (what the follow-up gains) and the share of new-topic questions that
+would too (stale chunks crowding the context).
+
+Carrying is off until SESSION_FOLLOWUP_SIMILARITY is set. --max-false-carry
+suggests the lowest threshold that carries chunks into at most that share of
+new-topic questions; re-run it after switching embedding models.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from chat_session import FOLLOWUP_THRESHOLD, cosine
+from embedding_pool import load_embedding_model
+
+DEFAULT_LABELLED = [
+    ("What attendance do I need to maintain?", "What happens if I fall below that?", True),
+    ("What attendance do I need to maintain?", "Does medical leave count towards it?", True),
+    ("How is the CGPA calculated?", "And how is it converted to a percentage?", True),
+    ("What are the library borrowing limits?", "What is the fine for returning books late?", True),
+    ("Tell me about examination rules and procedures", "What if I miss an end-semester exam?", True),
+    ("Can I apply for re-evaluation of my answer sheet?", "How long does the re-evaluation take?", True),
+    ("What is the procedure for a backlog exam?", "Is there a fee for registering for it?", True),
+    ("What are the hostel rules?", "What time do hostel gates close at night?", True),
+    ("What attendance do I need to maintain?", "What is the dress code on campus?", False),
+    ("How is the CGPA calculated?", "What are the library borrowing limits?", False),
+    ("What are the library borrowing limits?", "What happens if I use unfair means in an exam?", False),
+    ("Tell me about examination rules and procedures", "How do I apply for a hostel room?", False),
+    ("What are the medical leave policies?", "Explain the grading and evaluation criteria", False),
+    ("What is the dress code on campus?", "Can I apply for re-evaluation of my answer sheet?", False),
+    ("What are the hostel rules?", "How is the CGPA calculated?", False),
+    ("What is the procedure for a backlog exam?", "Are scholarships available for students?", False),
+]
+
+
+def read_pairs(path):
+    """Returns (previous questions, questions, follow-up labels) from a labelled JSONL file."""
+    previous, questions, labels = [], [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            previous.append(record["previous"])
+            questions.append(record["question"])
+            labels.append(bool(record["followup"]))
+    return previous, questions, labels
+
+
+def calibrate_threshold(similarities, followup, max_false_carry):
+    """Lowest cosine threshold carrying chunks into at most max_false_carry of the new-topic questions."""
+    new_topic = np.sort(similarities[~followup])[::-1]
+    if not len(new_topic):
+        raise ValueError("Need new-topic pairs to calibrate against")
+    allowed = int(np.floor(max_false_carry * len(new_topic)))
+    if allowed >= len(new_topic):
+        return float(new_topic[-1])
+    # Just above the first new-topic pair that must not carry (followup_of compares with >=)
+    return round(float(new_topic[allowed]) + 1e-4, 4)
+
+
+def rates(carried, followup):
+    hit = (carried & followup).sum() / max(followup.sum(), 1)
+    false_carry = (carried & ~followup).sum() / max((~followup).sum(), 1)
+    return hit, false_carry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the follow-up similarity threshold.")
+    parser.add_argument("--labels", default=None, help="JSONL of {\"previous\", \"question\", \"followup\"}")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6, 0.7])
+    parser.add_argument("--max-false-carry", type=float, default=None,
+                        help="Suggest the threshold carrying into at most this share of new-topic questions")
+    args = parser.parse_args()
+
+    if args.labels:
+        previous, questions, labels = read_pairs(args.labels)
+    else:
+        previous, questions, labels = (list(column) for column in zip(*DEFAULT_LABELLED))
+    followup = np.array(labels, dtype=bool)
+
+    model = load_embedding_model(args.model)
+    previous_embeddings = np.asarray(model.encode(previous), dtype=np.float32)
+    embeddings = np.asarray(model.encode(questions), dtype=np.float32)
+    similarities = np.array([cosine(a, b) for a, b in zip(embeddings, previous_embeddings)])
+
+    print(f"\n{len(questions)} pairs ({followup.sum()} follow-ups), model {args.model}")
+    for name, mask in (("follow-up", followup), ("new topic", ~followup)):
+        if mask.any():
+            print(f"Cosine to the previous question, {name:<10}: min {similarities[mask].min():.3f}, "
+                  f"median {np.median(similarities[mask]):.3f}, max {similarities[mask].max():.3f}")
+
+    print(f"\n{'threshold':<12} {'follow-ups carried':>18} {'new topics carried':>19}")
+    for threshold in args.thresholds:
+        marker = " *" if threshold == FOLLOWUP_THRESHOLD else ""
+        hit, false_carry = rates(similarities >= threshold, followup)
+        print(f"{f'{threshold}{marker}':<12} {hit:>18.1%} {false_carry:>19.1%}")
+    print("(* = configured SESSION_FOLLOWUP_SIMILARITY)")
+    if args.max_false_carry is not None:
+        threshold = calibrate_threshold(similarities, followup, args.max_false_carry)
+        hit, false_carry = rates(similarities >= threshold, followup)
+        print(f"\nCalibrated for {args.model}: SESSION_FOLLOWUP_SIMILARITY={threshold} "
+              f"(follow-ups carried {hit:.1%}, new topics carried {false_carry:.1%})")
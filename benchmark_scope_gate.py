@@ -0,0 +1,114 @@
+"""False-reject rate of the out-of-scope gate on a labelled query set.
+
+Usage:
+    python benchmark_scope_gate.py
+    python benchmark_scope_gate.py --labels labelled_queries.jsonl --thresholds 1.2 1.3 1.4 1.5 1.6
+    python benchmark_scope_gate.py --labels labelled_queries.jsonl --max-false-reject 0.02
+
+Labelled files hold {"query": ..., "in_scope": true|false} per line; without
+one a small built-in set is used. For each distance threshold (and the trained
+classifier, if scope_model.npz exists) the report shows the false-reject rate
+(in-scope questions refused, which is what users feel) and the share of
+out-of-scope queries caught (Gemini calls saved). The classifier's numbers are
+optimistic if it was trained on the same labels.
+
+Distances depend on the bundle (a PCA-reduced index is not on the same scale
+as a full one), so the gate is off until SCOPE_DISTANCE_THRESHOLD is set.
+--max-false-reject suggests the threshold that catches the most off-topic
+queries while refusing at most that share of in-scope ones, for the active
+bundle; re-run it after rebuilding with different settings.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from embedding_pool import load_embedding_model
+from index_bundle import load_current_bundle
+from scope_gate import (SCOPE_DISTANCE_THRESHOLD, SCOPE_MODEL_PATH, ScopeClassifier, distance_features,
+                        query_distances, read_labelled)
+
+DEFAULT_LABELLED = [
+    ("What attendance do I need to maintain?", True),
+    ("What happens if I use unfair means in an exam?", True),
+    ("Explain the grading and evaluation criteria", True),
+    ("What are the library borrowing limits?", True),
+    ("Tell me about examination rules and procedures", True),
+    ("What are the medical leave policies?", True),
+    ("How is the CGPA calculated?", True),
+    ("Can I apply for re-evaluation of my answer sheet?", True),
+    ("What is the dress code on campus?", True),
+    ("What is the procedure for a backlog exam?", True),
+    ("Count numbers from 1 to 10", False),
+    ("Write a poem about the ocean", False),
+    ("What is the capital of France?", False),
+    ("Give me a recipe for chocolate cake", False),
+    ("Who won the football world cup in 2018?", False),
+    ("Translate 'good morning' into Japanese", False),
+    ("What's the weather like tomorrow?", False),
+    ("Tell me a joke", False),
+]
+
+
+def calibrate_threshold(nearest, out_of_scope, max_false_reject):
+    """Smallest distance threshold refusing at most max_false_reject of the in-scope queries."""
+    in_scope = np.sort(nearest[~out_of_scope])
+    if not len(in_scope):
+        raise ValueError("Need in-scope queries to calibrate against")
+    allowed = int(np.floor(max_false_reject * len(in_scope)))
+    return float(in_scope[len(in_scope) - allowed - 1])
+
+
+def rates(rejected, out_of_scope):
+    in_scope = ~out_of_scope
+    false_reject = (rejected & in_scope).sum() / max(in_scope.sum(), 1)
+    caught = (rejected & out_of_scope).sum() / max(out_of_scope.sum(), 1)
+    return false_reject, caught
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the out-of-scope gate.")
+    parser.add_argument("--labels", default=None, help="JSONL of {\"query\", \"in_scope\"}")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[1.2, 1.3, 1.4, 1.5, 1.6, 1.7])
+    parser.add_argument("--max-false-reject", type=float, default=None,
+                        help="Suggest the threshold refusing at most this share of in-scope queries (e.g. 0.02)")
+    args = parser.parse_args()
+
+    if args.labels:
+        queries, labels = read_labelled(args.labels)
+    else:
+        queries = [q for q, _ in DEFAULT_LABELLED]
+        labels = [0 if in_scope else 1 for _, in_scope in DEFAULT_LABELLED]
+    out_of_scope = np.array(labels, dtype=bool)
+
+    bundle = load_current_bundle(model_name=args.model)
+    distances = query_distances(queries, load_embedding_model(args.model), bundle.index)
+    nearest = distances[:, 0]
+
+    print(f"\n{len(queries)} queries ({out_of_scope.sum()} out of scope), index bundle {bundle.version}")
+    for name, mask in (("in scope", ~out_of_scope), ("out of scope", out_of_scope)):
+        if mask.any():
+            print(f"Nearest-chunk distance, {name:<12}: min {nearest[mask].min():.3f}, "
+                  f"median {np.median(nearest[mask]):.3f}, max {nearest[mask].max():.3f}")
+
+    try:
+        configured = float(SCOPE_DISTANCE_THRESHOLD)
+    except ValueError:
+        configured = None
+    print(f"\n{'gate':<22} {'false-reject':>12} {'oos caught':>11}")
+    for threshold in args.thresholds:
+        marker = " *" if threshold == configured else ""
+        false_reject, caught = rates(nearest > threshold, out_of_scope)
+        print(f"{f'distance > {threshold}{marker}':<22} {false_reject:>12.1%} {caught:>11.1%}")
+    if os.path.exists(SCOPE_MODEL_PATH):
+        classifier = ScopeClassifier.load(SCOPE_MODEL_PATH)
+        rejected = classifier.predict_proba(distance_features(distances)) >= classifier.threshold
+        false_reject, caught = rates(rejected, out_of_scope)
+        print(f"{'classifier':<22} {false_reject:>12.1%} {caught:>11.1%}")
+    print("(* = configured SCOPE_DISTANCE_THRESHOLD)")
+    if args.max_false_reject is not None:
+        threshold = round(calibrate_threshold(nearest, out_of_scope, args.max_false_reject), 4)
+        false_reject, caught = rates(nearest > threshold, out_of_scope)
+        print(f"\nCalibrated for bundle {bundle.version}: SCOPE_DISTANCE_THRESHOLD={threshold} "
+              f"(false-reject {false_reject:.1%}, oos caught {caught:.1%})")
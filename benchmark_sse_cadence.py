@@ -0,0 +1,97 @@
+"""Measures SSE chunk cadence while query encodes run concurrently.
+
+Usage:
+    python benchmark_sse_cadence.py --workers 2 --concurrency 4 --seconds 10
+
+A ticker coroutine emits a fake SSE chunk every 50 ms (the pacing app_hf uses)
+and records the actual gap between chunks, while `concurrency` clients keep
+encoding queries. Modes compared:
+  inline  encode() called on the event loop (what /chat/stream used to do)
+  thread  in-process model via asyncio.to_thread
+  pool    EmbeddingPool worker processes via asyncio.to_thread
+A smooth stream keeps p99/max gaps close to the 50 ms target.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from embedding_pool import EmbeddingPool
+
+QUERIES = [
+    "What attendance do I need to maintain?",
+    "What happens if I use unfair means in an exam?",
+    "Explain the grading and evaluation criteria",
+    "What are the library borrowing limits?",
+    "Tell me about examination rules and procedures",
+    "What are the medical leave policies?",
+]
+
+
+async def ticker(interval, stop_at):
+    gaps = []
+    last = time.perf_counter()
+    while time.perf_counter() < stop_at:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append((now - last) * 1000)
+        last = now
+    return gaps
+
+
+async def encode_client(mode, model, stop_at):
+    count = 0
+    while time.perf_counter() < stop_at:
+        query = random.choice(QUERIES)
+        if mode == "inline":
+            model.encode([query])
+            await asyncio.sleep(0)
+        else:
+            await asyncio.to_thread(model.encode, [query])
+        count += 1
+    return count
+
+
+async def run_mode(mode, model, concurrency, seconds, interval):
+    stop_at = time.perf_counter() + seconds
+    results = await asyncio.gather(
+        ticker(interval, stop_at),
+        *(encode_client(mode, model, stop_at) for _ in range(concurrency)),
+    )
+    gaps = np.array(results[0])
+    return {
+        "mode": mode,
+        "encodes/s": sum(results[1:]) / seconds,
+        "gap_p50": np.percentile(gaps, 50),
+        "gap_p99": np.percentile(gaps, 99),
+        "gap_max": gaps.max(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SSE cadence under concurrent encode load.")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--workers", type=int, default=2, help="Embedding worker processes for 'pool' mode")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent encoding clients")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--interval-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model, device="cpu")
+    pool = EmbeddingPool(args.model, workers=args.workers)
+    try:
+        rows = [
+            asyncio.run(run_mode("inline", model, args.concurrency, args.seconds, args.interval_ms / 1000)),
+            asyncio.run(run_mode("thread", model, args.concurrency, args.seconds, args.interval_ms / 1000)),
+            asyncio.run(run_mode("pool", pool, args.concurrency, args.seconds, args.interval_ms / 1000)),
+        ]
+    finally:
+        pool.close()
+
+    print(f"\nTarget chunk interval: {args.interval_ms:.0f} ms")
+    print(f"{'mode':<8} {'encodes/s':>10} {'gap p50':>9} {'gap p99':>9} {'gap max':>9}")
+    for row in rows:
+        print(f"{row['mode']:<8} {row['encodes/s']:>10.1f} {row['gap_p50']:>9.1f} {row['gap_p99']:>9.1f} {row['gap_max']:>9.1f}")
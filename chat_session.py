@@ -0,0 +1,179 @@
+"""Per-connection chat sessions for the WebSocket endpoint.
+
+A WebSocket connection keeps one ChatSession: its last few turns with the
+question, a truncated answer, the chunk ids and distances that were
+retrieved, and the question's embedding. Follow-ups use this to stay cheap:
+
+  - a repeated question reuses its turn's chunks without encoding or search;
+  - a follow-up (embedding within SESSION_FOLLOWUP_SIMILARITY cosine of the
+    previous question, compared against the cached embedding, so nothing is
+    re-encoded) carries up to SESSION_CARRY_CHUNKS of the previous turn's
+    chunks into its context alongside its own results. Off by default: how
+    close follow-ups and new topics land depends on the embedding model, so
+    calibrate the threshold with benchmark_followup.py --max-false-carry;
+  - the last SESSION_HISTORY_TURNS turns go into the prompt so Gemini can
+    resolve "what about labs?" against the conversation.
+
+Memory per connection is bounded by SESSION_MAX_TURNS turns, each holding
+one embedding and at most SESSION_MAX_ANSWER_CHARS of answer. The number of
+connections is capped by WS_MAX_CONNECTIONS in total and by
+WS_MAX_CONNECTIONS_PER_CLIENT per client identity (see
+rate_limit.client_identity), so one client can't hold every slot. A
+connection idle for WS_IDLE_TIMEOUT seconds is closed.
+"""
+import os
+import uuid
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from query_log import normalize_query
+
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "3"))
+SESSION_MAX_ANSWER_CHARS = int(os.getenv("SESSION_MAX_ANSWER_CHARS", "2000"))
+SESSION_FOLLOWUP_SIMILARITY = os.getenv("SESSION_FOLLOWUP_SIMILARITY", "off")
+SESSION_CARRY_CHUNKS = int(os.getenv("SESSION_CARRY_CHUNKS", "3"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "200"))
+WS_MAX_CONNECTIONS_PER_CLIENT = int(os.getenv("WS_MAX_CONNECTIONS_PER_CLIENT", "4"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+
+
+def followup_threshold(value=SESSION_FOLLOWUP_SIMILARITY):
+    """The follow-up cosine threshold as a float, or None when carrying is off."""
+    if value is None or str(value).lower() in ("", "off", "none"):
+        return None
+    return float(value)
+
+
+FOLLOWUP_THRESHOLD = followup_threshold()
+
+
+def cosine(a, b):
+    norms = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norms) if norms else 0.0
+
+
+@dataclass
+class SessionTurn:
+    query: str
+    answer: str
+    chunk_ids: list
+    distances: list
+    embedding: np.ndarray  # float32 query embedding, as encoded
+    bundle_version: str    # chunk ids are only meaningful within one bundle
+    filter_key: str
+
+
+class ChatSession:
+    """Recent turns of one connection, oldest first."""
+
+    def __init__(self, max_turns=SESSION_MAX_TURNS, stats=None, client_id=None):
+        self.session_id = uuid.uuid4().hex
+        self.client_id = client_id
+        self.turns = deque(maxlen=max_turns)
+        self.stats = stats if stats is not None else {}  # shared with the registry
+
+    def reset(self):
+        self.turns.clear()
+
+    def find_repeat(self, query, bundle_version, filter_key):
+        """The latest turn that asked the same (normalized) question against the same bundle and filter."""
+        normalized = normalize_query(query)
+        for turn in reversed(self.turns):
+            if (normalize_query(turn.query) == normalized and turn.bundle_version == bundle_version
+                    and turn.filter_key == filter_key):
+                return turn
+        return None
+
+    def followup_of(self, embedding, bundle_version, filter_key, threshold=FOLLOWUP_THRESHOLD):
+        """(previous turn, cosine) if the question continues the last turn's topic, else (None, cosine).
+
+        A threshold of None turns carrying off.
+        """
+        if not self.turns:
+            return None, 0.0
+        previous = self.turns[-1]
+        if previous.bundle_version != bundle_version or previous.filter_key != filter_key:
+            return None, 0.0
+        similarity = cosine(embedding, previous.embedding)
+        if threshold is None or similarity < threshold:
+            return None, similarity
+        return previous, similarity
+
+    def history(self, turns=SESSION_HISTORY_TURNS):
+        """(question, answer) pairs of the most recent turns for the prompt."""
+        recent = list(self.turns)[-turns:] if turns > 0 else []
+        return [(turn.query, turn.answer) for turn in recent]
+
+    def add_turn(self, turn: SessionTurn, kind="retrieval"):
+        """Records a finished turn; kind is "retrieval", "repeat" or "followup"."""
+        turn.answer = turn.answer[:SESSION_MAX_ANSWER_CHARS]
+        self.turns.append(turn)
+        for stat in ("turns", kind):
+            self.stats[stat] = self.stats.get(stat, 0) + 1
+
+
+def merge_carried(chunk_ids, distances, previous: SessionTurn, limit=SESSION_CARRY_CHUNKS):
+    """Adds up to `limit` of the previous turn's chunks not already retrieved, ordered by distance.
+
+    Carried chunks keep the distance they had for the question that found
+    them, so a follow-up that only makes sense in context isn't refused by
+    the scope gate.
+    """
+    merged = dict(zip(chunk_ids, distances))
+    carried = []
+    for chunk_id, distance in zip(previous.chunk_ids, previous.distances):
+        if len(carried) >= limit:
+            break
+        if chunk_id not in merged:
+            merged[chunk_id] = distance
+            carried.append(chunk_id)
+    ordered = sorted(merged.items(), key=lambda item: item[1])
+    return [chunk_id for chunk_id, _ in ordered], [distance for _, distance in ordered], carried
+
+
+class SessionRegistry:
+    """Live sessions by connection, with connection-count metrics."""
+
+    def __init__(self, max_connections=WS_MAX_CONNECTIONS, idle_timeout=WS_IDLE_TIMEOUT,
+                 max_per_client=WS_MAX_CONNECTIONS_PER_CLIENT):
+        self.max_connections = max_connections
+        self.max_per_client = max_per_client
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._per_client = {}  # client id -> open connections; only clients with some
+        self.peak = 0
+        self.stats = {"opened": 0, "closed": 0, "refused": 0, "refused_per_client": 0, "idle_timeouts": 0,
+                      "turns": 0, "retrieval": 0, "repeat": 0, "followup": 0}
+
+    def open(self, client_id):
+        """A new session, or None if WS_MAX_CONNECTIONS, or this client's share, are already open."""
+        if len(self._sessions) >= self.max_connections:
+            self.stats["refused"] += 1
+            return None
+        if self._per_client.get(client_id, 0) >= self.max_per_client:
+            self.stats["refused"] += 1
+            self.stats["refused_per_client"] += 1
+            return None
+        session = ChatSession(stats=self.stats, client_id=client_id)
+        self._sessions[session.session_id] = session
+        self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+        self.stats["opened"] += 1
+        self.peak = max(self.peak, len(self._sessions))
+        return session
+
+    def close(self, session, idle=False):
+        if self._sessions.pop(session.session_id, None) is not None:
+            remaining = self._per_client.pop(session.client_id) - 1
+            if remaining:
+                self._per_client[session.client_id] = remaining
+            self.stats["closed"] += 1
+            if idle:
+                self.stats["idle_timeouts"] += 1
+
+    def metrics(self):
+        return {**self.stats, "connections": len(self._sessions), "clients": len(self._per_client),
+                "peak_connections": self.peak,
+                "session_turns": sum(len(session.turns) for session in self._sessions.values())}
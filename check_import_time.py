@@ -0,0 +1,136 @@
+"""Import-time profile check for servers, workers and CLI tools.
+
+Usage:
+    python check_import_time.py                  # compare against import_baseline.json
+    python check_import_time.py --save-baseline  # record the current numbers
+    python check_import_time.py app_hf backend_api
+
+Each module is imported in a fresh interpreter (best of --repeat runs). The
+check fails (exit 1) if a module pulls in an ingestion-only or lazily-loaded
+dependency (spaCy, PyMuPDF, SentenceTransformers/torch, the Gemini SDK,
+requests), or loads more modules than the baseline allows (--module-tolerance);
+both hold on any machine with the same packages. tests/test_import_time.py
+runs it under pytest.
+
+Import times depend on the machine, so they are reported as a multiple of
+importing numpy in the same run and compared with the baseline's ratios.
+Slowdowns past --time-tolerance are printed as warnings, and only fail the
+check with --strict.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASELINE_PATH = "import_baseline.json"
+REFERENCE_MODULE = "numpy"  # every target imports it; its import time stands in for machine speed
+TARGETS = ["rag_pipeline", "rag_engine", "api_routes", "app_hf", "backend_api", "embedding_pool", "query_log",
+           "analyze_query_log", "scope_gate"]
+# Must never load at import time; each is imported on first real use
+FORBIDDEN = ["spacy", "fitz", "pymupdf", "tqdm", "sentence_transformers", "torch", "transformers",
+             "google.genai", "requests"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": len(sys.modules),
+                  "forbidden": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=3):
+    """Best-of-N import time, module count and forbidden modules for one module."""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, forbidden=FORBIDDEN)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["seconds"])
+    return {"seconds": round(best["seconds"], 4), "modules": best["modules"], "forbidden": best["forbidden"]}
+
+
+def check(module, current, baseline, module_tolerance):
+    """Returns failure messages: forbidden imports, or a module count past the baseline's tolerance."""
+    failures = []
+    if current["forbidden"]:
+        failures.append(f"{module} imports {', '.join(current['forbidden'])} at import time")
+    if baseline:
+        module_budget = int(baseline["modules"] * (1 + module_tolerance)) + 5
+        if current["modules"] > module_budget:
+            failures.append(f"{module} loads {current['modules']} modules (baseline {baseline['modules']})")
+    return failures
+
+
+def slowdowns(module, current, baseline, time_tolerance):
+    """Returns warnings for an import-time ratio past the baseline's tolerance."""
+    # Baselines from before ratios were recorded only hold seconds; those aren't comparable
+    if not baseline or "relative" not in baseline:
+        return []
+    relative_budget = baseline["relative"] * (1 + time_tolerance) + 0.5
+    if current["relative"] > relative_budget:
+        return [f"{module} import took {current['relative']:.1f}x {REFERENCE_MODULE} "
+                f"(baseline {baseline['relative']:.1f}x)"]
+    return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if a module loads a lazy dependency or too many modules.")
+    parser.add_argument("modules", nargs="*", default=TARGETS)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the current numbers as the baseline")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--time-tolerance", type=float, default=0.5,
+                        help=f"Allowed relative growth of the import time as a multiple of {REFERENCE_MODULE}'s")
+    parser.add_argument("--module-tolerance", type=float, default=0.1, help="Allowed relative module growth")
+    parser.add_argument("--strict", action="store_true", help="Also fail on import-time slowdowns")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    reference = measure(REFERENCE_MODULE, args.repeat)["seconds"]
+    results, failures, warnings = {}, [], []
+    print(f"{REFERENCE_MODULE} imports in {reference:.3f}s on this machine\n")
+    print(f"{'module':<20} {'seconds':>8} {'x ' + REFERENCE_MODULE:>8} {'baseline':>9} {'modules':>8} {'baseline':>9}")
+    for module in args.modules:
+        current = measure(module, args.repeat)
+        current["relative"] = round(current["seconds"] / max(reference, 1e-4), 2)
+        results[module] = current
+        base = baseline.get(module)
+        base_relative = f"{base['relative']:.1f}" if base and "relative" in base else "-"
+        base_modules = base["modules"] if base else "-"
+        print(f"{module:<20} {current['seconds']:>8.3f} {current['relative']:>8.1f} {base_relative:>9} "
+              f"{current['modules']:>8} {base_modules:>9}")
+        if args.save_baseline:
+            failures += check(module, current, None, args.module_tolerance)
+        else:
+            failures += check(module, current, base, args.module_tolerance)
+            warnings += slowdowns(module, current, base, args.time_tolerance)
+
+    if warnings:
+        print("\n⚠️ Slower than the baseline:")
+        for warning in warnings:
+            print(f"  - {warning}")
+        if args.strict:
+            failures += warnings
+    if failures:
+        print("\n❌ Import-time check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    if args.save_baseline:
+        baseline.update({module: {"relative": r["relative"], "modules": r["modules"]} for module, r in results.items()})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\n✅ Baseline saved to {args.baseline}")
+    else:
+        print("\n✅ No lazy dependency is loaded at import time, and module counts are within the baseline.")
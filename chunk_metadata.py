@@ -0,0 +1,232 @@
+"""Per-chunk metadata as typed arrays, and filtered search selectors.
+
+Each chunk's page span and section are stored as int32/int16 numpy arrays
+(metadata.npz in the index bundle). A filter such as
+
+    section:examination page:40-62
+
+is turned into a FAISS IDSelectorBitmap, so the flat index only computes
+distances for matching chunks: a narrow filter makes search cheaper rather
+than over-fetching and discarding. Section bitmaps are precomputed at load
+time and parsed filters are cached.
+
+Chunks collapsed by ingestion's near-duplicate pass keep every page span they
+appeared on, as CSR arrays (occurrence_offsets into occurrence_page_start /
+occurrence_page_end). Page and section filters both test every occurrence
+against the requested pages (sections keep their page ranges for this), so
+repeated text matches on any page it appeared on, and a chunk spanning a
+section boundary belongs to both sections.
+
+Sections are derived from the PDF at ingestion (its outline, or headings
+found by font size; see ingestion.read_pdf_sections) and named by slugging
+their titles, e.g. "examination-rules". An optional JSON file mapping names
+to inclusive page ranges, e.g. {"examination": [40, 62]}, overrides or adds
+to them. A filter name matches a section of that name, or else every section
+whose name contains it as whole words: section:examination also selects
+"examination-rules", but not "examinations".
+"""
+import json
+import os
+import re
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+SECTIONS_PATH = os.getenv("SRB_SECTIONS_PATH", "sections.json")
+NO_SECTION = -1
+PAGE_RANGE_RE = re.compile(r"^(-?\d+)(?:-(-?\d+))?$")
+
+
+class FilterError(ValueError):
+    """Raised for malformed filters or filters the index can't satisfy."""
+
+
+def load_sections(path=SECTIONS_PATH) -> dict:
+    """Reads {section_name: [first_page, last_page]}; returns {} if the file doesn't exist."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        sections = json.load(f)
+    return {name.lower(): (int(first), int(last)) for name, (first, last) in sections.items()}
+
+
+def parse_filter(filter_text: str) -> dict:
+    """Parses 'section:a,b page:10-20' into {"sections": [...], "pages": (lo, hi)}.
+
+    Terms are ANDed; comma-separated section names are ORed.
+    """
+    parsed = {"sections": None, "pages": None}
+    for term in filter_text.split():
+        key, sep, value = term.partition(":")
+        key = key.lower()
+        if not sep or not value:
+            raise FilterError(f"Invalid filter term '{term}', expected key:value")
+        if key == "section":
+            parsed["sections"] = [name.lower() for name in value.split(",") if name]
+        elif key == "page":
+            # Front-matter pages are numbered negatively, so allow "page:-3--1"
+            match = PAGE_RANGE_RE.match(value)
+            if not match:
+                raise FilterError(f"Invalid page range '{value}'")
+            first, last = match.groups()
+            parsed["pages"] = (int(first), int(last or first))
+        else:
+            raise FilterError(f"Unknown filter key '{key}', expected 'section' or 'page'")
+    return parsed
+
+
+class ChunkMetadata:
+    """Typed per-chunk arrays plus cached FAISS selectors for filter strings."""
+
+    def __init__(self, page_start, page_end, section_ids, section_names, cache_size=128,
+                 occurrence_offsets=None, occurrence_page_start=None, occurrence_page_end=None,
+                 section_page_start=None, section_page_end=None):
+        self.page_start = np.asarray(page_start, dtype=np.int32)
+        self.page_end = np.asarray(page_end, dtype=np.int32)
+        self.section_ids = np.asarray(section_ids, dtype=np.int16)
+        self.section_names = list(section_names)
+        if occurrence_offsets is None:
+            # One occurrence per chunk: its own span
+            occurrence_offsets = np.arange(len(self.page_start) + 1)
+            occurrence_page_start, occurrence_page_end = self.page_start, self.page_end
+        self.occurrence_offsets = np.asarray(occurrence_offsets, dtype=np.int32)
+        self.occurrence_page_start = np.asarray(occurrence_page_start, dtype=np.int32)
+        self.occurrence_page_end = np.asarray(occurrence_page_end, dtype=np.int32)
+        if section_page_start is not None:
+            # A chunk is in a section if any of its occurrences overlaps the section's pages
+            self.section_page_start = np.asarray(section_page_start, dtype=np.int32)
+            self.section_page_end = np.asarray(section_page_end, dtype=np.int32)
+            self._section_masks = {
+                name: self._overlaps(first, last)
+                for name, first, last in zip(self.section_names, self.section_page_start, self.section_page_end)
+            }
+        else:
+            # Metadata saved without section ranges only knows each chunk's first section
+            self.section_page_start = self.section_page_end = None
+            self._section_masks = {
+                name: self.section_ids == section_id for section_id, name in enumerate(self.section_names)
+            }
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self):
+        return len(self.page_start)
+
+    def occurrence_counts(self) -> np.ndarray:
+        return np.diff(self.occurrence_offsets)
+
+    def _overlaps(self, first, last) -> np.ndarray:
+        """Per chunk: whether any of its occurrences overlaps pages first..last."""
+        overlaps = (self.occurrence_page_end >= first) & (self.occurrence_page_start <= last)
+        if not len(self):
+            return np.zeros(0, dtype=bool)
+        return np.logical_or.reduceat(overlaps, self.occurrence_offsets[:-1])
+
+    @classmethod
+    def from_chunks(cls, chunks, sections=None):
+        """Builds metadata from chunk dicts (page_number or page_start/page_end, optional occurrences).
+
+        section_ids records the section a chunk starts in; section filters use
+        the section page ranges against every occurrence, like page filters.
+        """
+        sections = sections or {}
+        names = list(sections)
+        page_start = np.array([c.get("page_start", c["page_number"]) for c in chunks], dtype=np.int32)
+        page_end = np.array([c.get("page_end", c["page_number"]) for c in chunks], dtype=np.int32)
+        section_ids = np.full(len(chunks), NO_SECTION, dtype=np.int16)
+        # Later sections win if ranges overlap; assign vectorized per section
+        for section_id, (first, last) in enumerate(sections.values()):
+            section_ids[(page_start >= first) & (page_start <= last)] = section_id
+
+        spans = [c.get("occurrences") or [[start, end]] for c, start, end in zip(chunks, page_start, page_end)]
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int32)
+        np.cumsum([len(s) for s in spans], out=offsets[1:])
+        flat = np.array([span for s in spans for span in s], dtype=np.int32).reshape(-1, 2)
+        ranges = np.array(list(sections.values()), dtype=np.int32).reshape(-1, 2)
+        return cls(page_start, page_end, section_ids, names,
+                   occurrence_offsets=offsets, occurrence_page_start=flat[:, 0], occurrence_page_end=flat[:, 1],
+                   section_page_start=ranges[:, 0], section_page_end=ranges[:, 1])
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                page_start=self.page_start,
+                page_end=self.page_end,
+                section_ids=self.section_ids,
+                section_names=np.array(self.section_names, dtype=str),
+                occurrence_offsets=self.occurrence_offsets,
+                occurrence_page_start=self.occurrence_page_start,
+                occurrence_page_end=self.occurrence_page_end,
+                **({} if self.section_page_start is None else
+                   {"section_page_start": self.section_page_start, "section_page_end": self.section_page_end}),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            # Bundles written before deduplication have no occurrence arrays, older ones no section ranges
+            optional = {name: data[name] for name in
+                        ("occurrence_offsets", "occurrence_page_start", "occurrence_page_end",
+                         "section_page_start", "section_page_end") if name in data}
+            return cls(data["page_start"], data["page_end"], data["section_ids"], data["section_names"].tolist(),
+                       **optional)
+
+    def resolve_section(self, name: str) -> list:
+        """Section names a filter value selects: an exact match, else those containing it as whole words."""
+        if name in self._section_masks:
+            return [name]
+        return [section for section in self.section_names if f"-{name}-" in f"-{section}-"]
+
+    def mask(self, filter_text: str) -> np.ndarray:
+        parsed = parse_filter(filter_text)
+        mask = np.ones(len(self), dtype=bool)
+        if parsed["sections"] is not None:
+            resolved = {name: self.resolve_section(name) for name in parsed["sections"]}
+            unknown = [name for name, sections in resolved.items() if not sections]
+            if unknown:
+                raise FilterError(f"Unknown section(s) {unknown}; available: {self.section_names}")
+            section_mask = np.zeros(len(self), dtype=bool)
+            for sections in resolved.values():
+                for section in sections:
+                    section_mask |= self._section_masks[section]
+            mask &= section_mask
+        if parsed["pages"] is not None:
+            # A chunk matches if any of its occurrences overlaps the range
+            mask &= self._overlaps(*parsed["pages"])
+        return mask
+
+    def selector(self, filter_text: str):
+        """Returns a cached (IDSelectorBitmap, match_count) for the filter.
+
+        The packed bitmap is attached to the selector, since FAISS only holds
+        a raw pointer to it and the selector may outlive its cache entry.
+        """
+        key = " ".join(sorted(filter_text.lower().split()))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        mask = self.mask(filter_text)
+        count = int(mask.sum())
+        if count == 0:
+            raise FilterError(f"Filter '{filter_text}' matches no chunks")
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        selector.referenced_objects = [bitmap]
+        self._cache[key] = (selector, count)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return selector, count
+
+
+def search_params_for(index, selector):
+    """Wraps an id selector in the search parameters the index type expects."""
+    params = faiss.SearchParameters(sel=selector)
+    if isinstance(index, faiss.IndexPreTransform):
+        wrapped = faiss.SearchParametersPreTransform(index_params=params)
+        wrapped.referenced_objects = [params]  # FAISS only keeps a raw pointer
+        return wrapped
+    return params
@@ -0,0 +1,52 @@
+"""Precompresses the built frontend so the server never compresses per request.
+
+Usage:
+    python compress_static.py static
+
+Writes .gz (and .br when the brotli package is installed) next to every
+compressible file; static_files.PrecompressedStaticFiles serves them.
+"""
+import argparse
+import gzip
+import os
+
+from static_files import BROTLI_AVAILABLE, brotli
+
+COMPRESSIBLE_EXTENSIONS = {".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".xml", ".ico"}
+MIN_SIZE = 1024
+
+
+def compress_directory(directory: str) -> list:
+    """Compresses files in place; returns (path, original, gzip, brotli) sizes."""
+    results = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS or os.path.getsize(path) < MIN_SIZE:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+
+            row = [path, len(data), None, None]
+            variants = [(".gz", 2, gzip.compress(data, compresslevel=9, mtime=0))]
+            if BROTLI_AVAILABLE:
+                variants.append((".br", 3, brotli.compress(data, quality=11)))
+            for suffix, column, compressed in variants:
+                # Only keep variants that actually save bytes
+                if len(compressed) < len(data):
+                    with open(path + suffix, "wb") as f:
+                        f.write(compressed)
+                    row[column] = len(compressed)
+            results.append(tuple(row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompress static frontend assets.")
+    parser.add_argument("directory", nargs="?", default="static")
+    args = parser.parse_args()
+
+    if not BROTLI_AVAILABLE:
+        print("⚠️ brotli not installed; writing gzip variants only.")
+    for path, size, gz_size, br_size in compress_directory(args.directory):
+        print(f"{path}: {size} B -> gzip {gz_size or '-'} B, brotli {br_size or '-'} B")
@@ -0,0 +1,139 @@
+"""Embedding service mode: SentenceTransformer encoding in worker processes.
+
+Query encoding is CPU-heavy PyTorch work. Run in the server process it holds
+the GIL long enough to make SSE streams stutter. EmbeddingPool starts a few
+spawned worker processes that each load the model once; callers send texts
+over a pipe and get float32 vectors back as raw bytes. The pool exposes the
+same encode() call as SentenceTransformer, so it can be passed anywhere an
+embedding_model is expected.
+"""
+import multiprocessing
+import os
+import queue
+
+import numpy as np
+
+
+def _worker_main(model_name, device, num_threads, conn):
+    """Worker loop: load the model once, then encode requests until told to stop."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(num_threads)
+    model = SentenceTransformer(model_name, device=device)
+    conn.send(("ready", model.get_sentence_embedding_dimension()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        texts, batch_size = message
+        try:
+            vectors = np.asarray(
+                model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False),
+                dtype=np.float32,
+            )
+            conn.send_bytes(vectors.tobytes())
+        except Exception as e:
+            conn.send_bytes(b"")
+            conn.send(str(e))
+    conn.close()
+
+
+class EmbeddingPool:
+    """A pool of model-holding worker processes with a SentenceTransformer-like encode()."""
+
+    def __init__(self, model_name, workers=2, device="cpu", threads_per_worker=None):
+        self.model_name = model_name
+        self.device = device
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.dimension = None
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [self._spawn(slot) for slot in range(workers)]
+        self._idle = queue.Queue()
+        # Workers load the model in parallel; wait for all of them before serving
+        for slot in range(workers):
+            self._wait_ready(slot)
+            self._idle.put(slot)
+
+    def _spawn(self, slot):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.model_name, self.device, self.threads_per_worker, child_conn),
+            name=f"embedding-worker-{slot}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _wait_ready(self, slot):
+        process, conn = self._workers[slot]
+        try:
+            _, self.dimension = conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Embedding worker {slot} exited while loading '{self.model_name}'")
+
+    def _restart(self, slot):
+        process, _ = self._workers[slot]
+        process.kill()
+        self._workers[slot] = self._spawn(slot)
+        self._wait_ready(slot)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Encodes texts in a worker process; blocks the calling thread, not the GIL.
+
+        Extra SentenceTransformer keyword arguments (convert_to_tensor,
+        show_progress_bar, ...) are accepted for compatibility and ignored.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        slot = self._idle.get()
+        try:
+            process, conn = self._workers[slot]
+            try:
+                conn.send((texts, batch_size))
+                payload = conn.recv_bytes()
+            except (EOFError, OSError):
+                # The worker died (OOM, killed); replace it and retry once
+                self._restart(slot)
+                process, conn = self._workers[slot]
+                conn.send((texts, batch_size))
+                payload = conn.recv_bytes()
+            if not payload:
+                raise RuntimeError(f"Embedding worker failed: {conn.recv()}")
+        finally:
+            self._idle.put(slot)
+
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(len(texts), self.dimension)
+        return vectors[0] if single else vectors
+
+    def close(self):
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process, _ in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+
+
+def load_embedding_model(model_name, device="cpu"):
+    """Returns an EmbeddingPool when EMBEDDING_WORKERS > 0, else an in-process SentenceTransformer."""
+    workers = int(os.getenv("EMBEDDING_WORKERS", "0"))
+    if workers > 0:
+        print(f"🧵 Starting {workers} embedding worker process(es)...")
+        return EmbeddingPool(model_name, workers=workers, device=device)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
@@ -0,0 +1,311 @@
+"""Versioned index bundles with atomic activation and hot-swap.
+
+A bundle is a directory under bundles/ holding the FAISS index, the chunk
+store and a manifest (model name, embedding dimension, chunk count and file
+checksums). bundles/CURRENT names the active version and is replaced
+atomically, so servers never see a half-written index. BundleManager keeps
+the loaded bundle in memory and swaps in freshly built ones; requests that
+already grabbed the old bundle keep using it until they finish.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import faiss
+
+from chunk_metadata import ChunkMetadata, FilterError
+
+BUNDLES_DIR = os.getenv("INDEX_BUNDLES_DIR", "bundles")
+CURRENT_POINTER = "CURRENT"
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.pkl"
+METADATA_FILE = "metadata.npz"
+MANIFEST_FILE = "manifest.json"
+LEGACY_INDEX_PATH = "faiss_index.bin"
+LEGACY_SENTENCES_PATH = "sentences.pkl"
+LEGACY_METADATA_PATH = "chunk_metadata.npz"
+BUNDLE_FORMAT = 1
+
+
+class BundleError(ValueError):
+    """Raised when a bundle is missing files or fails validation."""
+
+
+@dataclass
+class IndexBundle:
+    version: str
+    index: faiss.Index
+    sentences: list
+    manifest: dict = field(default_factory=dict)
+    path: str = None
+    metadata: ChunkMetadata = None
+
+    def selector(self, filter_text):
+        """Returns the FAISS id selector for a chunk filter, or None for no filter."""
+        if not filter_text or not filter_text.strip():
+            return None
+        if self.metadata is None:
+            raise FilterError("This index has no chunk metadata; rebuild it with preprocess.py to use filters")
+        selector, _ = self.metadata.selector(filter_text)
+        return selector
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def index_storage_dim(index) -> int:
+    """Dimension of the stored vectors (smaller than index.d for reduced indexes)."""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index).d
+    return index.d
+
+
+def write_bundle(index, sentences, model_name, bundles_dir=BUNDLES_DIR, extra=None, metadata=None) -> str:
+    """Writes index + chunks + manifest to a new version directory and returns its path.
+
+    Files are written to a hidden temp directory first and renamed into place,
+    so a crashed build never leaves a partial bundle behind.
+    """
+    version = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    tmp_path = os.path.join(bundles_dir, f".tmp-{version}")
+    os.makedirs(tmp_path)
+    try:
+        faiss.write_index(index, os.path.join(tmp_path, INDEX_FILE))
+        with open(os.path.join(tmp_path, CHUNKS_FILE), "wb") as f:
+            pickle.dump(sentences, f)
+        files = [INDEX_FILE, CHUNKS_FILE]
+        if metadata is not None:
+            metadata.save(os.path.join(tmp_path, METADATA_FILE))
+            files.append(METADATA_FILE)
+
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "model_name": model_name,
+            "embedding_dim": index.d,
+            "index_dim": index_storage_dim(index),
+            "chunk_count": index.ntotal,
+            "files": {
+                name: {
+                    "sha256": file_sha256(os.path.join(tmp_path, name)),
+                    "bytes": os.path.getsize(os.path.join(tmp_path, name)),
+                }
+                for name in files
+            },
+        }
+        manifest.update(extra or {})
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        path = os.path.join(bundles_dir, version)
+        os.rename(tmp_path, path)
+        return path
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise BundleError(f"No manifest in bundle '{path}'")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def load_bundle(path: str, model_name: str = None, verify_checksums=True) -> IndexBundle:
+    """Loads and validates a bundle directory.
+
+    Checks file checksums, that index and chunk store agree on the chunk count,
+    and (if given) that the bundle was built with the serving model.
+    """
+    manifest = read_manifest(path)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')} in '{path}'")
+    if model_name and manifest.get("model_name") != model_name:
+        raise BundleError(f"Bundle built with '{manifest.get('model_name')}', server uses '{model_name}'")
+
+    for name, info in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise BundleError(f"Bundle '{path}' is missing {name}")
+        if verify_checksums and file_sha256(file_path) != info["sha256"]:
+            raise BundleError(f"Checksum mismatch for {name} in '{path}'")
+
+    index = faiss.read_index(os.path.join(path, INDEX_FILE))
+    with open(os.path.join(path, CHUNKS_FILE), "rb") as f:
+        sentences = pickle.load(f)
+
+    if index.ntotal != manifest["chunk_count"] or len(sentences) != manifest["chunk_count"]:
+        raise BundleError(
+            f"Chunk count mismatch in '{path}': manifest {manifest['chunk_count']}, "
+            f"index {index.ntotal}, chunks {len(sentences)}"
+        )
+    if index.d != manifest["embedding_dim"]:
+        raise BundleError(f"Embedding dim mismatch in '{path}': manifest {manifest['embedding_dim']}, index {index.d}")
+
+    metadata = None
+    if METADATA_FILE in manifest["files"]:
+        metadata = ChunkMetadata.load(os.path.join(path, METADATA_FILE))
+        if len(metadata) != index.ntotal:
+            raise BundleError(f"Metadata covers {len(metadata)} chunks, index has {index.ntotal} in '{path}'")
+
+    return IndexBundle(
+        version=manifest["version"], index=index, sentences=sentences, manifest=manifest, path=path, metadata=metadata
+    )
+
+
+def load_legacy_bundle(index_path=LEGACY_INDEX_PATH, sentences_path=LEGACY_SENTENCES_PATH,
+                       metadata_path=LEGACY_METADATA_PATH) -> IndexBundle:
+    """Wraps the top-level faiss_index.bin / sentences.pkl (+ chunk_metadata.npz) files as a bundle."""
+    index = faiss.read_index(index_path)
+    with open(sentences_path, "rb") as f:
+        sentences = pickle.load(f)
+    metadata = None
+    if metadata_path and os.path.exists(metadata_path):
+        metadata = ChunkMetadata.load(metadata_path)
+        if len(metadata) != index.ntotal:
+            print(f"⚠️ Ignoring '{metadata_path}': {len(metadata)} entries for {index.ntotal} chunks")
+            metadata = None
+    manifest = {"version": "legacy", "embedding_dim": index.d, "chunk_count": index.ntotal}
+    return IndexBundle(version="legacy", index=index, sentences=sentences, manifest=manifest, metadata=metadata)
+
+
+def current_version(bundles_dir=BUNDLES_DIR):
+    pointer = os.path.join(bundles_dir, CURRENT_POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip() or None
+
+
+def active_source_sha256(bundles_dir=BUNDLES_DIR):
+    """sha256 of the source PDF the active bundle was built from, or None if unknown."""
+    version = current_version(bundles_dir)
+    if not version:
+        return None
+    try:
+        return (read_manifest(os.path.join(bundles_dir, version)).get("source") or {}).get("sha256")
+    except BundleError:
+        return None
+
+
+def activate_bundle(path: str, bundles_dir=BUNDLES_DIR):
+    """Atomically points bundles/CURRENT at the given bundle."""
+    pointer = os.path.join(bundles_dir, CURRENT_POINTER)
+    tmp_pointer = f"{pointer}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_pointer, "w") as f:
+        f.write(os.path.basename(path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+
+
+def prune_bundles(bundles_dir=BUNDLES_DIR, keep=3):
+    """Deletes all but the newest `keep` bundles, never the active one."""
+    active = current_version(bundles_dir)
+    versions = sorted(
+        name for name in os.listdir(bundles_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(bundles_dir, name))
+    )
+    for name in versions[:-keep] if keep else versions:
+        if name != active:
+            shutil.rmtree(os.path.join(bundles_dir, name), ignore_errors=True)
+
+
+def load_current_bundle(bundles_dir=BUNDLES_DIR, model_name=None) -> IndexBundle:
+    """Loads the active bundle, falling back to the legacy files if there is none."""
+    version = current_version(bundles_dir)
+    if version:
+        return load_bundle(os.path.join(bundles_dir, version), model_name=model_name)
+    if os.path.exists(LEGACY_INDEX_PATH) and os.path.exists(LEGACY_SENTENCES_PATH):
+        return load_legacy_bundle()
+    raise BundleError("No index bundle or preprocessed files found. Run preprocess.py first.")
+
+
+def build_bundle(pdf_path, embedding_model, model_name, bundles_dir=BUNDLES_DIR,
+                 reduce_dim=None, reduction="pca", dedupe=True, dedupe_threshold=0.85, **chunker_kwargs) -> str:
+    """Runs the ingestion pipeline on the PDF and writes the result as a new bundle."""
+    from ingestion import open_and_read_pdf, token_chunker, dedupe_chunks, build_faiss_index, document_sections
+    pages_and_texts = open_and_read_pdf(pdf_path)
+    chunks = token_chunker(pages_and_texts, **chunker_kwargs)
+    dedupe_stats = None
+    if dedupe:
+        chunks, dedupe_stats = dedupe_chunks(chunks, threshold=dedupe_threshold)
+    metadata = ChunkMetadata.from_chunks(chunks, document_sections(pdf_path))
+    _, index, sentence_texts = build_faiss_index(
+        chunks, model_name=model_name, embedding_model=embedding_model, reduce_dim=reduce_dim, reduction=reduction
+    )
+    extra = {
+        "source": {"path": os.path.basename(pdf_path), "sha256": file_sha256(pdf_path)},
+        "chunker": {"name": "tokens", **chunker_kwargs},
+        "reduction": {"method": reduction, "dim": reduce_dim} if reduce_dim else None,
+        "dedupe": dedupe_stats,
+    }
+    return write_bundle(index, sentence_texts, model_name, bundles_dir, extra=extra, metadata=metadata)
+
+
+class BundleManager:
+    """Holds the serving bundle and rebuilds/swaps it on a background thread."""
+
+    def __init__(self, model_name, bundles_dir=BUNDLES_DIR):
+        self.model_name = model_name
+        self.bundles_dir = bundles_dir
+        self.current = None
+        self.job = {"state": "idle"}
+        self._job_lock = threading.Lock()
+
+    def load(self) -> IndexBundle:
+        self.current = load_current_bundle(self.bundles_dir, self.model_name)
+        return self.current
+
+    def swap(self, bundle: IndexBundle):
+        """Replaces the serving bundle; a single reference assignment is atomic."""
+        self.current = bundle
+
+    def start_reindex(self, pdf_path, embedding_model, **chunker_kwargs) -> bool:
+        """Starts a rebuild in a background thread; returns False if one is already running."""
+        with self._job_lock:
+            if self.job["state"] == "running":
+                return False
+            self.job = {"state": "running", "started_at": time.time()}
+        thread = threading.Thread(
+            target=self._reindex, args=(pdf_path, embedding_model), kwargs=chunker_kwargs,
+            name="reindex", daemon=True
+        )
+        thread.start()
+        return True
+
+    def _reindex(self, pdf_path, embedding_model, **chunker_kwargs):
+        try:
+            os.makedirs(self.bundles_dir, exist_ok=True)
+            path = build_bundle(pdf_path, embedding_model, self.model_name, self.bundles_dir, **chunker_kwargs)
+            bundle = load_bundle(path, model_name=self.model_name)
+
+            # Smoke-test the new index with a real query before it serves traffic
+            probe = embedding_model.encode(["attendance requirements"])
+            _, indices = bundle.index.search(probe, 1)
+            if bundle.index.ntotal == 0 or indices[0][0] < 0:
+                raise BundleError(f"Bundle '{path}' returned no results for a probe query")
+
+            activate_bundle(path, self.bundles_dir)
+            previous = self.current.version if self.current else None
+            self.swap(bundle)
+            prune_bundles(self.bundles_dir)
+            self.job = {"state": "succeeded", "version": bundle.version, "previous": previous, "finished_at": time.time()}
+            print(f"✅ Swapped in index bundle {bundle.version} ({bundle.index.ntotal} chunks).")
+        except Exception as e:
+            print(f"❌ Reindex failed: {e}")
+            self.job = {"state": "failed", "error": str(e), "finished_at": time.time()}
@@ -0,0 +1,467 @@
+"""Ingestion-time pipeline: PDF reading, sentence splitting, chunking, index building.
+
+Only preprocess.py, reindex jobs and the benchmarks need this module. Its
+heavy dependencies (PyMuPDF, spaCy, tqdm, SentenceTransformers, requests) are
+imported on first use, so importing it just to check availability, or for
+download_pdf (see source_fetcher.py), stays cheap. Serving code lives in rag_pipeline.py.
+"""
+import os
+import re
+import time
+import zlib
+from importlib.util import find_spec
+
+import faiss
+import numpy as np
+
+from chunk_metadata import SECTIONS_PATH, load_sections
+
+# Optional dependencies for PDF processing (not needed if using preprocessed files)
+PDF_PROCESSING_AVAILABLE = all(find_spec(name) is not None for name in ("fitz", "tqdm", "spacy"))
+# The SRB's page 1 is the fourth page of the PDF; front matter gets negative numbers
+PAGE_NUMBER_OFFSET = -3
+
+
+def _sentencizer():
+    from spacy.lang.en import English
+    nlp = English()
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def text_formatter(text: str) -> str:
+    """Performs minor formatting on text."""
+    cleaned_text = text.replace("\n", " ").strip()
+    return cleaned_text
+
+
+def open_and_read_pdf(pdf_path: str) -> list[dict]:
+    """Reads PDF pages into a structured list of dicts."""
+    if not PDF_PROCESSING_AVAILABLE:
+        raise ImportError("PDF processing libraries not available. Use preprocessed files instead.")
+    import fitz  # PyMuPDF
+    from tqdm.auto import tqdm
+    doc = fitz.open(pdf_path)
+    pages_and_texts = []
+    for page_number, page in tqdm(enumerate(doc), total=len(doc), desc="Reading PDF"):
+        text = page.get_text()
+        text = text_formatter(text)
+        pages_and_texts.append({
+            "page_number": page_number + PAGE_NUMBER_OFFSET,
+            "page_char_count": len(text),
+            "page_word_count": len(text.split(" ")),
+            "page_sentence_count_raw": len(text.split(". ")),
+            "page_token_count": len(text) / 4,
+            "text": text
+        })
+    return pages_and_texts
+
+
+_ROMAN_RE = re.compile(r"^(?=[ivx])x{0,3}(ix|iv|v?i{0,3})$")
+
+
+def section_slug(title: str) -> str:
+    """'Chapter 5: Examination Rules' -> 'examination-rules', usable as a section: filter value."""
+    words = re.sub(r"[^a-z0-9]+", " ", title.lower()).split()
+    # Drop leading numbering ("5", "5.2", "IV", "Chapter 3") but keep at least one word
+    while len(words) > 1 and (words[0] in ("chapter", "section", "part") or words[0].isdigit()
+                              or _ROMAN_RE.match(words[0])):
+        words.pop(0)
+    return "-".join(words)
+
+
+def sections_from_headings(headings, page_count, page_offset=PAGE_NUMBER_OFFSET) -> dict:
+    """Turns [(title, 0-based page index)] in reading order into {slug: (first_page, last_page)}.
+
+    Each section runs until the page before the next heading (or the same
+    page, if the next one starts there), the last one to the end of the PDF.
+    Repeated titles get a numeric suffix.
+    """
+    sections = {}
+    for i, (title, start) in enumerate(headings):
+        next_start = headings[i + 1][1] if i + 1 < len(headings) else page_count
+        end = max(start, next_start - 1)
+        name = base = section_slug(title)
+        if not name:
+            continue
+        suffix = 2
+        while name in sections:
+            name, suffix = f"{base}-{suffix}", suffix + 1
+        sections[name] = (start + page_offset, end + page_offset)
+    return sections
+
+
+def _outline_headings(doc):
+    # The shallowest outline level with more than one entry; a lone level-1 entry is usually the title
+    toc = [(level, title, page - 1) for level, title, page, *_ in doc.get_toc() if page >= 1]
+    for level in sorted({level for level, _, _ in toc}):
+        headings = [(title, page) for entry_level, title, page in toc if entry_level == level]
+        if len(headings) > 1:
+            return headings
+    return []
+
+
+def _font_headings(doc, min_ratio=1.2, max_chars=80):
+    # Lines set noticeably larger than the body text; the largest such size used
+    # on at least two pages is taken as the chapter heading style
+    lines, size_chars = [], {}
+    for page_index, page in enumerate(doc):
+        for block in page.get_text("dict")["blocks"]:
+            for line in block.get("lines", []):
+                spans = [span for span in line["spans"] if span["text"].strip()]
+                if not spans:
+                    continue
+                size = round(max(span["size"] for span in spans) * 2) / 2
+                text = " ".join(span["text"].strip() for span in spans)
+                lines.append((page_index, size, text))
+                for span in spans:
+                    span_size = round(span["size"] * 2) / 2
+                    size_chars[span_size] = size_chars.get(span_size, 0) + len(span["text"])
+    if not lines:
+        return []
+    body_size = max(size_chars, key=size_chars.get)
+    candidates = [(page, size, text) for page, size, text in lines
+                  if size >= body_size * min_ratio and len(text) <= max_chars and re.search(r"[A-Za-z]", text)]
+    for heading_size in sorted({size for _, size, _ in candidates}, reverse=True):
+        first_per_page = {}
+        for page, size, text in candidates:
+            if size == heading_size:
+                first_per_page.setdefault(page, text)
+        if len(first_per_page) > 1:
+            return [(text, page) for page, text in sorted(first_per_page.items())]
+    return []
+
+
+def read_pdf_sections(pdf_path: str) -> dict:
+    """Derives {section_name: (first_page, last_page)} from the PDF, in the page numbering of open_and_read_pdf.
+
+    Uses the PDF outline (bookmarks) if it has one, otherwise headings found
+    by font size. Returns {} if neither yields more than one section.
+    """
+    if not PDF_PROCESSING_AVAILABLE:
+        raise ImportError("PDF processing libraries not available. Use preprocessed files instead.")
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        headings, source = _outline_headings(doc), "outline"
+        if not headings:
+            headings, source = _font_headings(doc), "headings"
+        sections = sections_from_headings(headings, len(doc))
+    if sections:
+        print(f"Found {len(sections)} sections in the PDF {source}.")
+    return sections
+
+
+def document_sections(pdf_path: str, sections_path=None) -> dict:
+    """Sections derived from the PDF, overridden and extended by a sections JSON file if there is one."""
+    configured = load_sections(SECTIONS_PATH if sections_path is None else sections_path)
+    return {**read_pdf_sections(pdf_path), **configured}
+
+
+def sentence_splitter(pages_and_texts, chunk_size=5):
+    if not PDF_PROCESSING_AVAILABLE:
+        raise ImportError("Text processing libraries not available. Use preprocessed files instead.")
+    from tqdm.auto import tqdm
+    nlp = _sentencizer()
+    chunks = []
+
+    for item in tqdm(pages_and_texts, desc="Splitting into sentence chunks"):
+        doc = nlp(item["text"])
+        sents = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        
+        for i in range(0, len(sents), chunk_size):
+            chunk = " ".join(sents[i:i + chunk_size])
+            chunks.append({
+                "page_number": item["page_number"],
+                "sentence_chunk": chunk
+            })
+
+    return chunks
+
+
+def estimate_tokens(text: str) -> float:
+    """Rough token estimate (~4 characters per token), same as page_token_count."""
+    return len(text) / 4
+
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> list[str]:
+    """Splits a sentence that exceeds max_tokens on word boundaries."""
+    pieces, current, current_tokens = [], [], 0.0
+    for word in sentence.split(" "):
+        word_tokens = estimate_tokens(word) + 0.25
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0.0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def check_chunk_sizes(max_tokens, min_tokens, overlap_tokens):
+    """Raises ValueError for token_chunker settings that would repeat text across chunks."""
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    # A chunk no longer than the overlap carried into it adds nothing its predecessor didn't hold
+    if overlap_tokens > 0 and overlap_tokens >= min_tokens:
+        raise ValueError("overlap_tokens must be smaller than min_tokens")
+
+
+def token_chunker(pages_and_texts, max_tokens=256, min_tokens=64, overlap_tokens=32,
+                  respect_pages=False, batch_size=32):
+    """Packs sentences into chunks of roughly min_tokens..max_tokens with overlap.
+
+    All pages are sentence-split in batches with nlp.pipe, then chunk boundaries
+    are found with searchsorted over cumulative token counts. Each chunk records
+    the span of pages it covers (page_start..page_end). With respect_pages=True
+    chunks never cross a page and pages that already fit in one chunk skip the
+    sentencizer. A chunk smaller than min_tokens (say, a short sentence before
+    one too long to join it) is merged into the next chunk, or into the
+    previous one if it is the last before the end or a page boundary, so
+    max_tokens is a soft cap. Only a page shorter than min_tokens with
+    respect_pages=True stays a short chunk.
+    """
+    check_chunk_sizes(max_tokens, min_tokens, overlap_tokens)
+    if not PDF_PROCESSING_AVAILABLE:
+        raise ImportError("Text processing libraries not available. Use preprocessed files instead.")
+    from tqdm.auto import tqdm
+    nlp = _sentencizer()
+
+    needs_split = [not (respect_pages and item["page_token_count"] <= max_tokens) for item in pages_and_texts]
+    docs = nlp.pipe((item["text"] for item, split in zip(pages_and_texts, needs_split) if split), batch_size=batch_size)
+
+    units, unit_pages = [], []
+    for item, split in tqdm(zip(pages_and_texts, needs_split), total=len(pages_and_texts), desc="Splitting into sentences"):
+        if split:
+            sents = [sent.text.strip() for sent in next(docs).sents if sent.text.strip()]
+        else:
+            sents = [item["text"]] if item["text"] else []
+        for sent in sents:
+            pieces = [sent] if estimate_tokens(sent) <= max_tokens else _split_long_sentence(sent, max_tokens)
+            units.extend(pieces)
+            unit_pages.extend([item["page_number"]] * len(pieces))
+
+    if not units:
+        return []
+
+    n_units = len(units)
+    pages = np.array(unit_pages)
+    cumulative = np.concatenate([[0.0], np.cumsum([estimate_tokens(u) for u in units])])
+    if respect_pages:
+        # For every unit, the index one past the last unit on its page
+        boundaries = np.append(np.flatnonzero(np.diff(pages)) + 1, n_units)
+        group_end = boundaries[np.searchsorted(boundaries, np.arange(n_units), side="right")]
+    else:
+        group_end = np.full(n_units, n_units)
+
+    spans = []
+    start = 0
+    while start < n_units:
+        limit = int(group_end[start])
+        end = int(np.searchsorted(cumulative, cumulative[start] + max_tokens, side="right")) - 1
+        end = min(max(end, start + 1), limit)
+        spans.append((start, end))
+
+        if end >= limit:
+            start = limit
+        else:
+            next_start = int(np.searchsorted(cumulative, cumulative[end] - overlap_tokens, side="left"))
+            start = max(next_start, start + 1)
+
+    # Merge chunks below min_tokens into their neighbour within the same group
+    merged = []
+    carry = None  # start of a short chunk waiting to be merged into the next one
+    for i, (start, end) in enumerate(spans):
+        if carry is not None:
+            start, carry = carry, None
+        if cumulative[end] - cumulative[start] < min_tokens:
+            if i + 1 < len(spans) and group_end[spans[i + 1][0]] == group_end[start]:
+                carry = start
+                continue
+            if merged and group_end[merged[-1][0]] == group_end[start]:
+                merged[-1] = (merged[-1][0], end)
+                continue
+        merged.append((start, end))
+
+    chunks = []
+    for start, end in merged:
+        chunks.append({
+            "page_number": int(pages[start]),
+            "page_start": int(pages[start]),
+            "page_end": int(pages[end - 1]),
+            "chunk_token_count": round(float(cumulative[end] - cumulative[start]), 1),
+            "sentence_chunk": " ".join(units[start:end])
+        })
+    return chunks
+
+
+# MinHash permutations are (a*x + b) mod a 31-bit prime so products fit in uint64
+_MINHASH_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+class MinHashDeduper:
+    """Streaming near-duplicate detector: MinHash signatures over word shingles plus LSH banding.
+
+    Texts are fed one at a time; each is compared only against earlier kept
+    texts that share an LSH bucket, and counts as a duplicate if the estimated
+    Jaccard similarity of its shingle set is at least `threshold`. With 128
+    permutations in 16 bands of 8 rows, pairs at Jaccard 0.85 become
+    candidates ~99% of the time.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=128, bands=16, shingle_words=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MINHASH_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MINHASH_PRIME, num_perm, dtype=np.uint64)
+        self._exact = {}
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode()) & _MINHASH_PRIME for s in shingles), dtype=np.uint64,
+                        count=len(shingles))
+        return ((np.outer(x, self._a) + self._b) % _MINHASH_PRIME).min(axis=0)
+
+    def find_or_add(self, text: str):
+        """Returns (kept_id, exact) of the text this duplicates, or (None, False) after keeping it as new."""
+        normalized = " ".join(text.lower().split())
+        if normalized in self._exact:
+            return self._exact[normalized], True
+
+        signature = self.signature(text)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        candidates = set()
+        for bucket, key in zip(self._buckets, band_keys):
+            candidates.update(bucket.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            return best, False
+
+        kept_id = len(self._signatures)
+        self._signatures.append(signature)
+        self._exact[normalized] = kept_id
+        for bucket, key in zip(self._buckets, band_keys):
+            bucket.setdefault(key, []).append(kept_id)
+        return None, False
+
+
+def dedupe_chunks(chunks, threshold=0.85, num_perm=128, bands=16, shingle_words=5):
+    """Collapses exact and near-duplicate chunks, keeping the first occurrence.
+
+    Every kept chunk gets an "occurrences" list of [page_start, page_end]
+    spans, one per place its text (or a near-copy) appeared, so filtered
+    search still finds repeated policy text on every page it was printed.
+    Returns (kept_chunks, stats).
+    """
+    start = time.perf_counter()
+    deduper = MinHashDeduper(threshold, num_perm, bands, shingle_words)
+    kept, exact, near, removed_tokens = [], 0, 0, 0.0
+    for chunk in chunks:
+        page_start = chunk.get("page_start", chunk["page_number"])
+        span = [page_start, chunk.get("page_end", page_start)]
+        kept_id, is_exact = deduper.find_or_add(chunk["sentence_chunk"])
+        if kept_id is None:
+            kept.append({**chunk, "occurrences": [span]})
+            continue
+        if span not in kept[kept_id]["occurrences"]:
+            kept[kept_id]["occurrences"].append(span)
+        exact += is_exact
+        near += not is_exact
+        removed_tokens += estimate_tokens(chunk["sentence_chunk"])
+
+    total_tokens = sum(estimate_tokens(c["sentence_chunk"]) for c in chunks)
+    stats = {
+        "input_chunks": len(chunks),
+        "kept_chunks": len(kept),
+        "exact_duplicates": exact,
+        "near_duplicates": near,
+        "removed_pct": round(100 * (exact + near) / max(len(chunks), 1), 2),
+        "removed_tokens_pct": round(100 * removed_tokens / max(total_tokens, 1), 2),
+        "threshold": threshold,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    print(f"Dedupe: {stats['input_chunks']} -> {stats['kept_chunks']} chunks "
+          f"({exact} exact, {near} near duplicates; {stats['removed_pct']}% of chunks, "
+          f"{stats['removed_tokens_pct']}% of tokens) in {stats['seconds']}s")
+    return kept, stats
+
+
+def make_reduced_index(dim, reduce_dim, reduction="pca"):
+    """Flat L2 index behind a stored dimensionality reduction.
+
+    The transform lives inside the IndexPreTransform, so it is saved with the
+    index and applied to query vectors automatically at search time.
+    "pca" learns a PCA projection (needs train()); "truncate" keeps the first
+    reduce_dim components and re-normalizes (Matryoshka-style).
+    """
+    index = faiss.IndexPreTransform(faiss.IndexFlatL2(reduce_dim))
+    if reduction == "pca":
+        index.prepend_transform(faiss.PCAMatrix(dim, reduce_dim))
+    elif reduction == "truncate":
+        index.prepend_transform(faiss.NormalizationTransform(reduce_dim))
+        index.prepend_transform(faiss.RemapDimensionsTransform(dim, reduce_dim, False))
+    else:
+        raise ValueError(f"Unknown reduction '{reduction}', expected 'pca' or 'truncate'")
+    return index
+
+
+def build_faiss_index(sentences, model_name="all-mpnet-base-v2", embedding_model=None,
+                      reduce_dim=None, reduction="pca"):
+    if embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading embedding model: {model_name}")
+        model = SentenceTransformer(model_name)
+    else:
+        model = embedding_model
+    sentence_texts = [s["sentence_chunk"] for s in sentences]
+    embeddings = np.array(model.encode(sentence_texts, convert_to_tensor=False, show_progress_bar=True), dtype=np.float32)
+
+    dim = embeddings.shape[1]
+    if reduce_dim and reduce_dim < dim:
+        index = make_reduced_index(dim, reduce_dim, reduction)
+        index.train(embeddings)
+        print(f"Reducing embeddings {dim} -> {reduce_dim} dims ({reduction}).")
+    else:
+        index = faiss.IndexFlatL2(dim)
+    index.add(embeddings)
+    print(f"FAISS index built with {index.ntotal} embeddings.")
+    return model, index, sentence_texts
+
+
+SRB_PDF_URL = "https://engineering.nmims.edu/wp-content/uploads/2025/09/SRB-2025-1.pdf"
+
+
+def download_pdf(pdf_path="SRB-2025.pdf", url=SRB_PDF_URL, refresh=False):
+    """Downloads the SRB PDF if it isn't already on disk; refresh=True revalidates an existing copy.
+
+    Streams and resumes via source_fetcher.fetch_source, which raises FetchError on failure.
+    """
+    from source_fetcher import fetch_source
+    return fetch_source(url, pdf_path, refresh=refresh).path
+
+
+def load_models(pdf_path="SRB-2025.pdf"):
+    download_pdf(pdf_path)
+    
+    # Process PDF
+    pages_and_texts = open_and_read_pdf(pdf_path)
+    sentences = token_chunker(pages_and_texts)
+    
+    # Build FAISS index
+    embedding_model, index, sentence_texts = build_faiss_index(sentences)
+    from rag_pipeline import get_client
+    return embedding_model, index, sentence_texts, get_client()
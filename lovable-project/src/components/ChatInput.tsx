@@ -4,12 +4,18 @@ import { Button } from "./ui/button";
 
 interface ChatInputProps {
   onSend: (message: string) => void;
+  onDraftChange?: (draft: string) => void;
   disabled?: boolean;
 }
 
-export const ChatInput = ({ onSend, disabled }: ChatInputProps) => {
+export const ChatInput = ({ onSend, onDraftChange, disabled }: ChatInputProps) => {
   const [input, setInput] = useState("");
 
+  const handleChange = (value: string) => {
+    setInput(value);
+    onDraftChange?.(value);
+  };
+
   const handleSend = () => {
     if (input.trim() && !disabled) {
       onSend(input.trim());
@@ -34,7 +40,7 @@ export const ChatInput = ({ onSend, disabled }: ChatInputProps) => {
         <div className="flex-1 relative">
           <textarea
             value={input}
-            onChange={(e) => setInput(e.target.value)}
+            onChange={(e) => handleChange(e.target.value)}
             onKeyDown={handleKeyPress}
             placeholder="Ask me anything about the SRB (Student Resource Book)..."
             disabled={disabled}
@@ -14,6 +14,19 @@ interface Message {
   timestamp: string;
 }
 
+// Typing-time prefetch: the backend encodes and searches the draft ahead of send
+const PREFETCH_DEBOUNCE_MS = 400;
+const PREFETCH_MIN_CHARS = 12;
+
+// Resuming a dropped /chat/stream from its last event id
+const MAX_RESUME_ATTEMPTS = 5;
+const RESUME_BACKOFF_MS = 500;
+
+const newClientId = () =>
+  typeof crypto !== "undefined" && "randomUUID" in crypto
+    ? crypto.randomUUID()
+    : Math.random().toString(36).slice(2);
+
 const Index = () => {
   const [messages, setMessages] = useState<Message[]>([
     {
@@ -25,6 +38,9 @@ const Index = () => {
   ]);
   const [isTyping, setIsTyping] = useState(false);
   const chatEndRef = useRef<HTMLDivElement>(null);
+  const clientId = useRef(newClientId());
+  const prefetchTimer = useRef<number>();
+  const prefetchedDraft = useRef("");
 
   const scrollToBottom = () => {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -34,7 +50,34 @@ const Index = () => {
     scrollToBottom();
   }, [messages, isTyping]);
 
+  useEffect(() => () => window.clearTimeout(prefetchTimer.current), []);
+
+  const handleDraftChange = (draft: string) => {
+    window.clearTimeout(prefetchTimer.current);
+    const query = draft.trim();
+    if (query.length < PREFETCH_MIN_CHARS) {
+      if (prefetchedDraft.current) {
+        // Draft was cleared: let the server drop our pending prefetch
+        prefetchedDraft.current = "";
+        fetch('/prefetch', { method: 'DELETE', headers: { 'X-Client-Id': clientId.current } }).catch(() => {});
+      }
+      return;
+    }
+    prefetchTimer.current = window.setTimeout(() => {
+      if (query === prefetchedDraft.current) return;
+      prefetchedDraft.current = query;
+      // Best effort: a throttled (429) or failed prefetch just means a cold /chat/stream
+      fetch('/prefetch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-Client-Id': clientId.current },
+        body: JSON.stringify({ message: query }),
+      }).catch(() => {});
+    }, PREFETCH_DEBOUNCE_MS);
+  };
+
   const handleSendMessage = async (content: string) => {
+    window.clearTimeout(prefetchTimer.current);
+    prefetchedDraft.current = "";
     const userMessage: Message = {
       id: Date.now().toString(),
       content,
@@ -58,7 +101,7 @@ const Index = () => {
 
     try {
       // Use fetch with proper streaming (relative URL works for both local and HF Spaces)
-      const response = await fetch('/chat/stream', {
+      let response = await fetch('/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -68,58 +111,103 @@ const Index = () => {
         body: JSON.stringify({ message: content }),
       });
 
+      if (response.status === 429) {
+        // Over this client's rate or the queue is full; the server says when to try again
+        const retryAfter = response.headers.get('Retry-After') ?? 'a few';
+        setMessages(prev => prev.map(msg => 
+          msg.id === botMessageId 
+            ? { ...msg, content: `I'm getting a lot of questions right now. Please try again in ${retryAfter} seconds.` }
+            : msg
+        ));
+        return;
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
       setIsTyping(false); // Stop typing indicator as we start receiving content
       
-      const reader = response.body?.getReader();
-      const decoder = new TextDecoder();
+      // The server keeps generating if we drop; on a network error we resume
+      // after the last event id we saw instead of asking the question again
+      const streamId = response.headers.get('X-Stream-Id');
+      let lastEventId = -1;
       let accumulatedContent = "";
+      let resumeAttempts = 0;
 
-      if (reader) {
-        while (true) {
-          const { done, value } = await reader.read();
-          
-          if (done) break;
-          
-          const chunk = decoder.decode(value, { stream: true });
-          const lines = chunk.split('\n');
-          
-          for (const line of lines) {
-            if (line.startsWith('data: ')) {
-              try {
-                const jsonStr = line.slice(6).trim();
-                if (jsonStr) {
-                  const data = JSON.parse(jsonStr);
-                  
-                  if (data.error) {
-                    throw new Error(data.error);
-                  }
-                  
-                  if (data.chunk && !data.done) {
-                    accumulatedContent += data.chunk;
-                    
-                    // Update the bot message with accumulated content
-                    setMessages(prev => prev.map(msg => 
-                      msg.id === botMessageId 
-                        ? { ...msg, content: accumulatedContent }
-                        : msg
-                    ));
-                  }
+      while (true) {
+        try {
+          const reader = response.body?.getReader();
+          const decoder = new TextDecoder();
+          let buffered = "";
+          if (!reader) return;
+
+          while (true) {
+            const { done, value } = await reader.read();
+            
+            if (done) break;
+            
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop() ?? "";  // keep a partial line for the next read
+            
+            for (const line of lines) {
+              if (line.startsWith('id: ')) {
+                const eventId = Number(line.slice(4));
+                if (!Number.isNaN(eventId)) lastEventId = eventId;
+                continue;
+              }
+              if (line.startsWith('data: ')) {
+                let data;
+                try {
+                  const jsonStr = line.slice(6).trim();
+                  if (!jsonStr) continue;
+                  data = JSON.parse(jsonStr);
+                } catch (e) {
+                  // Skip malformed JSON
+                  console.warn('Failed to parse JSON:', line);
+                  continue;
+                }
+                
+                if (data.error) {
+                  throw new Error(data.error);
+                }
+                
+                if (data.chunk && !data.done) {
+                  accumulatedContent += data.chunk;
                   
-                  if (data.done) {
-                    return; // Streaming complete
-                  }
+                  // Update the bot message with accumulated content
+                  setMessages(prev => prev.map(msg => 
+                    msg.id === botMessageId 
+                      ? { ...msg, content: accumulatedContent }
+                      : msg
+                  ));
+                }
+                
+                if (data.done) {
+                  return; // Streaming complete
                 }
-              } catch (e) {
-                // Skip malformed JSON
-                console.warn('Failed to parse JSON:', line);
-                continue;
               }
             }
           }
+          throw new TypeError('Stream ended before completion');
+        } catch (streamError) {
+          // Errors sent by the server are final; only dropped connections are resumed
+          if (!(streamError instanceof TypeError) || !streamId || resumeAttempts >= MAX_RESUME_ATTEMPTS) {
+            throw streamError;
+          }
+          resumeAttempts += 1;
+          await new Promise(resolve => setTimeout(resolve, RESUME_BACKOFF_MS * resumeAttempts));
+          try {
+            response = await fetch(`/chat/stream/${streamId}`, {
+              headers: { 'Accept': 'text/event-stream', 'Last-Event-ID': String(lastEventId) },
+            });
+          } catch (networkError) {
+            continue;  // still offline; retry with backoff
+          }
+          if (!response.ok) {
+            throw new Error(`Could not resume stream: ${response.status}`);
+          }
         }
       }
     } catch (error) {
@@ -218,7 +306,7 @@ const Index = () => {
 
       {/* Input Area */}
       <div className="relative z-10">
-        <ChatInput onSend={handleSendMessage} disabled={isTyping} />
+        <ChatInput onSend={handleSendMessage} onDraftChange={handleDraftChange} disabled={isTyping} />
       </div>
     </div>
   );
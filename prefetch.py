@@ -0,0 +1,212 @@
+"""Retrieval cache warmed by typing-time prefetches.
+
+While the user types, the frontend posts debounced drafts to /prefetch. The
+engine encodes and searches them ahead of time and keeps the top-k result
+here, keyed by (normalized query, top_k, filter, bundle version). When the
+same question reaches /chat/stream it finds the retrieval warm, or joins the
+in-flight prefetch, and goes straight to Gemini.
+
+Drafts are cheap to send and expensive to serve, so prefetching is bounded
+per client address (the server-side identity, which a caller can't change):
+it may prefetch once every PREFETCH_MIN_INTERVAL seconds and have at most
+PREFETCH_MAX_PENDING_PER_CLIENT prefetches pending. At most
+PREFETCH_CONCURRENCY encodes run at once with PREFETCH_MAX_PENDING waiting
+behind them. The optional tab id (X-Client-Id) only decides which pending
+prefetch a newer draft replaces: a tab's new draft cancels its own older one
+if that hasn't started encoding.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from query_log import normalize_query
+
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "120"))
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "512"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "32"))
+PREFETCH_MIN_INTERVAL = float(os.getenv("PREFETCH_MIN_INTERVAL", "0.3"))
+PREFETCH_MAX_PENDING_PER_CLIENT = int(os.getenv("PREFETCH_MAX_PENDING_PER_CLIENT", "2"))
+
+
+class PrefetchRejected(Exception):
+    """Raised when a prefetch is refused; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Retrieval:
+    sentences: list
+    distances: list
+    indices: list
+    origin: str  # "prefetch" or "retrieval": which path computed it
+    created: float
+
+
+def filter_key(filter_text):
+    """Filter text in a canonical form, so equivalent filters compare equal."""
+    return " ".join(sorted((filter_text or "").lower().split()))
+
+
+def cache_key(query, top_k, filter_text, bundle_version):
+    return (normalize_query(query), top_k, filter_key(filter_text), bundle_version)
+
+
+class RetrievalCache:
+    """TTL'd LRU of retrieval results plus the in-flight prefetch tasks that fill it.
+
+    Lives on one event loop; compute functions run in worker threads.
+    """
+
+    def __init__(self, ttl=PREFETCH_TTL, max_entries=PREFETCH_CACHE_SIZE, concurrency=PREFETCH_CONCURRENCY,
+                 max_pending=PREFETCH_MAX_PENDING, min_interval=PREFETCH_MIN_INTERVAL,
+                 max_pending_per_client=PREFETCH_MAX_PENDING_PER_CLIENT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+        self.min_interval = min_interval
+        self.max_pending_per_client = max_pending_per_client
+        self.concurrency = concurrency
+        self._slots = None  # created lazily on the serving loop
+        self._entries = OrderedDict()
+        self._inflight = {}        # key -> Task
+        self._started = set()      # keys whose compute is running in a thread
+        self._claimed = set()      # keys a chat request is waiting on
+        self._tab_pending = {}     # (client id, tab id) -> key of that tab's pending prefetch
+        self._client_active = {}   # client id -> number of its prefetches not yet finished
+        self._client_last = {}     # client id -> monotonic time of last accepted prefetch
+        self.stats = {"scheduled": 0, "cancelled": 0, "throttled": 0, "hits": 0, "joins": 0, "misses": 0}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, key):
+        """Returns a cached or in-flight Retrieval for the key, else None."""
+        entry = self.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            return None
+        # Keep a newer draft from cancelling the prefetch this request now needs
+        self._claimed.add(key)
+        self.stats["joins"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None  # superseded before the claim; the caller retrieves inline
+            raise
+
+    def prefetch(self, key, client_id, compute, tab_id=None):
+        """Schedules compute() (blocking, returns a Retrieval) for the key.
+
+        `client_id` is the server-derived identity all limits apply to;
+        `tab_id` (client-supplied) only scopes which older draft is replaced.
+        Returns "cached", "inflight" or "scheduled"; raises PrefetchRejected
+        when the client is too fast, has too many pending, or the queue is full.
+        """
+        if self.get(key) is not None:
+            return "cached"
+        if key in self._inflight:
+            return "inflight"
+
+        now = time.monotonic()
+        last = self._client_last.get(client_id)
+        if last is not None and now - last < self.min_interval:
+            self.stats["throttled"] += 1
+            raise PrefetchRejected("Prefetching too fast", retry_after=self.min_interval - (now - last))
+
+        tab = (client_id, tab_id or "")
+        self._cancel_pending(tab)
+        if self._client_active.get(client_id, 0) >= self.max_pending_per_client:
+            self.stats["throttled"] += 1
+            raise PrefetchRejected("Too many prefetches pending for this client")
+        if len(self._inflight) >= self.concurrency + self.max_pending:
+            self.stats["throttled"] += 1
+            raise PrefetchRejected("Prefetch queue is full")
+
+        self._client_last[client_id] = now
+        self._evict_idle_clients(now)
+        self._tab_pending[tab] = key
+        self._client_active[client_id] = self._client_active.get(client_id, 0) + 1
+        task = asyncio.create_task(self._run(key, compute))
+        # A done callback, unlike a finally block, also runs for tasks cancelled before they start
+        task.add_done_callback(lambda done: self._forget(done, key, client_id, tab))
+        self._inflight[key] = task
+        self.stats["scheduled"] += 1
+        return "scheduled"
+
+    def cancel(self, client_id, tab_id=None):
+        """Drops the tab's pending prefetch, if it hasn't started encoding."""
+        return self._cancel_pending((client_id, tab_id or ""))
+
+    def _cancel_pending(self, tab):
+        key = self._tab_pending.get(tab)
+        task = self._inflight.get(key)
+        # Once encoding has started in a thread it can't be interrupted; let it
+        # finish and fill the cache. Never cancel work a chat request joined.
+        if task is None or task.done() or key in self._started or key in self._claimed:
+            return False
+        task.cancel()
+        # Release its place now; the task itself only finishes on a later loop turn
+        self._forget(task, key, tab[0], tab)
+        self.stats["cancelled"] += 1
+        return True
+
+    async def _run(self, key, compute):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._slots:
+                self._started.add(key)
+                entry = await asyncio.to_thread(compute)
+            self.put(key, entry)
+            return entry
+        except Exception as e:
+            # Joined chat requests fall back to retrieving inline
+            print(f"⚠️ Prefetch failed: {e}")
+            return None
+
+    def _forget(self, task, key, client_id, tab):
+        # Runs twice for a cancelled task (on cancel and when it finishes); only the first counts
+        if self._inflight.get(key) is not task:
+            return
+        del self._inflight[key]
+        self._started.discard(key)
+        self._claimed.discard(key)
+        if self._tab_pending.get(tab) == key:
+            del self._tab_pending[tab]
+        remaining = self._client_active.get(client_id, 0) - 1
+        if remaining > 0:
+            self._client_active[client_id] = remaining
+        else:
+            self._client_active.pop(client_id, None)
+
+    def _evict_idle_clients(self, now):
+        if len(self._client_last) <= 4 * self.max_entries:
+            return
+        idle_after = max(self.ttl, 60.0)
+        for client_id, last in list(self._client_last.items()):
+            if now - last > idle_after:
+                del self._client_last[client_id]
@@ -1,25 +1,121 @@
+import argparse
+import os
+import sys
 import faiss
 import pickle
-from rag_pipeline import open_and_read_pdf, sentence_splitter, build_faiss_index
+from ingestion import (open_and_read_pdf, sentence_splitter, check_chunk_sizes, token_chunker, dedupe_chunks,
+                       build_faiss_index, document_sections, SRB_PDF_URL)
+from index_bundle import (BUNDLES_DIR, LEGACY_METADATA_PATH, write_bundle, activate_bundle, prune_bundles,
+                          file_sha256, active_source_sha256)
+from source_fetcher import fetch_source
+from chunk_metadata import SECTIONS_PATH, ChunkMetadata
 
 PDF_PATH = "SRB-2025.pdf"  
+MODEL_NAME = "all-mpnet-base-v2"
 INDEX_SAVE_PATH = "faiss_index.bin"
 SENTENCES_SAVE_PATH = "sentences.pkl"
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FAISS index and chunk store from the SRB PDF.")
+    parser.add_argument("--pdf", default=PDF_PATH, help="Path to the SRB PDF")
+    parser.add_argument("--fetch", action="store_true",
+                        help="Download the PDF from --url, or revalidate the local copy with a conditional request")
+    parser.add_argument("--url", default=SRB_PDF_URL, help="Where --fetch (or a missing --pdf) downloads from")
+    parser.add_argument("--sha256", default=None, help="Expected sha256 of the fetched PDF")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="Exit without rebuilding if the active bundle was built from this exact PDF")
+    parser.add_argument("--chunker", choices=["tokens", "sentences"], default="tokens",
+                        help="'tokens' packs sentences into token-bounded chunks with overlap, "
+                             "'sentences' uses the legacy fixed 5-sentence groups")
+    parser.add_argument("--max-tokens", type=int, default=256, help="Upper bound on chunk size (token chunker)")
+    parser.add_argument("--min-tokens", type=int, default=64, help="Smallest chunk kept on its own; shorter ones merge into a neighbour (token chunker)")
+    parser.add_argument("--overlap-tokens", type=int, default=32, help="Tokens shared between neighbouring chunks (token chunker)")
+    parser.add_argument("--respect-pages", action="store_true", help="Never let a chunk cross a page boundary")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Keep repeated headers, boilerplate and duplicate paragraphs as separate chunks")
+    parser.add_argument("--dedupe-threshold", type=float, default=0.85,
+                        help="Estimated Jaccard similarity of word shingles above which chunks count as duplicates")
+    parser.add_argument("--reduce-dim", type=int, default=None,
+                        help="Store embeddings at this dimension (e.g. 256 or 128) instead of the model's 768")
+    parser.add_argument("--reduction", choices=["pca", "truncate"], default="pca",
+                        help="How to reduce dimensions: learned PCA or Matryoshka-style truncation")
+    parser.add_argument("--sections", default=SECTIONS_PATH,
+                        help="JSON file mapping section names to [first_page, last_page]; overrides and extends "
+                             "the sections derived from the PDF outline or headings")
+    parser.add_argument("--bundles-dir", default=BUNDLES_DIR, help="Directory holding versioned index bundles")
+    parser.add_argument("--no-activate", action="store_true", help="Write the bundle without making it the active one")
+    # The Docker image ships these top-level files (bundles/ is not committed), so they stay on by default
+    parser.add_argument("--no-legacy", action="store_true",
+                        help=f"Don't write '{INDEX_SAVE_PATH}', '{SENTENCES_SAVE_PATH}' and '{LEGACY_METADATA_PATH}' "
+                             "(the files the Docker image serves)")
+    parser.add_argument("--legacy", action="store_true", help=argparse.SUPPRESS)  # now the default; kept for old scripts
+    args = parser.parse_args()
+    if args.chunker == "tokens":
+        try:
+            check_chunk_sizes(args.max_tokens, args.min_tokens, args.overlap_tokens)
+        except ValueError as e:
+            parser.error(str(e))
+
     print("--- Starting Pre-processing ---")
 
-    pages_and_texts = open_and_read_pdf(pdf_path=PDF_PATH)
-    sentence_chunks = sentence_splitter(pages_and_texts)
+    if args.fetch or not os.path.exists(args.pdf):
+        source_sha256 = fetch_source(args.url, args.pdf, expected_sha256=args.sha256).sha256
+    else:
+        source_sha256 = file_sha256(args.pdf)
+    if args.skip_unchanged and source_sha256 == active_source_sha256(args.bundles_dir):
+        print("✅ Source unchanged since the active bundle was built; skipping ingestion.")
+        sys.exit(0)
+
+    pages_and_texts = open_and_read_pdf(pdf_path=args.pdf)
+    if args.chunker == "tokens":
+        sentence_chunks = token_chunker(
+            pages_and_texts,
+            max_tokens=args.max_tokens,
+            min_tokens=args.min_tokens,
+            overlap_tokens=args.overlap_tokens,
+            respect_pages=args.respect_pages
+        )
+    else:
+        sentence_chunks = sentence_splitter(pages_and_texts)
+
+    dedupe_stats = None
+    if not args.no_dedupe:
+        sentence_chunks, dedupe_stats = dedupe_chunks(sentence_chunks, threshold=args.dedupe_threshold)
+
+    embedding_model, index, sentence_texts = build_faiss_index(
+        sentence_chunks, model_name=MODEL_NAME, reduce_dim=args.reduce_dim, reduction=args.reduction
+    )
+
+    chunker_settings = {"name": args.chunker}
+    if args.chunker == "tokens":
+        chunker_settings.update(max_tokens=args.max_tokens, min_tokens=args.min_tokens,
+                                overlap_tokens=args.overlap_tokens, respect_pages=args.respect_pages)
+    extra = {
+        "source": {"path": os.path.basename(args.pdf), "sha256": source_sha256},
+        "chunker": chunker_settings,
+        "reduction": {"method": args.reduction, "dim": args.reduce_dim} if args.reduce_dim else None,
+        "dedupe": dedupe_stats,
+    }
+    # Keep page spans and sections as typed arrays for filtered search
+    metadata = ChunkMetadata.from_chunks(sentence_chunks, document_sections(args.pdf, args.sections))
+    os.makedirs(args.bundles_dir, exist_ok=True)
+    bundle_path = write_bundle(index, sentence_texts, MODEL_NAME, args.bundles_dir, extra=extra, metadata=metadata)
+    print(f"Wrote index bundle '{bundle_path}'")
+    if not args.no_activate:
+        activate_bundle(bundle_path, args.bundles_dir)
+        prune_bundles(args.bundles_dir)
+        print(f"Activated bundle '{os.path.basename(bundle_path)}'")
 
-    embedding_model, index, sentence_texts = build_faiss_index(sentence_chunks)
+    if not args.no_legacy:
+        print(f"Saving FAISS index to '{INDEX_SAVE_PATH}'...")
+        faiss.write_index(index, INDEX_SAVE_PATH)
 
-    print(f"Saving FAISS index to '{INDEX_SAVE_PATH}'...")
-    faiss.write_index(index, INDEX_SAVE_PATH)
+        print(f"Saving sentence chunks to '{SENTENCES_SAVE_PATH}'...")
+        with open(SENTENCES_SAVE_PATH, "wb") as f:
+            pickle.dump(sentence_texts, f)
 
-    print(f"Saving sentence chunks to '{SENTENCES_SAVE_PATH}'...")
-    with open(SENTENCES_SAVE_PATH, "wb") as f:
-        pickle.dump(sentence_texts, f)
+        print(f"Saving chunk metadata to '{LEGACY_METADATA_PATH}'...")
+        metadata.save(LEGACY_METADATA_PATH)
 
     print("\n✅ Pre-processing complete!")
-    print(f"You can now run the main application with 'python app.py'")
\ No newline at end of file
+    print(f"You can now run the main application with 'python app.py'")
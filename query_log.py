@@ -0,0 +1,145 @@
+"""Structured query log used for cache warming and retrieval tuning.
+
+Every request through the API and Gradio entry points appends one JSON line
+with the normalized query, retrieved chunk ids and distances, the cache tier
+that served it, per-stage latencies and the answer length. Records are handed
+to a background thread that writes them in batches and rotates the file, so
+logging never touches disk on the request path.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+DEFAULT_LOG_PATH = os.getenv("QUERY_LOG_PATH", os.path.join("logs", "query_log.jsonl"))
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases and collapses whitespace so equivalent queries compare equal."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class QueryLogWriter:
+    """Batched, size-rotating JSONL writer fed through a bounded queue."""
+
+    def __init__(self, path=DEFAULT_LOG_PATH, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 batch_size=64, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, record: dict):
+        """Queues a record without blocking; records are dropped if the writer falls behind."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Flushes pending records and stops the writer thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"⚠️ Query log write failed: {e}")
+
+    def _write(self, batch):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """Shifts query_log.jsonl -> .1 -> .2 ... dropping the oldest backup."""
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_query_log():
+    """Returns the process-wide writer, or None when QUERY_LOG_ENABLED=0."""
+    global _writer
+    if os.getenv("QUERY_LOG_ENABLED", "1") == "0":
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = QueryLogWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+
+def new_trace() -> dict:
+    """Starts a trace dict to pass to answer_query / answer_query_streaming."""
+    return {"started": time.perf_counter(), "latency_ms": {}}
+
+
+def log_query(source: str, query: str, trace: dict, error: str = None):
+    """Builds a record from an answer_query trace and hands it to the writer."""
+    writer = get_query_log()
+    if writer is None:
+        return
+    latency = dict(trace.get("latency_ms", {}))
+    if "started" in trace:
+        latency["total"] = round((time.perf_counter() - trace["started"]) * 1000, 2)
+    record = {
+        "ts": round(time.time(), 3),
+        "source": source,
+        "query": normalize_query(query),
+        "chunk_ids": trace.get("chunk_ids", []),
+        "distances": trace.get("distances", []),
+        "cache": trace.get("cache", "none"),
+        "latency_ms": latency,
+        "answer_chars": trace.get("answer_chars", 0),
+    }
+    if trace.get("filter"):
+        record["filter"] = trace["filter"]
+    if "refused" in trace:
+        # Whether Gemini answered with the refusal; set only when it was called
+        record["refused"] = trace["refused"]
+    if "out_of_scope" in trace:
+        # Refused by the scope gate without calling Gemini; value is the gate's score
+        record["out_of_scope"] = trace["out_of_scope"]
+    if "followup" in trace:
+        # WebSocket follow-up: similarity to the previous question and the chunks carried over from it
+        record["followup"] = trace["followup"]
+        record["carried_chunk_ids"] = trace.get("carried_chunk_ids", [])
+    if error:
+        record["error"] = error
+    writer.log(record)
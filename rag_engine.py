@@ -0,0 +1,208 @@
+"""Shared, load-once async RAG engine for every entry point.
+
+The FastAPI servers and all Gradio front ends talk to the same RAGEngine:
+one embedding model (or embedding worker pool), one BundleManager and one
+Gemini client per process. Answers are streamed chunk by chunk from Gemini's
+async API, retrieval runs off the event loop (or was already done by a
+typing-time prefetch, see prefetch.py), and every request is traced into the
+query log. WebSocket chats pass their ChatSession so follow-ups can reuse
+earlier turns (see chat_session.py).
+"""
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+
+from index_bundle import BundleManager, BundleError
+from embedding_pool import EmbeddingPool, load_embedding_model
+from query_log import log_query, new_trace
+from prefetch import RetrievalCache, Retrieval, cache_key, filter_key
+from chat_session import SessionTurn, merge_carried
+from rag_pipeline import answer_query_streaming, retrieve, get_client
+
+MODEL_NAME = "all-mpnet-base-v2"
+# Gradio runs one event at a time per handler unless told otherwise
+GRADIO_CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "16"))
+GRADIO_MAX_QUEUE = int(os.getenv("GRADIO_MAX_QUEUE", "128"))
+
+
+class RAGEngine:
+    """Holds the loaded model, index bundle and LLM client, and answers queries."""
+
+    def __init__(self, model_name=MODEL_NAME, client=None, device=None):
+        self.model_name = model_name
+        self._client = client
+        self.device = device
+        self.embedding_model = None
+        self.bundles = BundleManager(model_name)
+        self.retrieval_cache = RetrievalCache()
+        self.loaded = False
+        self.error = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use so importing the engine stays cheap
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def load(self):
+        """Loads the embedding model and active bundle once; safe to call repeatedly."""
+        with self._load_lock:
+            if self.loaded:
+                return True
+            try:
+                self.embedding_model = load_embedding_model(self.model_name, device=self.device)
+                bundle = self.bundles.load()
+                self.loaded = True
+                self.error = None
+                print(f"✅ Assets ready (index bundle {bundle.version}).")
+            except BundleError as e:
+                print(f"⚠️ {e}")
+                self.error = str(e)
+            except Exception as e:
+                print(f"❌ Error loading assets: {e}")
+                self.error = str(e)
+            return self.loaded
+
+    async def aload(self):
+        return await asyncio.to_thread(self.load)
+
+    def close(self):
+        if isinstance(self.embedding_model, EmbeddingPool):
+            self.embedding_model.close()
+
+    def astream(self, query, top_k=5, filter_text=None, source="engine", session=None):
+        """Returns an async iterator of answer text chunks as Gemini produces them.
+
+        The bundle is pinned and the filter validated here, eagerly, so callers
+        get FilterError before they start a response and a concurrent hot-swap
+        can't mix versions within one answer. With a `session`, retrieval
+        reuses its earlier turns and the finished turn is added to it.
+        """
+        bundle = self.bundles.current
+        id_selector = bundle.selector(filter_text)
+        return self._stream(query, bundle, id_selector, top_k, filter_text, source, session)
+
+    def _retrieve(self, query, bundle, id_selector, top_k, origin, trace=None, query_vector=None):
+        sentences, distances, indices = retrieve(
+            query, self.embedding_model, bundle.index, bundle.sentences, top_k, trace, id_selector, query_vector
+        )
+        return Retrieval(sentences, distances.tolist(), indices.tolist(), origin, time.monotonic())
+
+    def _session_retrieve(self, session, query, bundle, id_selector, top_k, filter_text, trace):
+        """Retrieval for a session turn; returns (Retrieval, turn kind, query embedding)."""
+        key = filter_key(filter_text)
+        repeat = session.find_repeat(query, bundle.version, key)
+        if repeat is not None:
+            # Asked before on this connection: no encode, no search
+            trace["cache"] = "session"
+            trace["chunk_ids"] = list(repeat.chunk_ids)
+            trace["distances"] = [round(float(d), 4) for d in repeat.distances]
+            sentences = [bundle.sentences[i] for i in repeat.chunk_ids]
+            retrieved = Retrieval(sentences, list(repeat.distances), list(repeat.chunk_ids), "session", time.monotonic())
+            return retrieved, "repeat", repeat.embedding
+
+        start = time.perf_counter()
+        embedding = np.asarray(self.embedding_model.encode([query])[0], dtype=np.float32)
+        encode_ms = round((time.perf_counter() - start) * 1000, 2)
+        retrieved = self._retrieve(query, bundle, id_selector, top_k, "retrieval", trace, query_vector=embedding)
+        trace["latency_ms"]["encode"] = encode_ms
+
+        previous, similarity = session.followup_of(embedding, bundle.version, key)
+        if previous is None:
+            return retrieved, "retrieval", embedding
+        # Same topic as the last turn: keep its best chunks in the context too
+        chunk_ids, distances, carried = merge_carried(retrieved.indices, retrieved.distances, previous)
+        trace["followup"] = round(similarity, 4)
+        trace["carried_chunk_ids"] = carried
+        trace["chunk_ids"] = chunk_ids
+        trace["distances"] = [round(float(d), 4) for d in distances]
+        sentences = [bundle.sentences[i] for i in chunk_ids]
+        return Retrieval(sentences, distances, chunk_ids, "retrieval", time.monotonic()), "followup", embedding
+
+    def prefetch(self, query, client_id, top_k=5, filter_text=None, tab_id=None):
+        """Warms the retrieval cache for a draft query; see prefetch.RetrievalCache.prefetch."""
+        bundle = self.bundles.current
+        id_selector = bundle.selector(filter_text)
+        key = cache_key(query, top_k, filter_text, bundle.version)
+        return self.retrieval_cache.prefetch(
+            key, client_id, lambda: self._retrieve(query, bundle, id_selector, top_k, "prefetch"), tab_id=tab_id
+        )
+
+    async def _stream(self, query, bundle, id_selector, top_k, filter_text, source, session=None):
+        trace = new_trace()
+        trace["filter"] = filter_text
+        try:
+            key = cache_key(query, top_k, filter_text, bundle.version)
+            start = time.perf_counter()
+            if session is not None:
+                # Sessions need the query embedding, which the shared cache doesn't keep
+                retrieved, kind, embedding = await asyncio.to_thread(
+                    self._session_retrieve, session, query, bundle, id_selector, top_k, filter_text, trace
+                )
+            elif (retrieved := await self.retrieval_cache.lookup(key)) is not None:
+                trace["cache"] = retrieved.origin
+                trace["chunk_ids"] = [int(i) for i in retrieved.indices]
+                trace["distances"] = [round(float(d), 4) for d in retrieved.distances]
+                trace["latency_ms"]["cache_wait"] = round((time.perf_counter() - start) * 1000, 2)
+            else:
+                # Encode + search off the event loop so other streams keep flowing meanwhile
+                retrieved = await asyncio.to_thread(
+                    self._retrieve, query, bundle, id_selector, top_k, "retrieval", trace
+                )
+                self.retrieval_cache.put(key, retrieved)
+
+            answer = []
+            async for chunk in answer_query_streaming(
+                query=query,
+                embedding_model=self.embedding_model,
+                index=bundle.index,
+                sentences=bundle.sentences,
+                client=self.client,
+                top_k=top_k,
+                trace=trace,
+                id_selector=id_selector,
+                retrieved=(retrieved.sentences, retrieved.distances),
+                history=session.history() if session is not None else None
+            ):
+                answer.append(chunk)
+                yield chunk
+        except Exception as e:
+            log_query(source, query, trace, error=str(e))
+            raise
+        if session is not None:
+            session.add_turn(SessionTurn(query, "".join(answer), list(retrieved.indices), list(retrieved.distances),
+                                         embedding, bundle.version, filter_key(filter_text)), kind)
+        log_query(source, query, trace)
+
+    async def aanswer(self, query, top_k=5, filter_text=None, source="engine"):
+        """Full answer as one string (non-streaming callers)."""
+        stream = self.astream(query, top_k, filter_text, source)
+        return "".join([chunk async for chunk in stream])
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RAGEngine:
+    """Returns the process-wide engine (not yet loaded).
+
+    EMBEDDING_DEVICE pins the model to a device ("cpu", "cuda"); unset lets
+    SentenceTransformer pick one.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine(device=os.getenv("EMBEDDING_DEVICE") or None)
+    return _engine
+
+
+def configure_gradio_queue(demo):
+    """Lets a Gradio app serve GRADIO_CONCURRENCY chats at once, queueing up to GRADIO_MAX_QUEUE."""
+    return demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY, max_size=GRADIO_MAX_QUEUE)
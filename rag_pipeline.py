@@ -1,86 +1,51 @@
+"""Serving-time RAG pipeline: retrieval, the scope gate and Gemini generation.
+
+Kept free of ingestion dependencies (PDF, spaCy, chunking, see ingestion.py)
+so servers, workers and CLI tools import it quickly. The Gemini SDK is
+imported and the client created on first use. Names that moved to ingestion
+are still importable from here for older scripts.
+"""
 import os
-import requests
+import time
+import asyncio
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-
-# Optional dependencies for PDF processing (not needed if using preprocessed files)
-try:
-    import fitz  # PyMuPDF
-    from tqdm.auto import tqdm
-    from spacy.lang.en import English
-    PDF_PROCESSING_AVAILABLE = True
-except ImportError:
-    print("Warning: PDF processing libraries not available. Using preprocessed files only.")
-    PDF_PROCESSING_AVAILABLE = False
-
-
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-
-client = genai.Client(api_key=api_key)
-
-
-def text_formatter(text: str) -> str:
-    """Performs minor formatting on text."""
-    cleaned_text = text.replace("\n", " ").strip()
-    return cleaned_text
-
-
-def open_and_read_pdf(pdf_path: str) -> list[dict]:
-    """Reads PDF pages into a structured list of dicts."""
-    if not PDF_PROCESSING_AVAILABLE:
-        raise ImportError("PDF processing libraries not available. Use preprocessed files instead.")
-    doc = fitz.open(pdf_path)
-    pages_and_texts = []
-    for page_number, page in tqdm(enumerate(doc), total=len(doc), desc="Reading PDF"):
-        text = page.get_text()
-        text = text_formatter(text)
-        pages_and_texts.append({
-            "page_number": page_number - 3,
-            "page_char_count": len(text),
-            "page_word_count": len(text.split(" ")),
-            "page_sentence_count_raw": len(text.split(". ")),
-            "page_token_count": len(text) / 4,
-            "text": text
-        })
-    return pages_and_texts
-
-
-def sentence_splitter(pages_and_texts, chunk_size=5):
-    if not PDF_PROCESSING_AVAILABLE:
-        raise ImportError("Text processing libraries not available. Use preprocessed files instead.")
-    nlp = English()
-    nlp.add_pipe("sentencizer")
-    chunks = []
-
-    for item in tqdm(pages_and_texts, desc="Splitting into sentence chunks"):
-        doc = nlp(item["text"])
-        sents = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
-        
-        for i in range(0, len(sents), chunk_size):
-            chunk = " ".join(sents[i:i + chunk_size])
-            chunks.append({
-                "page_number": item["page_number"],
-                "sentence_chunk": chunk
-            })
-
-    return chunks
-
-
-def build_faiss_index(sentences, model_name="all-mpnet-base-v2"):
-    print(f"Loading embedding model: {model_name}")
-    model = SentenceTransformer(model_name)
-    sentence_texts = [s["sentence_chunk"] for s in sentences]
-    embeddings = model.encode(sentence_texts, convert_to_tensor=False, show_progress_bar=True)
-
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings))
-    print(f"FAISS index built with {index.ntotal} embeddings.")
-    return model, index, sentence_texts
+
+from chunk_metadata import search_params_for
+from scope_gate import get_scope_gate, is_refusal, OUT_OF_SCOPE_REPLY
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from dotenv import load_dotenv
+                from google import genai
+                load_dotenv()
+                _client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return _client
+
+
+# Ingestion names re-exported lazily for backwards compatibility
+_INGESTION_NAMES = {
+    "text_formatter", "open_and_read_pdf", "sentence_splitter", "estimate_tokens", "token_chunker",
+    "make_reduced_index", "build_faiss_index", "SRB_PDF_URL", "download_pdf", "load_models",
+    "PDF_PROCESSING_AVAILABLE",
+}
+
+
+def __getattr__(name):
+    if name == "client":
+        return get_client()
+    if name in _INGESTION_NAMES:
+        import ingestion
+        return getattr(ingestion, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate_answer(client, context_text, query):
@@ -88,6 +53,7 @@ def generate_answer(client, context_text, query):
     Give yourself room to think by extracting relevant passages from the context before answering the query.
     Don't return the thinking, only return the answer.
     Make sure your answers are as explanatory as possible.\n\nContext:\n{context_text}\n\nQuestion: {query}"""
+    from google.genai import types
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=prompt,
@@ -100,15 +66,27 @@ def generate_answer(client, context_text, query):
     return response.text
 
 
-async def generate_answer_streaming(client, context_text, query):
-    """Generate streaming answer using Gemini API"""
+def format_history(history):
+    """Earlier (question, answer) turns of a chat session as prompt text."""
+    turns = "\n".join(f"Q: {question}\nA: {answer}" for question, answer in history)
+    return f"Conversation so far:\n{turns}\n\n"
+
+
+async def generate_answer_streaming(client, context_text, query, history=None):
+    """Generate streaming answer using Gemini API
+
+    `history` is a list of earlier (question, answer) turns, so follow-ups
+    like "what about labs?" can be resolved.
+    """
+    history_text = format_history(history) if history else ""
     prompt = f"""Based on the following context items, please answer the query.
     Give yourself room to think by extracting relevant passages from the context before answering the query.
     Don't return the thinking, only return the answer.
-    Make sure your answers are as explanatory as possible.\n\nContext:\n{context_text}\n\nQuestion: {query}"""
+    Make sure your answers are as explanatory as possible.\n\n{history_text}Context:\n{context_text}\n\nQuestion: {query}"""
     
-    # Use streaming generation
-    response_stream = client.models.generate_content_stream(
+    from google.genai import types
+    # Use the async client so waiting on Gemini never blocks the event loop
+    response_stream = await client.aio.models.generate_content_stream(
         model="gemini-2.5-flash",
         contents=prompt,
         config=types.GenerateContentConfig(
@@ -118,49 +96,99 @@ async def generate_answer_streaming(client, context_text, query):
         )
     )
     
-    for chunk in response_stream:
+    async for chunk in response_stream:
         if hasattr(chunk, 'text') and chunk.text:
             yield chunk.text
 
 
-def answer_query(query, embedding_model, index, sentences, client, top_k=5):
-    query_embedding = embedding_model.encode([query])[0]
-    distances, indices = index.search(np.array([query_embedding]), top_k)
-    retrieved_sentences = [sentences[i] for i in indices[0]]
+def retrieve(query, embedding_model, index, sentences, top_k=5, trace=None, id_selector=None, query_vector=None):
+    """Encodes the query and returns the top_k chunks with their ids and distances.
+
+    If an `id_selector` (see chunk_metadata.ChunkMetadata.selector) is given,
+    only those chunks are scored. If a `trace` dict is given, retrieved ids,
+    distances and per-stage latencies are recorded into it for the query log.
+    Pass `query_vector` when the query was already encoded.
+    """
+    start = time.perf_counter()
+    query_embedding = query_vector if query_vector is not None else embedding_model.encode([query])[0]
+    encoded = time.perf_counter()
+    query_vectors = np.array([query_embedding], dtype=np.float32)
+    if id_selector is not None:
+        distances, indices = index.search(query_vectors, top_k, params=search_params_for(index, id_selector))
+    else:
+        distances, indices = index.search(query_vectors, top_k)
+    searched = time.perf_counter()
+    # A narrow filter can match fewer than top_k chunks; FAISS pads with -1
+    found = indices[0] >= 0
+    distances, indices = distances[0][found], indices[0][found]
+    retrieved_sentences = [sentences[i] for i in indices]
+
+    if trace is not None:
+        trace["chunk_ids"] = [int(i) for i in indices]
+        trace["distances"] = [round(float(d), 4) for d in distances]
+        latency = trace.setdefault("latency_ms", {})
+        latency["encode"] = round((encoded - start) * 1000, 2)
+        latency["search"] = round((searched - encoded) * 1000, 2)
+    return retrieved_sentences, distances, indices
+
+
+def out_of_scope(distances, trace=None, id_selector=None):
+    """True if the scope gate says to refuse without calling Gemini (never for filtered searches)."""
+    return id_selector is None and get_scope_gate().rejects(distances, trace)
+
+
+def answer_query(query, embedding_model, index, sentences, client, top_k=5, trace=None, id_selector=None):
+    retrieved_sentences, distances, _ = retrieve(query, embedding_model, index, sentences, top_k, trace, id_selector)
+    if out_of_scope(distances, trace, id_selector):
+        if trace is not None:
+            trace["answer_chars"] = len(OUT_OF_SCOPE_REPLY)
+        return OUT_OF_SCOPE_REPLY
 
     context_text = "\n".join(retrieved_sentences)
+    start = time.perf_counter()
     answer = generate_answer(client, context_text, query)
+    if trace is not None:
+        trace.setdefault("latency_ms", {})["generate"] = round((time.perf_counter() - start) * 1000, 2)
+        trace["answer_chars"] = len(answer or "")
+        trace["refused"] = is_refusal(answer)
     return answer
 
 
-async def answer_query_streaming(query, embedding_model, index, sentences, client, top_k=5):
-    """Streaming version of answer_query"""
-    query_embedding = embedding_model.encode([query])[0]
-    distances, indices = index.search(np.array([query_embedding]), top_k)
-    retrieved_sentences = [sentences[i] for i in indices[0]]
+async def answer_query_streaming(query, embedding_model, index, sentences, client, top_k=5, trace=None,
+                                 id_selector=None, retrieved=None, history=None):
+    """Streaming version of answer_query.
+
+    Pass `retrieved` as (sentences, distances) when retrieval already
+    happened (e.g. a prefetched result) to go straight to generation, and
+    `history` as earlier (question, answer) turns of a chat session.
+    """
+    if retrieved is None:
+        # Encode + search off the event loop so other streams keep flowing meanwhile
+        retrieved_sentences, distances, _ = await asyncio.to_thread(
+            retrieve, query, embedding_model, index, sentences, top_k, trace, id_selector
+        )
+    else:
+        retrieved_sentences, distances = retrieved
+    if out_of_scope(distances, trace, id_selector):
+        if trace is not None:
+            trace["answer_chars"] = len(OUT_OF_SCOPE_REPLY)
+        yield OUT_OF_SCOPE_REPLY
+        return
 
     context_text = "\n".join(retrieved_sentences)
     
-    async for chunk in generate_answer_streaming(client, context_text, query):
+    start = time.perf_counter()
+    answer_chars = 0
+    head = ""  # enough of the answer to recognize the refusal
+    async for chunk in generate_answer_streaming(client, context_text, query, history=history):
+        if trace is not None and answer_chars == 0:
+            trace.setdefault("latency_ms", {})["first_token"] = round((time.perf_counter() - start) * 1000, 2)
+        answer_chars += len(chunk)
+        if len(head) <= 2 * len(OUT_OF_SCOPE_REPLY):
+            head += chunk
         yield chunk
 
-
-def load_models(pdf_path="SRB-2025.pdf"):
-    if not os.path.exists(pdf_path):
-        print("Downloading SRB PDF...")
-        url = "https://engineering.nmims.edu/wp-content/uploads/2025/09/SRB-2025-1.pdf"
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(pdf_path, "wb") as f:
-                f.write(response.content)
-            print("Download complete.")
-        else:
-            print("Failed to download PDF.")
-    
-    # Process PDF
-    pages_and_texts = open_and_read_pdf(pdf_path)
-    sentences = sentence_splitter(pages_and_texts)
-    
-    # Build FAISS index
-    embedding_model, index, sentence_texts = build_faiss_index(sentences)
-    return embedding_model, index, sentence_texts, client
+    if trace is not None:
+        trace.setdefault("latency_ms", {})["generate"] = round((time.perf_counter() - start) * 1000, 2)
+        trace["answer_chars"] = answer_chars
+        trace["refused"] = answer_chars <= len(head) and is_refusal(head)
@@ -0,0 +1,209 @@
+"""Per-client rate limiting and fair scheduling for chat requests.
+
+Every chat request costs an encode and a Gemini call, so one scripted client
+could otherwise flood the server and starve everyone else. Two layers:
+
+  - RateLimiter: a token bucket per client identity. Each client may send
+    RATE_LIMIT_PER_MINUTE questions a minute on average, in bursts of up to
+    RATE_LIMIT_BURST. A bucket that has refilled is indistinguishable from a
+    new one, so idle buckets are dropped and state stays O(active clients).
+  - FairScheduler: at most CHAT_CONCURRENCY chats run at once. Waiting ones
+    are queued per client and served round-robin across clients rather than
+    first-come-first-served, so a client with a backlog gets one turn per
+    round like everybody else. Each client may have CHAT_MAX_QUEUED_PER_CLIENT
+    chats waiting, with CHAT_MAX_QUEUED in total.
+
+Rejections raise RateLimited, which the servers turn into 429 + Retry-After.
+Client identity is the peer address; behind a reverse proxy set
+RATE_LIMIT_PROXY_HOPS to the number of proxies that append to
+X-Forwarded-For, so the address the nearest trusted proxy saw is used
+instead of a client-supplied one.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "8"))
+CHAT_MAX_QUEUED_PER_CLIENT = int(os.getenv("CHAT_MAX_QUEUED_PER_CLIENT", "2"))
+CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "64"))
+
+
+class RateLimited(Exception):
+    """Raised when a request is refused; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def client_identity(request, proxy_hops=RATE_LIMIT_PROXY_HOPS) -> str:
+    """The address limits are keyed by; see RATE_LIMIT_PROXY_HOPS."""
+    if proxy_hops > 0:
+        # Only the entries our own proxies appended can be trusted; the client controls the rest
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if len(forwarded) >= proxy_hops:
+            return forwarded[-proxy_hops]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Token buckets keyed by client id; rate is tokens per second, 0 disables."""
+
+    def __init__(self, rate=RATE_LIMIT_PER_MINUTE / 60.0, burst=RATE_LIMIT_BURST, sweep_interval=60.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.sweep_interval = sweep_interval
+        self._buckets = {}  # client id -> (tokens, monotonic time of last update)
+        self._last_sweep = time.monotonic()
+        self.stats = {"allowed": 0, "limited": 0}
+
+    def acquire(self, client_id, cost=1.0):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_sweep > self.sweep_interval:
+            self._sweep(now)
+        bucket = self._buckets.get(client_id)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        if tokens < cost:
+            self.stats["limited"] += 1
+            raise RateLimited("Too many requests", retry_after=(cost - tokens) / self.rate)
+        self._buckets[client_id] = (tokens - cost, now)
+        self.stats["allowed"] += 1
+
+    def _sweep(self, now):
+        # A bucket idle long enough to refill completely is the same as no bucket
+        refill_time = self.burst / self.rate
+        for client_id, (_, updated) in list(self._buckets.items()):
+            if now - updated >= refill_time:
+                del self._buckets[client_id]
+        self._last_sweep = now
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Turn:
+    """One admitted request's place in the scheduler; `async with turn:` waits for and holds a slot."""
+
+    def __init__(self, scheduler, client_id, waiter=None):
+        self.scheduler = scheduler
+        self.client_id = client_id
+        self.waiter = waiter  # None when a slot was free on admission
+        self.released = False
+
+    async def __aenter__(self):
+        if self.waiter is not None:
+            try:
+                await self.waiter
+            except asyncio.CancelledError:
+                if self.waiter.cancelled():
+                    self.scheduler._withdraw(self.client_id, self.waiter)
+                    self.released = True
+                else:
+                    self.release()  # the slot was handed over just as we gave up
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release()
+
+
+class FairScheduler:
+    """Bounded concurrency with per-client queues served round-robin.
+
+    Lives on one event loop.
+    """
+
+    def __init__(self, concurrency=CHAT_CONCURRENCY, max_queued_per_client=CHAT_MAX_QUEUED_PER_CLIENT,
+                 max_queued=CHAT_MAX_QUEUED):
+        self.concurrency = max(concurrency, 1)
+        self.max_queued_per_client = max_queued_per_client
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self._queues = OrderedDict()  # client id -> deque of waiter futures; order is the round-robin
+        self.stats = {"admitted": 0, "waited": 0, "rejected": 0}
+
+    def check(self, client_id):
+        """Raises RateLimited if admit() would have to queue and the queue is full."""
+        if self.active < self.concurrency and not self._queues:
+            return
+        waiting = len(self._queues.get(client_id, ()))
+        if waiting >= self.max_queued_per_client or self.queued >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise RateLimited("Too many requests waiting", retry_after=1.0)
+
+    def admit(self, client_id) -> Turn:
+        self.check(client_id)
+        self.stats["admitted"] += 1
+        if self.active < self.concurrency and not self._queues:
+            self.active += 1
+            return Turn(self, client_id)
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client_id, deque()).append(waiter)
+        self.queued += 1
+        self.stats["waited"] += 1
+        return Turn(self, client_id, waiter)
+
+    def _release(self):
+        # Hand the slot straight to the next client in the ring, if anyone waits
+        while self._queues:
+            client_id, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._queues.move_to_end(client_id)
+            else:
+                del self._queues[client_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _withdraw(self, client_id, waiter):
+        waiters = self._queues.get(client_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self.queued -= 1
+        if not waiters:
+            del self._queues[client_id]
+
+    def metrics(self):
+        return {**self.stats, "active": self.active, "queued": self.queued, "waiting_clients": len(self._queues)}
+
+
+class ChatLimits:
+    """The rate limiter and scheduler a server applies to its chat endpoints."""
+
+    def __init__(self, limiter=None, scheduler=None):
+        # An empty RateLimiter is falsy (it has __len__), so test for None
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.scheduler = scheduler if scheduler is not None else FairScheduler()
+
+    def admit(self, client_id) -> Turn:
+        """Takes a token and a place in line, or raises RateLimited."""
+        # Check the queue first so a request turned away for a full queue keeps its token
+        self.scheduler.check(client_id)
+        self.limiter.acquire(client_id)
+        return self.scheduler.admit(client_id)
+
+    def metrics(self):
+        return {"clients": len(self.limiter), **self.limiter.stats, "scheduler": self.scheduler.metrics()}
+
+
+async def run_in_turn(turn, events):
+    """Re-yields an async iterator while holding the turn's slot; for streams produced in the background."""
+    async with turn:
+        async for item in events:
+            yield item
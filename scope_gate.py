@@ -0,0 +1,214 @@
+"""Out-of-scope fast path: refuse off-topic queries before calling Gemini.
+
+Retrieval already tells us how close the query is to anything in the SRB.
+all-mpnet-base-v2 embeddings are unit length, so the squared L2 distance to
+the nearest chunk is 2 - 2*cosine. A question about pizza toppings or
+"count from 1 to 10" lands far from every chunk, and the gate answers it with
+the same refusal the system prompt asks Gemini for, without a round trip.
+
+Two modes:
+  - distance: reject when the nearest chunk is farther than
+    SCOPE_DISTANCE_THRESHOLD (squared L2; 1.5 is cosine < 0.25 on
+    full-dimension embeddings). Off by default: the right value depends on
+    the bundle (a PCA-reduced index has different distances), so calibrate
+    it with benchmark_scope_gate.py --max-false-reject against the bundle
+    being served.
+  - classifier: if SCOPE_MODEL_PATH (default scope_model.npz) exists, a
+    tiny logistic regression over the top-k distance profile decides
+    instead. Train it from labelled queries:
+
+        python scope_gate.py --labels labelled_queries.jsonl
+        python scope_gate.py --from-log logs/query_log.jsonl
+
+    Labelled files hold {"query": ..., "in_scope": true|false} per line.
+    With --from-log, logged queries Gemini refused (the log's "refused"
+    flag) count as out of scope.
+
+Filtered searches bypass the gate, since a narrow filter legitimately leaves
+only distant chunks. See benchmark_scope_gate.py for false-reject rates.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+OUT_OF_SCOPE_REPLY = "I'm sorry, I can't assist with that."
+SCOPE_DISTANCE_THRESHOLD = os.getenv("SCOPE_DISTANCE_THRESHOLD", "off")
+SCOPE_MODEL_PATH = os.getenv("SCOPE_MODEL_PATH", "scope_model.npz")
+FEATURE_K = 5
+
+
+def is_refusal(answer: str) -> bool:
+    """True if a generated answer is the refusal the system prompt asks for."""
+    return (answer or "").strip().strip('"') == OUT_OF_SCOPE_REPLY
+
+
+def distance_features(distances, k=FEATURE_K) -> np.ndarray:
+    """Nearest distance, mean of the top-k and their spread, as float32 rows.
+
+    Accepts one distance list or a 2-D array (one row per query).
+    """
+    d = np.atleast_2d(np.asarray(distances, dtype=np.float32))[:, :k]
+    return np.stack([d[:, 0], d.mean(axis=1), d[:, -1] - d[:, 0]], axis=1)
+
+
+class ScopeClassifier:
+    """Logistic regression on standardized distance features; predicts P(out of scope)."""
+
+    def __init__(self, weights, bias, mean, std, threshold=0.5):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.threshold = float(threshold)
+
+    def predict_proba(self, features) -> np.ndarray:
+        z = ((np.atleast_2d(features) - self.mean) / self.std) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    @classmethod
+    def fit(cls, features, out_of_scope, l2=1e-2, lr=0.5, epochs=2000, threshold=0.5):
+        """Full-batch gradient descent with class-balanced weights; fine for a few thousand rows."""
+        x = np.asarray(features, dtype=np.float64)
+        y = np.asarray(out_of_scope, dtype=np.float64)
+        if y.min() == y.max():
+            raise ValueError("Need both in-scope and out-of-scope examples to train")
+        mean, std = x.mean(axis=0), x.std(axis=0) + 1e-6
+        x = (x - mean) / std
+        positives = y.mean()
+        sample_weight = np.where(y == 1, 0.5 / positives, 0.5 / (1 - positives))
+        w, b = np.zeros(x.shape[1]), 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+            error = (p - y) * sample_weight
+            w -= lr * (x.T @ error / len(y) + l2 * w)
+            b -= lr * error.mean()
+        return cls(w, b, mean, std, threshold)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                     threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["weights"], data["bias"], data["mean"], data["std"], data["threshold"])
+
+
+class ScopeGate:
+    """Decides from retrieval distances whether to skip generation."""
+
+    def __init__(self, distance_threshold=None, classifier=None):
+        self.distance_threshold = distance_threshold
+        self.classifier = classifier
+
+    @property
+    def enabled(self):
+        return self.classifier is not None or self.distance_threshold is not None
+
+    def rejects(self, distances, trace=None) -> bool:
+        if not self.enabled or len(distances) == 0:
+            return False
+        if self.classifier is not None:
+            score = float(self.classifier.predict_proba(distance_features(distances))[0])
+            rejected = score >= self.classifier.threshold
+        else:
+            score = float(distances[0])
+            rejected = score > self.distance_threshold
+        if trace is not None and rejected:
+            trace["out_of_scope"] = round(score, 4)
+        return rejected
+
+
+def load_scope_gate(threshold=SCOPE_DISTANCE_THRESHOLD, model_path=SCOPE_MODEL_PATH) -> ScopeGate:
+    if model_path and os.path.exists(model_path):
+        print(f"🚧 Scope gate: classifier from {model_path}")
+        return ScopeGate(classifier=ScopeClassifier.load(model_path))
+    if threshold is None or str(threshold).lower() in ("", "off", "none"):
+        return ScopeGate()
+    return ScopeGate(distance_threshold=float(threshold))
+
+
+_gate = None
+
+
+def get_scope_gate() -> ScopeGate:
+    global _gate
+    if _gate is None:
+        _gate = load_scope_gate()
+    return _gate
+
+
+def read_labelled(path):
+    """Returns (queries, out_of_scope labels) from a {"query", "in_scope"} JSONL file."""
+    queries, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            queries.append(record["query"])
+            labels.append(0 if record["in_scope"] else 1)
+    return queries, labels
+
+
+def labels_from_log(path):
+    """Labels logged queries by their "refused" flag (Gemini answered with the refusal).
+
+    Records logged before the flag existed are skipped.
+    """
+    latest = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Gate rejections and errors say nothing new about the query
+            if (record.get("error") or record.get("out_of_scope") or record.get("filter")
+                    or "refused" not in record):
+                continue
+            latest[record["query"]] = int(bool(record["refused"]))
+    return list(latest), list(latest.values())
+
+
+def query_distances(queries, embedding_model, index, k=FEATURE_K) -> np.ndarray:
+    """Top-k distances for each query against the index, one row per query."""
+    vectors = np.asarray(embedding_model.encode(queries, show_progress_bar=False), dtype=np.float32)
+    distances, _ = index.search(vectors, k)
+    return distances
+
+
+if __name__ == "__main__":
+    from embedding_pool import load_embedding_model
+    from index_bundle import load_current_bundle
+
+    parser = argparse.ArgumentParser(description="Train the out-of-scope classifier.")
+    parser.add_argument("--labels", help="JSONL of {\"query\", \"in_scope\"}")
+    parser.add_argument("--from-log", help="Query log to label by Gemini refusals")
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--threshold", type=float, default=0.5, help="P(out of scope) needed to reject")
+    parser.add_argument("--out", default=SCOPE_MODEL_PATH)
+    args = parser.parse_args()
+
+    queries, labels = [], []
+    for path, reader in ((args.labels, read_labelled), (args.from_log, labels_from_log)):
+        if path:
+            q, y = reader(path)
+            queries += q
+            labels += y
+    if not queries:
+        parser.error("Give --labels and/or --from-log")
+
+    bundle = load_current_bundle(model_name=args.model)
+    features = distance_features(query_distances(queries, load_embedding_model(args.model), bundle.index))
+    classifier = ScopeClassifier.fit(features, labels, threshold=args.threshold)
+    predicted = classifier.predict_proba(features) >= classifier.threshold
+    labels = np.array(labels, dtype=bool)
+    print(f"Trained on {len(labels)} queries ({labels.sum()} out of scope).")
+    print(f"Training false-reject rate: {(predicted & ~labels).sum() / max((~labels).sum(), 1):.1%}, "
+          f"out-of-scope caught: {(predicted & labels).sum() / max(labels.sum(), 1):.1%}")
+    classifier.save(args.out)
+    print(f"✅ Saved {args.out}")
@@ -0,0 +1,232 @@
+"""Conditional, resumable, checksummed download of the source PDF.
+
+fetch_source() streams the document to `<path>.part` in chunks, hashing as
+it goes, and renames it into place only once it is complete (and matches
+the expected sha256, if one is given). What it learned is kept next to the
+file in `<path>.meta.json`: URL, ETag, Last-Modified, sha256 and size.
+
+  - Refreshing an existing copy sends If-None-Match / If-Modified-Since, so
+    an unchanged SRB costs one 304 and a local hash check.
+  - An interrupted download resumes from the `.part` file with a Range
+    request guarded by If-Range, so a document that changed in the meantime
+    is fetched whole instead of being spliced.
+  - FetchResult.changed says whether the content differs from the copy on
+    disk before, and preprocess.py --skip-unchanged compares the sha256
+    with the active bundle's source to skip ingestion entirely.
+
+Usage:
+    python source_fetcher.py                       # refresh SRB-2025.pdf from the SRB URL
+    python source_fetcher.py --url URL --out file.pdf --sha256 HEX
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+
+FETCH_CHUNK_BYTES = 1 << 16
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "60"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+
+
+class FetchError(Exception):
+    """The download failed for good, or its checksum didn't match."""
+
+
+class _Interrupted(Exception):
+    """The body ended before Content-Length; retried by resuming."""
+
+
+@dataclass
+class FetchResult:
+    path: str
+    sha256: str
+    changed: bool        # content differs from the copy on disk before the fetch
+    status: str          # "downloaded", "resumed", "not_modified" or "cached"
+    bytes_received: int = 0
+
+
+def meta_path(path):
+    return f"{path}.meta.json"
+
+
+def part_path(path):
+    return f"{path}.part"
+
+
+def read_meta(path) -> dict:
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_meta(path, meta):
+    tmp = meta_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_path(path))
+
+
+def sha256_of(path, sha=None):
+    sha = sha or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha
+
+
+def _resume_validator(partial):
+    # If-Range needs a strong ETag; fall back to the date otherwise
+    etag = partial.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return partial.get("last_modified")
+
+
+def _expected_total(response, offset):
+    if response.status_code == 206:
+        # "bytes 1000-4999/5000"
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    # A compressed body's length says nothing about the decoded bytes we write
+    if response.headers.get("Content-Encoding") or not (length and length.isdigit()):
+        return None
+    return int(length)
+
+
+def _discard_partial(path, meta):
+    """Deletes the .part file and the resume info for it."""
+    part = part_path(path)
+    if os.path.exists(part):
+        os.remove(part)
+    meta.pop("partial", None)
+    if meta:
+        write_meta(path, meta)
+    elif os.path.exists(meta_path(path)):
+        os.remove(meta_path(path))
+
+
+def _fetch_once(http, url, path, expected_sha256, chunk_size, timeout, conditional=True):
+    meta = read_meta(path)
+    headers = {}
+    # Validators only count if they describe this URL and the file as it is on disk
+    have_copy = (conditional and os.path.exists(path) and meta.get("url") == url and meta.get("sha256")
+                 and meta.get("size") == os.path.getsize(path))
+    if have_copy:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    part = part_path(path)
+    partial = meta.get("partial") or {}
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    validator = _resume_validator(partial)
+    if offset and partial.get("url") == url and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    else:
+        offset = 0
+
+    with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304 and have_copy:
+            digest = sha256_of(path).hexdigest()
+            if digest == meta["sha256"] and (not expected_sha256 or digest == expected_sha256.lower()):
+                print(f"✅ {os.path.basename(path)} is up to date (304 Not Modified).")
+                return FetchResult(path, digest, False, "not_modified")
+            print(f"⚠️ {os.path.basename(path)} doesn't match its recorded checksum; downloading it again.")
+            return _fetch_once(http, url, path, expected_sha256, chunk_size, timeout, conditional=False)
+        resumes_at_offset = response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+        if offset and (response.status_code == 416 or (response.status_code == 206 and not resumes_at_offset)):
+            # The partial file is no use (already as long as the document, or the
+            # server answered a different range); start over from zero
+            _discard_partial(path, meta)
+            return _fetch_once(http, url, path, expected_sha256, chunk_size, timeout, conditional)
+        if response.status_code == 206 and offset:
+            status, mode = "resumed", "ab"
+            print(f"⬇️ Resuming {url} at {offset} bytes...")
+        elif response.status_code == 200:
+            # Also what a server sends when If-Range says the document changed
+            status, mode, offset = "downloaded", "wb", 0
+            print(f"⬇️ Downloading {url}...")
+        else:
+            raise FetchError(f"Fetching {url} failed with HTTP {response.status_code}")
+
+        # Remember how to resume before writing anything
+        meta["partial"] = {"url": url, "etag": response.headers.get("ETag"),
+                           "last_modified": response.headers.get("Last-Modified")}
+        write_meta(path, meta)
+        total = _expected_total(response, offset)
+        sha = sha256_of(part) if offset else hashlib.sha256()
+        received = 0
+        with open(part, mode) as f:
+            for block in response.iter_content(chunk_size):
+                f.write(block)
+                sha.update(block)
+                received += len(block)
+        if total is not None and offset + received < total:
+            raise _Interrupted(f"got {offset + received} of {total} bytes")
+
+    digest = sha.hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        _discard_partial(path, meta)
+        raise FetchError(f"Checksum mismatch for {url}: expected {expected_sha256}, got {digest}")
+
+    previous = None
+    if os.path.exists(path):
+        previous = meta.get("sha256") if meta.get("size") == os.path.getsize(path) else sha256_of(path).hexdigest()
+    os.replace(part, path)
+    write_meta(path, {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": digest,
+        "size": os.path.getsize(path),
+        "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    changed = digest != previous
+    print(f"✅ Saved {path} ({os.path.getsize(path)} bytes, {'changed' if changed else 'unchanged'}).")
+    return FetchResult(path, digest, changed, status, received)
+
+
+def fetch_source(url, path, expected_sha256=None, refresh=True, chunk_size=FETCH_CHUNK_BYTES,
+                 timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES, session=None) -> FetchResult:
+    """Makes `path` an up-to-date copy of `url`; see the module docstring.
+
+    With refresh=False an existing file is used as is, without a request.
+    Dropped connections are retried `retries` times, resuming each time.
+    """
+    if not refresh and os.path.exists(path):
+        digest = read_meta(path).get("sha256") or sha256_of(path).hexdigest()
+        return FetchResult(path, digest, False, "cached")
+
+    import requests
+    http = session or requests.Session()
+    attempt = 0
+    while True:
+        try:
+            return _fetch_once(http, url, path, expected_sha256, chunk_size, timeout)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                _Interrupted) as e:
+            attempt += 1
+            if attempt > retries:
+                raise FetchError(f"Downloading {url} failed after {retries} retries: {e}") from e
+            print(f"⚠️ Download interrupted ({e}); resuming (attempt {attempt}/{retries})...")
+            time.sleep(min(0.5 * 2 ** attempt, 10))
+
+
+if __name__ == "__main__":
+    from ingestion import SRB_PDF_URL
+
+    parser = argparse.ArgumentParser(description="Download or refresh the source PDF.")
+    parser.add_argument("--url", default=SRB_PDF_URL)
+    parser.add_argument("--out", default="SRB-2025.pdf")
+    parser.add_argument("--sha256", default=None, help="Expected sha256 of the document")
+    args = parser.parse_args()
+
+    result = fetch_source(args.url, args.out, expected_sha256=args.sha256)
+    print(json.dumps(result.__dict__, indent=2))
@@ -0,0 +1,142 @@
+"""Cache-friendly serving of the prebuilt React frontend.
+
+Assets are precompressed at build time by compress_static.py, so serving them
+is a plain file send: PrecompressedStaticFiles picks the .br or .gz sibling the
+client accepts, marks content-hashed bundles as immutable and answers
+revalidations with 304. SpaIndex keeps index.html in memory with a strong
+ETag per encoding so the SPA catch-all route doesn't re-read the file per hit.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Vite emits bundles like index-BBeTz-1C.js: name, dash, 8-char content hash
+HASHED_ASSET_RE = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Parses an Accept-Encoding header, dropping codings with q=0."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.strip().split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding.strip() and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def cache_control_for(path: str) -> str:
+    return IMMUTABLE_CACHE if HASHED_ASSET_RE.search(os.path.basename(path)) else REVALIDATE_CACHE
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves build-time .br/.gz siblings and sets cache headers."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        full_path = str(full_path)
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+        response = None
+        for encoding, suffix in ENCODINGS:
+            compressed_path = full_path + suffix
+            if encoding in accepted and os.path.isfile(compressed_path):
+                response = FileResponse(
+                    compressed_path,
+                    status_code=status_code,
+                    stat_result=os.stat(compressed_path),
+                    media_type=media_type,
+                    headers={"Content-Encoding": encoding},
+                )
+                break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+
+        response.headers["Cache-Control"] = cache_control_for(full_path)
+        response.headers["Vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, request_headers):
+            return Response(status_code=304, headers={
+                key: value for key, value in response.headers.items()
+                if key.lower() in ("etag", "cache-control", "vary", "last-modified")
+            })
+        return response
+
+
+class SpaIndex:
+    """index.html held in memory (plain, gzip and brotli) with strong ETags.
+
+    Each encoding gets its own ETag ("<sha1>", "<sha1>-gzip", "<sha1>-br"),
+    since the bytes differ; If-None-Match accepts any of them, as they all
+    decode to the same page. The file is re-read only when its mtime changes,
+    so a redeployed frontend is picked up without a restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._variants = {}
+        self._etags = {}
+
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _refresh(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with open(self.path, "rb") as f:
+            body = f.read()
+        variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if BROTLI_AVAILABLE:
+            variants["br"] = brotli.compress(body, quality=11)
+        digest = hashlib.sha1(body).hexdigest()
+        self._variants = variants
+        self._etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                       for encoding in variants}
+        self._mtime = mtime
+
+    def _encoding_for(self, request: Request) -> str:
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self._variants:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        self._refresh()
+        encoding = self._encoding_for(request)
+        headers = {"ETag": self._etags[encoding], "Cache-Control": REVALIDATE_CACHE, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if tags & set(self._etags.values()) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self._variants[encoding], media_type="text/html", headers=headers)
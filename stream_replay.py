@@ -0,0 +1,165 @@
+"""Resumable SSE streams backed by short-lived, memory-bounded replay buffers.
+
+A chat stream is produced by a background task that runs to completion on
+its own, whether or not anyone is connected, and appends numbered events to
+a ReplayBuffer. Clients read the buffer: the first connection from event 0,
+a reconnect (GET /chat/stream/{stream_id} with Last-Event-ID) from the event
+after the last one it saw, joining the live generation if it is still going.
+However often a flaky client reconnects, the question is retrieved and sent
+to Gemini once.
+
+Memory is bounded three ways: finished buffers expire after
+STREAM_REPLAY_TTL seconds, each buffer keeps at most STREAM_REPLAY_MAX_EVENT_BYTES
+of its newest events, and when all buffers together exceed
+STREAM_REPLAY_MAX_BYTES the oldest finished ones are dropped first.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+STREAM_REPLAY_TTL = float(os.getenv("STREAM_REPLAY_TTL", "120"))
+STREAM_REPLAY_MAX_BYTES = int(os.getenv("STREAM_REPLAY_MAX_BYTES", str(16 * 1024 * 1024)))
+STREAM_REPLAY_MAX_EVENT_BYTES = int(os.getenv("STREAM_REPLAY_MAX_EVENT_BYTES", str(256 * 1024)))
+
+
+class ReplayExpired(Exception):
+    """The stream is unknown, expired, or no longer holds the requested events."""
+
+
+def format_event(event_id: int, payload: dict) -> str:
+    return f"id: {event_id}\ndata: {json.dumps(payload)}\n\n"
+
+
+class ReplayBuffer:
+    """Numbered SSE events of one stream, plus a condition readers wait on."""
+
+    def __init__(self, stream_id, max_bytes=STREAM_REPLAY_MAX_EVENT_BYTES):
+        self.stream_id = stream_id
+        self.max_bytes = max_bytes
+        self.events = deque()  # (event_id, formatted SSE text)
+        self.next_id = 0
+        self.bytes = 0
+        self.done = False
+        self.finished_at = None
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def first_id(self):
+        return self.events[0][0] if self.events else self.next_id
+
+    async def append(self, payload: dict):
+        event = format_event(self.next_id, payload)
+        self.events.append((self.next_id, event))
+        self.next_id += 1
+        self.bytes += len(event)
+        # Keep the newest events; readers that fell further behind get ReplayExpired
+        while self.bytes > self.max_bytes and len(self.events) > 1:
+            self.bytes -= len(self.events.popleft()[1])
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def read(self, after_id=-1):
+        """Yields formatted events with ids > after_id, waiting for live ones until the stream ends."""
+        next_id = after_id + 1
+        while True:
+            if next_id < self.first_id:
+                raise ReplayExpired(f"Events before {self.first_id} of stream {self.stream_id} are gone")
+            # Snapshot: the producer only appends at the end or drops from the front
+            for event_id, event in list(self.events):
+                if event_id >= next_id:
+                    yield event
+                    next_id = event_id + 1
+            if self.done and next_id >= self.next_id:
+                return
+            async with self._changed:
+                if next_id >= self.next_id and not self.done:
+                    await self._changed.wait()
+
+
+class StreamRegistry:
+    """Owns the replay buffers and the producer tasks that fill them."""
+
+    def __init__(self, ttl=STREAM_REPLAY_TTL, max_bytes=STREAM_REPLAY_MAX_BYTES,
+                 max_event_bytes=STREAM_REPLAY_MAX_EVENT_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_event_bytes = max_event_bytes
+        self._buffers = OrderedDict()  # stream_id -> ReplayBuffer, oldest first
+        self.stats = {"started": 0, "resumed": 0, "expired": 0, "evicted": 0}
+
+    def start(self, events) -> ReplayBuffer:
+        """Starts draining `events` (an async iterator of payload dicts) into a new buffer."""
+        self._evict()
+        buffer = ReplayBuffer(uuid.uuid4().hex, self.max_event_bytes)
+        self._buffers[buffer.stream_id] = buffer
+        buffer.task = asyncio.create_task(self._produce(buffer, events))
+        self.stats["started"] += 1
+        return buffer
+
+    async def _produce(self, buffer, events):
+        try:
+            async for payload in events:
+                await buffer.append(payload)
+        except Exception as e:
+            await buffer.append({"error": str(e), "done": True})
+        finally:
+            await buffer.finish()
+
+    def get(self, stream_id) -> ReplayBuffer:
+        self._evict()
+        buffer = self._buffers.get(stream_id)
+        if buffer is None:
+            self.stats["expired"] += 1
+            raise ReplayExpired(f"Unknown or expired stream '{stream_id}'")
+        self.stats["resumed"] += 1
+        return buffer
+
+    def _evict(self):
+        now = time.monotonic()
+        for stream_id, buffer in list(self._buffers.items()):
+            if buffer.done and now - buffer.finished_at > self.ttl:
+                del self._buffers[stream_id]
+        total = sum(buffer.bytes for buffer in self._buffers.values())
+        for stream_id, buffer in list(self._buffers.items()):
+            if total <= self.max_bytes:
+                break
+            # Live streams are never dropped; their clients are still reading
+            if buffer.done:
+                total -= buffer.bytes
+                del self._buffers[stream_id]
+                self.stats["evicted"] += 1
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "buffers": len(self._buffers),
+            "live": sum(not buffer.done for buffer in self._buffers.values()),
+            "bytes": sum(buffer.bytes for buffer in self._buffers.values()),
+        }
+
+
+def parse_last_event_id(value) -> int:
+    """Last-Event-ID header/query value as an int; -1 (start) when absent or malformed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+async def sse_events(buffer: ReplayBuffer, after_id=-1):
+    """SSE text for a client reading `buffer` after `after_id`; ends with an error event if replay expired."""
+    try:
+        async for event in buffer.read(after_id):
+            yield event
+    except ReplayExpired as e:
+        yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
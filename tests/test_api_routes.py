@@ -0,0 +1,143 @@
+"""The shared endpoints in api_routes, served by a stand-in engine."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_routes import ChatServer, answer_over_websocket, router
+from chat_session import SessionRegistry
+from chunk_metadata import FilterError
+from prefetch import RetrievalCache
+from rate_limit import ChatLimits, FairScheduler, RateLimiter
+
+
+class StubEngine:
+    """Answers every question with the same chunks, without models or Gemini."""
+
+    def __init__(self, chunks=("Attendance must ", "be 75%.")):
+        self.chunks = chunks
+        self.bundles = SimpleNamespace(current=None, job={"state": "idle"})
+        self.retrieval_cache = RetrievalCache()
+        self.sources = []
+
+    def astream(self, query, top_k=5, filter_text=None, source="engine", session=None):
+        if filter_text == "section:nope":
+            raise FilterError("Unknown section(s) ['nope']; available: []")
+        self.sources.append(source)
+        return self._answer()
+
+    async def _answer(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def aanswer(self, query, top_k=5, filter_text=None, source="engine"):
+        return "".join([chunk async for chunk in self.astream(query, top_k, filter_text, source)])
+
+
+def make_client(paced=False, **kwargs):
+    server = ChatServer(StubEngine(), source="test", paced=paced, **kwargs)
+    server.assets_loaded = True
+    app = FastAPI()
+    app.state.chat_server = server
+    app.include_router(router)
+    return TestClient(app), server
+
+
+def sse_payloads(text):
+    return [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+@pytest.mark.parametrize("paced", [False, True])
+def test_chat_stream_and_resume(paced):
+    client, server = make_client(paced=paced)
+    response = client.post("/chat/stream", json={"message": "attendance?"})
+    assert response.status_code == 200
+    payloads = sse_payloads(response.text)
+    assert "".join(p["chunk"] for p in payloads).replace(" ", "") == "Attendancemustbe75%."
+    assert payloads[-1]["done"] is True
+    assert server.engine.sources == ["test:/chat/stream"]
+
+    stream_id = response.headers["X-Stream-Id"]
+    resumed = client.get(f"/chat/stream/{stream_id}", headers={"Last-Event-ID": str(len(payloads) - 2)})
+    assert sse_payloads(resumed.text) == payloads[-1:]
+    assert client.get("/chat/stream/unknown").status_code == 404
+
+
+def test_resume_past_trimmed_events_is_gone():
+    from stream_replay import StreamRegistry
+    client, server = make_client(streams=StreamRegistry(max_event_bytes=60))
+    server.engine.chunks = ["x" * 30] * 6
+    response = client.post("/chat/stream", json={"message": "long"})
+    stream_id = response.headers["X-Stream-Id"]
+    assert client.get(f"/chat/stream/{stream_id}", headers={"Last-Event-ID": "0"}).status_code == 410
+
+
+def test_chat_filter_errors_and_rate_limits():
+    # The 400 still costs a token: the filter is checked after admission
+    limits = ChatLimits(RateLimiter(rate=1 / 60, burst=2), FairScheduler())
+    client, _ = make_client(limits=limits)
+    assert client.post("/chat", json={"message": "q", "filter": "section:nope"}).status_code == 400
+    assert client.post("/chat", json={"message": "q"}).json()["response"] == "Attendance must be 75%."
+    limited = client.post("/chat", json={"message": "q"})
+    assert limited.status_code == 429 and int(limited.headers["Retry-After"]) > 0
+
+
+def test_websocket_answers_and_caps_connections_per_client():
+    client, server = make_client(sessions=SessionRegistry(max_per_client=1))
+    with client.websocket_connect("/ws/chat") as ws:
+        assert ws.receive_json()["type"] == "session"
+        ws.send_json({"message": "attendance?"})
+        messages = [ws.receive_json() for _ in range(3)]
+        assert [m["chunk"] for m in messages] == ["Attendance must ", "be 75%.", ""]
+        with client.websocket_connect("/ws/chat") as second:
+            with pytest.raises(Exception) as excinfo:
+                second.receive_json()
+            assert getattr(excinfo.value, "code", None) == 1013
+    assert server.limits.scheduler.active == 0
+    assert server.sessions.metrics()["connections"] == 0
+
+
+def test_websocket_turn_is_released_before_sends_finish():
+    class SlowSocket:
+        def __init__(self):
+            self.sent = []
+            self.unblock = asyncio.Event()
+
+        async def send_json(self, message):
+            await self.unblock.wait()
+            self.sent.append(message)
+
+    async def scenario():
+        server = ChatServer(StubEngine(), source="test")
+        websocket = SlowSocket()
+        answer = asyncio.create_task(answer_over_websocket(server, websocket, None, "client", {"message": "q"}))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # Generation is done while the first send still waits on the client
+        assert server.limits.scheduler.active == 0 and websocket.sent == []
+        websocket.unblock.set()
+        await answer
+        return websocket.sent
+
+    sent = asyncio.run(scenario())
+    assert [m["chunk"] for m in sent] == ["Attendance must ", "be 75%.", ""]
+
+
+def test_reindex_rejects_overlap_past_min_tokens(monkeypatch):
+    monkeypatch.setattr("api_routes.ADMIN_TOKEN", "secret")
+    client, server = make_client()
+    response = client.post("/admin/reindex", json={"min_tokens": 32, "overlap_tokens": 32},
+                           headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 400 and "min_tokens" in response.json()["detail"]
+    assert server.bundles.job == {"state": "idle"}
+
+
+def test_health_reports_the_shared_registries():
+    client, _ = make_client()
+    health = client.get("/health").json()
+    assert health["models_loaded"] is True
+    assert {"streams", "limits", "sessions"} <= set(health)
@@ -0,0 +1,45 @@
+"""Follow-up detection in chat_session and its calibration."""
+import numpy as np
+import pytest
+
+from benchmark_followup import calibrate_threshold, rates
+from chat_session import ChatSession, SessionTurn, followup_threshold
+
+
+def session_with(embedding):
+    session = ChatSession()
+    session.add_turn(SessionTurn("attendance?", "75%.", [3, 7], [0.4, 0.6],
+                                 np.asarray(embedding, dtype=np.float32), "v1", ""))
+    return session
+
+
+def test_followup_threshold_is_off_unless_set():
+    assert followup_threshold("off") is None
+    assert followup_threshold("") is None
+    assert followup_threshold(None) is None
+    assert followup_threshold("0.55") == pytest.approx(0.55)
+
+
+def test_carrying_off_still_reports_the_similarity():
+    session = session_with([1.0, 0.0])
+    previous, similarity = session.followup_of(np.array([1.0, 0.0]), "v1", "", threshold=None)
+    assert previous is None and similarity == pytest.approx(1.0)
+
+
+def test_followup_needs_the_threshold_bundle_and_filter():
+    session = session_with([1.0, 0.0])
+    question = np.array([0.8, 0.6])  # cosine 0.8
+    assert session.followup_of(question, "v1", "", threshold=0.8)[0] is session.turns[-1]
+    assert session.followup_of(question, "v1", "", threshold=0.81)[0] is None
+    assert session.followup_of(question, "v2", "", threshold=0.5)[0] is None
+    assert session.followup_of(question, "v1", "section:fees", threshold=0.5)[0] is None
+
+
+def test_calibrated_threshold_bounds_new_topic_carries():
+    similarities = np.array([0.9, 0.8, 0.7, 0.65, 0.5, 0.45, 0.3, 0.2])
+    followup = np.array([True, True, True, True, False, False, False, False])
+    threshold = calibrate_threshold(similarities, followup, 0.0)
+    assert 0.5 < threshold <= 0.65
+    assert rates(similarities >= threshold, followup) == (1.0, 0.0)
+    # One of four new-topic pairs may carry
+    assert 0.45 < calibrate_threshold(similarities, followup, 0.25) <= 0.5
@@ -0,0 +1,17 @@
+"""check_import_time.py as a test: no lazy dependency at import time, and no module-count regression."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("faiss")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_time_check_passes():
+    result = subprocess.run([sys.executable, "check_import_time.py", "--repeat", "1"],
+                            capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,75 @@
+"""Prefetch scheduling, per-client limits and tab-scoped cancellation in RetrievalCache."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from prefetch import PrefetchRejected, Retrieval, RetrievalCache
+
+
+def retrieval(name):
+    return Retrieval([name], [0.1], [0], "prefetch", time.monotonic())
+
+
+def test_prefetch_fills_the_cache_and_lookup_finds_it():
+    async def main():
+        cache = RetrievalCache(min_interval=0)
+        assert cache.prefetch("q", "1.1.1.1", lambda: retrieval("q")) == "scheduled"
+        assert cache.prefetch("q", "1.1.1.1", lambda: retrieval("q")) == "inflight"
+        entry = await cache.lookup("q")  # joins the in-flight task
+        assert entry.sentences == ["q"]
+        assert cache.prefetch("q", "1.1.1.1", lambda: retrieval("q")) == "cached"
+        assert cache.stats["joins"] == 1
+
+    asyncio.run(main())
+
+
+def test_limits_apply_per_client_address_not_per_tab():
+    async def main():
+        cache = RetrievalCache(min_interval=60)
+        cache.prefetch("a", "1.1.1.1", lambda: retrieval("a"), tab_id="tab-1")
+        with pytest.raises(PrefetchRejected) as excinfo:
+            cache.prefetch("b", "1.1.1.1", lambda: retrieval("b"), tab_id="fresh-tab")
+        assert 0 < excinfo.value.retry_after <= 60
+        cache.prefetch("b", "2.2.2.2", lambda: retrieval("b"))  # another address isn't throttled
+
+    asyncio.run(main())
+
+
+def test_newer_draft_cancels_only_its_own_tabs_pending_prefetch():
+    async def main():
+        release = threading.Event()
+        # One encode slot, held by a blocking compute, so later prefetches stay pending
+        cache = RetrievalCache(min_interval=0, concurrency=1, max_pending_per_client=5)
+        cache.prefetch("busy", "9.9.9.9", lambda: release.wait(5) and retrieval("busy"))
+        await asyncio.sleep(0.05)
+        cache.prefetch("draft 1", "1.1.1.1", lambda: retrieval("draft 1"), tab_id="tab-1")
+        cache.prefetch("other", "1.1.1.1", lambda: retrieval("other"), tab_id="tab-2")
+        cache.prefetch("draft 2", "1.1.1.1", lambda: retrieval("draft 2"), tab_id="tab-1")
+        assert "draft 1" not in cache._inflight and "other" in cache._inflight
+        assert cache._client_active["1.1.1.1"] == 2
+        assert cache.cancel("1.1.1.1", "tab-2")
+        assert not cache.cancel("1.1.1.1", "tab-2")
+        assert cache.stats["cancelled"] == 2
+        release.set()
+        assert (await cache.lookup("draft 2")).sentences == ["draft 2"]
+        assert await cache.lookup("draft 1") is None
+        assert cache._client_active == {} and cache._tab_pending == {}
+
+    asyncio.run(main())
+
+
+def test_pending_cap_per_client():
+    async def main():
+        release = threading.Event()
+        cache = RetrievalCache(min_interval=0, concurrency=1, max_pending_per_client=2)
+        cache.prefetch("busy", "9.9.9.9", lambda: release.wait(5) and retrieval("busy"))
+        cache.prefetch("a", "1.1.1.1", lambda: retrieval("a"), tab_id="1")
+        cache.prefetch("b", "1.1.1.1", lambda: retrieval("b"), tab_id="2")
+        with pytest.raises(PrefetchRejected, match="Too many prefetches pending"):
+            cache.prefetch("c", "1.1.1.1", lambda: retrieval("c"), tab_id="3")
+        release.set()
+        await cache.lookup("b")
+
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Client identity, token buckets and the round-robin chat scheduler."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limit import ChatLimits, FairScheduler, RateLimited, RateLimiter, client_identity, run_in_turn
+
+
+def request(peer="10.0.0.1", forwarded=None):
+    headers = {"x-forwarded-for": forwarded} if forwarded is not None else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=peer))
+
+
+def test_client_identity_without_proxy_hops_ignores_forwarded_for():
+    assert client_identity(request(forwarded="1.2.3.4"), proxy_hops=0) == "10.0.0.1"
+
+
+def test_client_identity_uses_the_address_the_trusted_proxy_saw():
+    # The client claims 6.6.6.6; the proxy appended the address it really came from
+    assert client_identity(request(forwarded="6.6.6.6, 203.0.113.7"), proxy_hops=1) == "203.0.113.7"
+    assert client_identity(request(forwarded="6.6.6.6, 203.0.113.7, 10.1.1.1"), proxy_hops=2) == "203.0.113.7"
+
+
+def test_client_identity_falls_back_to_the_peer_with_too_few_hops():
+    assert client_identity(request(forwarded=""), proxy_hops=1) == "10.0.0.1"
+    assert client_identity(SimpleNamespace(headers={}, client=None), proxy_hops=0) == "unknown"
+
+
+def test_token_bucket_limits_bursts_and_reports_retry_after(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("rate_limit.time.monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=0.5, burst=2)
+    limiter.acquire("a")
+    limiter.acquire("a")
+    with pytest.raises(RateLimited) as excinfo:
+        limiter.acquire("a")
+    assert excinfo.value.retry_after == pytest.approx(2.0)
+    limiter.acquire("b")  # other clients have their own bucket
+    now[0] += 2.0
+    limiter.acquire("a")
+
+
+def test_rate_zero_disables_the_limiter():
+    limiter = RateLimiter(rate=0)
+    for _ in range(100):
+        limiter.acquire("a")
+    assert len(limiter) == 0
+
+
+def test_waiting_clients_are_served_round_robin():
+    async def main():
+        scheduler = FairScheduler(concurrency=1, max_queued_per_client=5, max_queued=10)
+        order = []
+
+        async def chat(turn, name):
+            async with turn:
+                order.append(name)
+                await asyncio.sleep(0)
+
+        # "a" floods the queue before "b" and "c" ask once each
+        names = ["a1", "a2", "a3", "a4", "b1", "c1"]
+        turns = [scheduler.admit(name[0]) for name in names]
+        await asyncio.gather(*(chat(turn, name) for turn, name in zip(turns, names)))
+        assert order == ["a1", "a2", "b1", "c1", "a3", "a4"]
+        assert scheduler.metrics()["active"] == 0 and scheduler.queued == 0
+
+    asyncio.run(main())
+
+
+def test_full_queues_reject_without_taking_a_token():
+    async def main():
+        limits = ChatLimits(RateLimiter(rate=1.0, burst=5), FairScheduler(concurrency=1, max_queued_per_client=1,
+                                                                           max_queued=2))
+        limits.admit("a")
+        limits.admit("a")
+        with pytest.raises(RateLimited) as excinfo:
+            limits.admit("a")  # a's one queue place is taken
+        assert excinfo.value.retry_after == 1.0
+        limits.admit("b")
+        with pytest.raises(RateLimited):
+            limits.admit("c")  # the global queue is full
+        assert "c" not in limits.limiter._buckets
+        assert limits.scheduler.stats["rejected"] == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def main():
+        scheduler = FairScheduler(concurrency=1, max_queued_per_client=2, max_queued=10)
+        running = scheduler.admit("a")
+        await running.__aenter__()
+        queued = scheduler.admit("b")
+        waiting = asyncio.create_task(queued.__aenter__())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.queued == 0 and not scheduler._queues
+        running.release()
+        assert scheduler.active == 0
+
+    asyncio.run(main())
+
+
+def test_run_in_turn_releases_the_slot_when_the_consumer_stops():
+    async def main():
+        scheduler = FairScheduler(concurrency=1)
+
+        async def events():
+            for i in range(10):
+                yield i
+
+        stream = run_in_turn(scheduler.admit("a"), events())
+        assert await stream.__anext__() == 0
+        assert scheduler.active == 1
+        await stream.aclose()
+        assert scheduler.active == 0
+
+    asyncio.run(main())
+
+
+def test_chat_limits_keeps_a_fresh_limiter():
+    limiter = RateLimiter(rate=1.0, burst=1)
+    assert ChatLimits(limiter).limiter is limiter
@@ -0,0 +1,78 @@
+"""Section page ranges derived from the PDF, and section: filters over them."""
+import pytest
+
+from chunk_metadata import ChunkMetadata, FilterError
+from ingestion import PAGE_NUMBER_OFFSET, section_slug, sections_from_headings
+
+fitz = pytest.importorskip("fitz")
+
+
+def make_pdf(path, pages, toc=None):
+    """pages: list of (heading or None, body text) per page."""
+    doc = fitz.open()
+    for heading, body in pages:
+        page = doc.new_page()
+        y = 72
+        if heading:
+            page.insert_text((72, y), heading, fontsize=20)
+            y += 40
+        page.insert_text((72, y), body, fontsize=10)
+    if toc:
+        doc.set_toc(toc)
+    doc.save(path)
+    doc.close()
+
+
+def test_section_slug_drops_numbering():
+    assert section_slug("Chapter 5: Examination Rules") == "examination-rules"
+    assert section_slug("IV. Attendance") == "attendance"
+    assert section_slug("Civil Engineering") == "civil-engineering"
+    assert section_slug("2024") == "2024"
+
+
+def test_sections_run_to_the_next_heading():
+    sections = sections_from_headings([("Intro", 0), ("Exams", 2), ("Exams", 2), ("Fees", 5)], 8, page_offset=0)
+    assert sections == {"intro": (0, 1), "exams": (2, 2), "exams-2": (2, 4), "fees": (5, 7)}
+
+
+def test_sections_from_outline(tmp_path):
+    from ingestion import read_pdf_sections
+    pdf = str(tmp_path / "outline.pdf")
+    make_pdf(pdf, [(None, "body")] * 10,
+             toc=[[1, "Student Resource Book", 1], [2, "Attendance", 5], [2, "Examination Rules", 7]])
+    # The lone level-1 entry is the title, so the level-2 entries are the sections
+    assert read_pdf_sections(pdf) == {"attendance": (4 + PAGE_NUMBER_OFFSET, 5 + PAGE_NUMBER_OFFSET),
+                                      "examination-rules": (6 + PAGE_NUMBER_OFFSET, 9 + PAGE_NUMBER_OFFSET)}
+
+
+def test_sections_from_font_headings(tmp_path):
+    from ingestion import read_pdf_sections
+    pdf = str(tmp_path / "headings.pdf")
+    body = "Students must follow these rules at all times during the academic year."
+    make_pdf(pdf, [(None, body), ("1. Attendance", body), (None, body), ("2. Examinations", body), (None, body)])
+    assert read_pdf_sections(pdf) == {"attendance": (1 + PAGE_NUMBER_OFFSET, 2 + PAGE_NUMBER_OFFSET),
+                                      "examinations": (3 + PAGE_NUMBER_OFFSET, 4 + PAGE_NUMBER_OFFSET)}
+
+
+def test_section_filter_matches_whole_words():
+    chunks = [{"page_number": page} for page in range(6)]
+    metadata = ChunkMetadata.from_chunks(chunks, {"attendance": (0, 1), "examination-rules": (2, 3),
+                                                  "examination-fees": (4, 4), "examinations": (5, 5)})
+    assert metadata.mask("section:examination").tolist() == [False, False, True, True, True, False]
+    assert metadata.mask("section:examinations").tolist() == [False] * 5 + [True]
+    with pytest.raises(FilterError):
+        metadata.mask("section:exam")
+
+
+def test_section_filter_uses_every_occurrence(tmp_path):
+    # Chunk 0 crosses from attendance into examinations; chunk 1 was deduplicated from both sections
+    chunks = [{"page_number": 1, "page_start": 1, "page_end": 2},
+              {"page_number": 0, "occurrences": [[0, 0], [3, 3]]},
+              {"page_number": 4}]
+    metadata = ChunkMetadata.from_chunks(chunks, {"attendance": (0, 1), "examinations": (2, 3), "fees": (4, 4)})
+    assert metadata.mask("section:examinations").tolist() == [True, True, False]
+    assert metadata.mask("section:attendance").tolist() == [True, True, False]
+
+    path = str(tmp_path / "metadata.npz")
+    metadata.save(path)
+    assert ChunkMetadata.load(path).mask("section:examinations").tolist() == [True, True, False]
@@ -0,0 +1,179 @@
+"""source_fetcher against a local http.server stand-in for the SRB host."""
+import hashlib
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import source_fetcher
+from source_fetcher import FetchError, fetch_source, part_path
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SourceServer:
+    """Serves one document with ETag, If-None-Match, Range and If-Range support.
+
+    `drop_after` cuts the next response body after that many bytes;
+    `range_offset_shift` makes the next 206 start somewhere other than asked.
+    """
+
+    def __init__(self):
+        self.body = os.urandom(200_000)
+        self.etag = '"v1"'
+        self.drop_after = None
+        self.range_offset_shift = 0
+        self.on_request = None
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if server.on_request:
+                    server.on_request(len(server.requests))
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", server.etag)
+                    self.end_headers()
+                    return
+                body, start = server.body, 0
+                requested = self.headers.get("Range")
+                if requested and self.headers.get("If-Range") == server.etag:
+                    start = int(requested.split("=")[1].rstrip("-")) + server.range_offset_shift
+                    server.range_offset_shift = 0
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                payload = body[start:]
+                if server.drop_after is not None:
+                    payload, server.drop_after = payload[:server.drop_after], None
+                    self.wfile.write(payload)
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(payload)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/SRB-2025.pdf"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def change(self, size=150_000, etag='"v2"'):
+        self.body = os.urandom(size)
+        self.etag = etag
+
+
+@pytest.fixture
+def server():
+    server = SourceServer()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(source_fetcher.time, "sleep", lambda seconds: None)
+
+
+def test_resumes_after_dropped_connection(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+    server.drop_after = 80_000
+
+    result = fetch_source(server.url, path, chunk_size=4096)
+
+    assert result.status == "resumed"
+    assert result.sha256 == sha256(server.body)
+    assert open(path, "rb").read() == server.body
+    # Whole chunks written before the drop are kept; the rest is asked for with Range
+    resumed_at = int(server.requests[1]["Range"].split("=")[1].rstrip("-"))
+    assert 0 < resumed_at <= 80_000
+    assert server.requests[1]["If-Range"] == '"v1"'
+    assert not os.path.exists(part_path(path))
+
+
+def test_unchanged_source_gets_304(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+    fetch_source(server.url, path)
+
+    result = fetch_source(server.url, path)
+
+    assert result.status == "not_modified"
+    assert not result.changed
+    assert server.requests[-1]["If-None-Match"] == '"v1"'
+
+
+def test_skip_unchanged_exits_before_ingestion(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+    first = fetch_source(server.url, path)
+    bundles = tmp_path / "bundles"
+    (bundles / "v1").mkdir(parents=True)
+    (bundles / "v1" / "manifest.json").write_text(json.dumps({"source": {"sha256": first.sha256}}))
+    (bundles / "CURRENT").write_text("v1")
+
+    run = subprocess.run(
+        [sys.executable, "preprocess.py", "--pdf", path, "--fetch", "--url", server.url,
+         "--bundles-dir", str(bundles), "--skip-unchanged"],
+        cwd=REPO_ROOT, capture_output=True, text=True, timeout=120,
+    )
+
+    assert run.returncode == 0, run.stderr
+    assert "304 Not Modified" in run.stdout
+    assert "skipping ingestion" in run.stdout
+    assert sorted(os.listdir(bundles)) == ["CURRENT", "v1"]
+
+
+def test_checksum_mismatch_keeps_nothing(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+
+    with pytest.raises(FetchError, match="Checksum mismatch"):
+        fetch_source(server.url, path, expected_sha256="0" * 64)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_changed_etag_between_partial_and_resume_refetches_whole(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+    server.drop_after = 50_000
+
+    def change_before_resume(request_number):
+        if request_number == 2:
+            server.change()
+    server.on_request = change_before_resume
+
+    result = fetch_source(server.url, path, chunk_size=4096)
+
+    # If-Range no longer matches, so the server sends the new document whole
+    assert server.requests[1]["If-Range"] == '"v1"'
+    assert result.status == "downloaded"
+    assert open(path, "rb").read() == server.body
+    assert result.sha256 == sha256(server.body)
+
+
+def test_misaligned_content_range_restarts_from_zero(server, tmp_path):
+    path = str(tmp_path / "SRB-2025.pdf")
+    server.drop_after = 60_000
+    server.range_offset_shift = 1000
+
+    result = fetch_source(server.url, path, chunk_size=4096)
+
+    assert "Range" in server.requests[1]
+    assert "Range" not in server.requests[-1]
+    assert result.status == "downloaded"
+    assert open(path, "rb").read() == server.body
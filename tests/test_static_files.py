@@ -0,0 +1,38 @@
+"""The in-memory index.html served by static_files.SpaIndex."""
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from static_files import SpaIndex
+
+
+def make_client(tmp_path):
+    index = tmp_path / "index.html"
+    index.write_text("<!doctype html><div id=root></div>" * 20)
+    spa_index = SpaIndex(str(index))
+    app = FastAPI()
+
+    @app.get("/")
+    async def root(request: Request):
+        return spa_index.response(request)
+
+    return TestClient(app)
+
+
+def test_each_encoding_has_its_own_etag(tmp_path):
+    client = make_client(tmp_path)
+    plain = client.get("/", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert gzipped.text == plain.text  # decoded by the client
+
+
+def test_any_variant_etag_revalidates(tmp_path):
+    client = make_client(tmp_path)
+    plain_etag = client.get("/", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+    # A cached plain copy revalidates even though the client now gets gzip
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": plain_etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == plain_etag[:-1] + '-gzip"'
+    assert client.get("/", headers={"If-None-Match": '"stale"'}).status_code == 200
@@ -0,0 +1,98 @@
+"""Replay buffers behind resumable SSE streams."""
+import asyncio
+import json
+
+import pytest
+
+from stream_replay import ReplayExpired, StreamRegistry, parse_last_event_id, sse_events
+
+
+def payloads(events):
+    return [json.loads(event.split("data: ", 1)[1]) for event in events]
+
+
+async def answer(chunks, gate=None):
+    for chunk in chunks:
+        if gate is not None:
+            await gate.wait()
+        yield {"chunk": chunk, "done": False}
+    yield {"chunk": "", "done": True}
+
+
+def test_resume_after_last_event_id_replays_only_missed_events():
+    async def main():
+        streams = StreamRegistry()
+        buffer = streams.start(answer(["a", "b", "c"]))
+        await buffer.task
+        resumed = streams.get(buffer.stream_id)
+        events = [event async for event in resumed.read(after_id=1)]
+        assert [event.split("\n")[0] for event in events] == ["id: 2", "id: 3"]
+        assert payloads(events)[0]["chunk"] == "c"
+        assert streams.metrics()["resumed"] == 1
+
+    asyncio.run(main())
+
+
+def test_reader_joins_a_live_stream():
+    async def main():
+        gate = asyncio.Event()
+        streams = StreamRegistry()
+        buffer = streams.start(answer(["a", "b"], gate))
+        reader = asyncio.create_task(_collect(buffer.read()))
+        await asyncio.sleep(0.01)
+        assert not reader.done()  # waiting for the producer
+        gate.set()
+        assert [p["chunk"] for p in payloads(await reader)] == ["a", "b", ""]
+        assert streams.metrics()["live"] == 0
+
+    asyncio.run(main())
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_events_dropped_from_a_full_buffer_expire():
+    async def main():
+        streams = StreamRegistry(max_event_bytes=120)
+        buffer = streams.start(answer(["x" * 40] * 5))
+        await buffer.task
+        assert buffer.first_id > 0
+        with pytest.raises(ReplayExpired):
+            await _collect(buffer.read(after_id=-1))
+        # The SSE form ends with an error event instead of raising
+        assert payloads(await _collect(sse_events(buffer)))[-1]["done"] is True
+
+    asyncio.run(main())
+
+
+def test_finished_streams_expire_after_the_ttl():
+    async def main():
+        streams = StreamRegistry(ttl=0)
+        buffer = streams.start(answer(["a"]))
+        await buffer.task
+        await asyncio.sleep(0.01)
+        with pytest.raises(ReplayExpired):
+            streams.get(buffer.stream_id)
+        assert streams.metrics()["expired"] == 1
+
+    asyncio.run(main())
+
+
+def test_producer_errors_end_the_stream_with_an_error_event():
+    async def failing():
+        yield {"chunk": "a", "done": False}
+        raise RuntimeError("gemini down")
+
+    async def main():
+        buffer = StreamRegistry().start(failing())
+        await buffer.task
+        assert payloads(await _collect(buffer.read()))[-1] == {"error": "gemini down", "done": True}
+
+    asyncio.run(main())
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("7") == 7
+    assert parse_last_event_id(None) == -1
+    assert parse_last_event_id("abc") == -1
@@ -0,0 +1,47 @@
+"""Chunk sizes and page spans from ingestion.token_chunker."""
+import pytest
+
+pytest.importorskip("spacy")
+
+from ingestion import estimate_tokens, token_chunker  # noqa: E402
+
+
+def page(number, text):
+    return {"page_number": number, "page_token_count": estimate_tokens(text), "text": text}
+
+
+def long_sentence(words, word="regulation"):
+    return " ".join([word] * words) + "."
+
+
+def test_short_chunk_before_a_long_sentence_is_merged_forward():
+    # "Note this well." fits alone, but the next sentence would overflow max_tokens with it
+    pages = [page(1, "Note this well. " + long_sentence(92)), page(2, long_sentence(90, "attendance"))]
+    chunks = token_chunker(pages, max_tokens=256, min_tokens=15, overlap_tokens=0)
+    assert all(chunk["chunk_token_count"] >= 15 for chunk in chunks)
+    assert chunks[0]["sentence_chunk"].startswith("Note this well. regulation")
+
+
+def test_short_chunk_at_a_page_boundary_joins_the_previous_one():
+    pages = [page(1, long_sentence(60) + " " + long_sentence(72) + " Short tail here."),
+             page(2, long_sentence(60, "attendance"))]
+    chunks = token_chunker(pages, max_tokens=200, min_tokens=15, overlap_tokens=0, respect_pages=True)
+    assert [(chunk["page_start"], chunk["page_end"]) for chunk in chunks] == [(1, 1), (1, 1), (2, 2)]
+    assert chunks[1]["sentence_chunk"].endswith("Short tail here.")
+    assert all(chunk["chunk_token_count"] >= 15 for chunk in chunks)
+
+
+def test_merged_chunk_records_its_page_span():
+    pages = [page(1, "See below."), page(2, long_sentence(93))]
+    chunks = token_chunker(pages, max_tokens=256, min_tokens=15, overlap_tokens=0)
+    assert len(chunks) == 1
+    assert (chunks[0]["page_start"], chunks[0]["page_end"]) == (1, 2)
+
+
+def test_overlap_must_be_smaller_than_min_tokens():
+    pages = [page(1, long_sentence(60)), page(2, long_sentence(60, "attendance"))]
+    with pytest.raises(ValueError, match="min_tokens"):
+        token_chunker(pages, max_tokens=256, min_tokens=32, overlap_tokens=32)
+    with pytest.raises(ValueError, match="min_tokens"):
+        token_chunker(pages, max_tokens=256, min_tokens=0, overlap_tokens=16)
+    assert token_chunker(pages, max_tokens=256, min_tokens=0, overlap_tokens=0)